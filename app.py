@@ -1,49 +1,18 @@
 import sys
-import json
 import os
 from PyQt5.QtWidgets import (QMainWindow, QApplication, QLabel, QPushButton,
                              QVBoxLayout, QWidget, QListWidget, QListWidgetItem,
                              QLineEdit, QTextEdit, QDateEdit, QDateTimeEdit,
                              QHBoxLayout, QMessageBox, QCheckBox, QDialog,
-                             QDialogButtonBox, QFormLayout, QFileDialog)
-from PyQt5.QtCore import Qt, QDate
+                             QDialogButtonBox, QFormLayout, QFileDialog, QProgressBar)
+from PyQt5.QtCore import Qt, QDate, QFileSystemWatcher, QTimer, pyqtSignal
 from PyQt5 import QtWidgets
 
-
-class Task:
-    def __init__(self, title, description, due_date, notifications=None, subtasks=None, attachments=None,
-                 completed=False):
-        self.title = title
-        self.description = description
-        self.due_date = due_date
-        self.notifications = notifications if notifications else []
-        self.subtasks = subtasks if subtasks else []
-        self.attachments = attachments if attachments else []
-        self.completed = completed
-
-    def to_dict(self):
-        return {
-            'title': self.title,
-            'description': self.description,
-            'due_date': self.due_date.toString(Qt.ISODate),
-            'notifications': self.notifications,
-            'subtasks': self.subtasks,
-            'attachments': self.attachments,
-            'completed': self.completed
-        }
-
-    @classmethod
-    def from_dict(cls, data):
-        due_date = QDate.fromString(data['due_date'], Qt.ISODate)
-        return cls(
-            data['title'],
-            data['description'],
-            due_date,
-            data['notifications'],
-            data['subtasks'],
-            data['attachments'],
-            data['completed']
-        )
+from attachments import AttachmentImporter, AttachmentStore
+from qt_tasks import QtTask as Task
+from reminders import Reminder
+from subtasks import OPEN_PREFIX
+from task_store import open_store
 
 
 class LoginDialog(QDialog):
@@ -75,14 +44,40 @@ class LoginDialog(QDialog):
 
 
 class Window(QMainWindow):
+    # Ход и итог копирования вложений; испускаются из потока AttachmentImporter
+    attachment_progress = pyqtSignal(int, int)
+    attachment_done = pyqtSignal(int, str)
+    attachment_failed = pyqtSignal(int, str)
+
     def __init__(self, username):
         super(Window, self).__init__()
         self.current_user = username
         self.data_file = f"{username}_tasks.json"
+        self.store = open_store(self.data_file)
+
+        # Незавершённые копирования вложений: номер задания -> задача
+        self.attachment_jobs = {}
+        self.attachment_progress.connect(self.show_attachment_progress)
+        self.attachment_done.connect(self.attach_imported_file)
+        self.attachment_failed.connect(self.show_attachment_error)
+        self.attachment_importer = AttachmentImporter(
+            AttachmentStore(f"{username}_attachments"),
+            on_progress=self.attachment_progress.emit,
+            on_done=self.attachment_done.emit,
+            on_error=lambda job, e: self.attachment_failed.emit(job, str(e)))
         self.tasks = self.load_tasks()
 
         self.initUI()
 
+        # Файлы задач может изменить другой экземпляр программы (или kurs_4.py)
+        self.sync_timer = QTimer(self)
+        self.sync_timer.setSingleShot(True)
+        self.sync_timer.timeout.connect(self.sync_tasks)
+        self.store_watcher = QFileSystemWatcher(self)
+        self.store_watcher.fileChanged.connect(lambda path: self.sync_timer.start(200))
+        self.store_watcher.directoryChanged.connect(lambda path: self.sync_timer.start(200))
+        self.watch_store_files()
+
     def initUI(self):
         self.setWindowTitle(f"Task Manager - {self.current_user}")
         self.setGeometry(300, 300, 900, 700)
@@ -159,6 +154,11 @@ class Window(QMainWindow):
         self.attachments_list = QListWidget()
         self.right_layout.addWidget(self.attachments_list)
 
+        self.attachment_progress_bar = QProgressBar()
+        self.attachment_progress_bar.setRange(0, 100)
+        self.attachment_progress_bar.hide()
+        self.right_layout.addWidget(self.attachment_progress_bar)
+
         # Кнопка для добавления вложений
         self.btn_add_attachment = QPushButton("Добавить файл")
         self.btn_add_attachment.clicked.connect(self.add_attachment)
@@ -185,10 +185,9 @@ class Window(QMainWindow):
 
     def load_tasks(self):
         """Загружает задачи из файла или создаёт первую задачу при первом запуске"""
-        if os.path.exists(self.data_file):
-            with open(self.data_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return [Task.from_dict(task_data) for task_data in data]
+        data = self.store.load()
+        if data:
+            return [Task.from_dict(task_data) for task_data in data]
 
         # Если файла нет - создаём первую задачу
         first_task = Task(
@@ -199,17 +198,58 @@ class Window(QMainWindow):
             subtasks=["Подзадача 1", "Подзадача 2"]
         )
 
-        # Сохраняем в файл
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            json.dump([first_task.to_dict()], f, ensure_ascii=False, indent=2)
+        # Сохраняем в хранилище
+        self.store.save_all([first_task.to_dict()])
 
         return [first_task]
 
     def save_tasks(self):
-        """Сохраняет задачи в файл"""
-        with open(self.data_file, 'w', encoding='utf-8') as f:
-            tasks_data = [task.to_dict() for task in self.tasks]
-            json.dump(tasks_data, f, ensure_ascii=False, indent=2)
+        """Сохраняет все задачи в хранилище целиком"""
+        self.store.save_all([task.to_dict() for task in self.tasks])
+
+    def persist_task(self, task):
+        """Сохраняет изменения одной задачи"""
+        self.store.put(task.to_dict())
+        if self.store.needs_compaction():
+            # Не save_tasks(): полная запись своего списка затёрла бы
+            # изменения другого экземпляра программы
+            self.store.compact()
+
+    def watch_store_files(self):
+        """Ставит на наблюдение файлы хранилища; заменённый снимок - заново"""
+        paths = self.store.watched_paths()
+        if not paths:
+            return
+        paths = [os.path.dirname(os.path.abspath(paths[0])), *paths]
+        watched = set(self.store_watcher.files()) | set(self.store_watcher.directories())
+        missing = [path for path in paths if path not in watched and os.path.exists(path)]
+        if missing:
+            self.store_watcher.addPaths(missing)
+
+    def sync_tasks(self):
+        """Подхватывает задачи, изменённые другим экземпляром программы"""
+        self.watch_store_files()
+        try:
+            changes = self.store.sync()
+        except Exception as e:
+            QMessageBox.warning(self, "Ошибка", f"Не удалось перечитать задачи: {str(e)}")
+            return
+        if not changes:
+            return
+
+        tasks_by_id = {task.id: task for task in self.tasks}
+        for task_id, data in changes:
+            task = tasks_by_id.get(task_id)
+            if data is None:
+                if task is not None:
+                    self.tasks.remove(task)
+            elif task is None:
+                self.tasks.append(Task.from_dict(data))
+            else:
+                task.assign(Task.from_dict(data))
+        self.refresh_task_list()
+        if hasattr(self, 'current_task') and self.current_task not in self.tasks:
+            self.right_panel.setEnabled(False)
 
     def refresh_task_list(self):
         """Обновляет список задач для текущего пользователя"""
@@ -237,10 +277,9 @@ class Window(QMainWindow):
         self.due_date_edit.setDate(self.current_task.due_date)
         self.completed_checkbox.setChecked(self.current_task.completed)
 
-        # Обновляем список подзадач
+        # Обновляем список подзадач: дерево в текстовом виде, с отступами и отметками
         self.subtasks_list.clear()
-        for subtask in self.current_task.subtasks:
-            self.subtasks_list.addItem(subtask)
+        self.subtasks_list.addItems(self.current_task.subtasks.to_lines())
 
         # Обновляем список уведомлений
         self.notifications_list.clear()
@@ -262,7 +301,7 @@ class Window(QMainWindow):
         self.current_task.due_date = self.due_date_edit.date()
         self.current_task.completed = self.completed_checkbox.isChecked()
 
-        self.save_tasks()
+        self.persist_task(self.current_task)
         QMessageBox.information(self, "Сохранено", "Изменения сохранены")
         self.refresh_task_list()
 
@@ -270,7 +309,7 @@ class Window(QMainWindow):
         """Создает новую задачу"""
         new_task = Task("Новая задача", "", QDate.currentDate().addDays(1))
         self.tasks.append(new_task)
-        self.save_tasks()
+        self.persist_task(new_task)
 
         # Выбираем новую задачу в списке
         self.refresh_task_list()
@@ -288,10 +327,10 @@ class Window(QMainWindow):
 
         subtask = self.new_subtask_input.text()
         if subtask:
-            self.current_task.subtasks.append(subtask)
-            self.subtasks_list.addItem(subtask)
+            self.current_task.subtasks.add(subtask)
+            self.subtasks_list.addItem(OPEN_PREFIX + subtask)
             self.new_subtask_input.clear()
-            self.save_tasks()
+            self.persist_task(self.current_task)
 
     def add_notification(self):
         """Добавляет уведомление к текущей задаче"""
@@ -300,10 +339,10 @@ class Window(QMainWindow):
 
         notification = self.new_notification_input.text()
         if notification:
-            self.current_task.notifications.append(notification)
+            self.current_task.reminders.append(Reminder(notification))
             self.notifications_list.addItem(notification)
             self.new_notification_input.clear()
-            self.save_tasks()
+            self.persist_task(self.current_task)
 
     def add_attachment(self):
         """Добавляет вложение к текущей задаче"""
@@ -312,24 +351,38 @@ class Window(QMainWindow):
 
         file_path, _ = QFileDialog.getOpenFileName(self, "Выберите файл")
         if file_path:
-            file_name = os.path.basename(file_path)
-            self.current_task.attachments.append(file_name)
-            self.attachments_list.addItem(file_name)
-
-            # Сохраняем файл в папку с данными пользователя
-            user_data_dir = f"{self.current_user}_attachments"
-            os.makedirs(user_data_dir, exist_ok=True)
-            dest_path = os.path.join(user_data_dir, file_name)
-
-            if not os.path.exists(dest_path):
-                with open(file_path, 'rb') as src, open(dest_path, 'wb') as dst:
-                    dst.write(src.read())
+            # Файл копируется в папку с данными пользователя в фоновом потоке
+            job = self.attachment_importer.add(file_path)
+            self.attachment_jobs[job] = self.current_task
+            self.show_attachment_progress(job, 0)
+
+    def show_attachment_progress(self, job, percent):
+        """Показывает ход копирования вложений"""
+        if job in self.attachment_jobs:
+            self.attachment_progress_bar.setValue(percent)
+            self.attachment_progress_bar.show()
+
+    def attach_imported_file(self, job, path):
+        """Прикрепляет скопированный файл к задаче"""
+        task = self.attachment_jobs.pop(job, None)
+        self.attachment_progress_bar.setVisible(bool(self.attachment_jobs))
+        if task is None:
+            return
+        task.attachments.append(path)
+        if getattr(self, 'current_task', None) is task:
+            self.attachments_list.addItem(path)
+        self.persist_task(task)
 
-            self.save_tasks()
+    def show_attachment_error(self, job, message):
+        """Сообщает об ошибке копирования вложения"""
+        self.attachment_jobs.pop(job, None)
+        self.attachment_progress_bar.setVisible(bool(self.attachment_jobs))
+        QMessageBox.warning(self, "Ошибка", f"Не удалось добавить вложение: {message}")
 
     def closeEvent(self, event):
-        """Сохраняет задачи при закрытии приложения"""
-        self.save_tasks()
+        """Закрывает хранилище при закрытии приложения"""
+        self.sync_timer.stop()
+        self.store.close()
         event.accept()
 
 
@@ -0,0 +1,169 @@
+import hashlib
+import itertools
+import os
+import queue
+import threading
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: клонирование файлов недоступно, остаётся обычное копирование
+    fcntl = None
+
+# ioctl FICLONE из linux/fs.h: копия с общими блоками на Btrfs, XFS и др.
+FICLONE = 0x40049409
+CHUNK_SIZE = 1 << 20
+
+
+class AttachmentStore:
+    """Хранилище вложений пользователя с адресацией по содержимому.
+
+    Содержимое каждого файла хранится один раз в `objects/<sha256>`, сколько
+    бы задач его ни прикрепили. Для открытия файла под исходным именем рядом
+    создаётся жёсткая ссылка `<начало хэша>/<имя файла>`: файлы с одинаковым
+    именем и разным содержимым не перезаписывают друг друга.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.objects_dir = os.path.join(root, 'objects')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        # Недокопированные файлы после аварийного завершения
+        for name in os.listdir(self.tmp_dir):
+            try:
+                os.remove(os.path.join(self.tmp_dir, name))
+            except OSError:
+                pass
+
+    def import_file(self, src_path, progress=None):
+        """Копирует файл в хранилище и возвращает путь к нему под исходным именем.
+
+        Файл читается кусками по CHUNK_SIZE и одновременно хэшируется, так что
+        память не зависит от его размера. progress(скопировано, всего)
+        вызывается после каждого куска.
+        """
+        total = os.path.getsize(src_path)
+        tmp_path = os.path.join(self.tmp_dir, uuid.uuid4().hex)
+        digest = hashlib.sha256()
+        try:
+            with open(src_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                if self._reflink(src, dst):
+                    # Данные не копировались, хэш считаем по уже готовой копии
+                    self._hash(src, digest, total, progress)
+                else:
+                    self._copy(src, dst, digest, total, progress)
+                # И после клонирования: иначе сбой может оставить под верным
+                # хэшем недописанный файл
+                dst.flush()
+                os.fsync(dst.fileno())
+            object_path = self.object_path(digest.hexdigest())
+            if os.path.exists(object_path):
+                # Такое содержимое уже есть, копия не нужна
+                os.remove(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                os.replace(tmp_path, object_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return self._named_path(digest.hexdigest(), os.path.basename(src_path))
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _named_path(self, digest, name):
+        named_path = os.path.join(self.root, digest[:12], name)
+        if not os.path.exists(named_path):
+            os.makedirs(os.path.dirname(named_path), exist_ok=True)
+            try:
+                os.link(self.object_path(digest), named_path)
+            except OSError:
+                # Файловая система без жёстких ссылок: открываем сам объект
+                return self.object_path(digest)
+        return named_path
+
+    @staticmethod
+    def _reflink(src, dst):
+        if fcntl is None:
+            return False
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _hash(src, digest, total, progress):
+        done = 0
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+    @staticmethod
+    def _copy(src, dst, digest, total, progress):
+        done = 0
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            dst.write(chunk)
+            done += len(chunk)
+            if progress is not None:
+                progress(done, total)
+
+
+class AttachmentImporter:
+    """Фоновый поток, который по очереди копирует вложения в AttachmentStore.
+
+    add() возвращает номер задания сразу. Колбэки вызываются из фонового
+    потока: on_progress(номер, процент) - при смене процента, on_done(номер,
+    путь) и on_error(номер, исключение) - по завершении.
+    """
+
+    def __init__(self, store, on_progress=None, on_done=None, on_error=None):
+        self.store = store
+        self.on_progress = on_progress
+        self.on_done = on_done
+        self.on_error = on_error
+        self._jobs = queue.Queue()
+        self._ids = itertools.count(1)
+        self._thread = threading.Thread(target=self._run, name='AttachmentImporter', daemon=True)
+        self._thread.start()
+
+    def add(self, src_path):
+        job = next(self._ids)
+        self._jobs.put((job, src_path))
+        return job
+
+    def pending(self):
+        """Число ещё не завершённых заданий"""
+        return self._jobs.unfinished_tasks
+
+    def _run(self):
+        while True:
+            job, src_path = self._jobs.get()
+            try:
+                path = self.store.import_file(src_path, self._progress_reporter(job))
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(job, e)
+            else:
+                if self.on_done is not None:
+                    self.on_done(job, path)
+            finally:
+                self._jobs.task_done()
+
+    def _progress_reporter(self, job):
+        last = -1
+
+        def report(done, total):
+            nonlocal last
+            percent = done * 100 // total if total else 100
+            if percent != last and self.on_progress is not None:
+                last = percent
+                self.on_progress(job, percent)
+        return report
@@ -0,0 +1,241 @@
+"""Замеры горячих путей планировщика задач без дисплея.
+
+Пример:
+    python benchmark.py --sizes 1000 10000 --output bench.json
+    python benchmark.py --sizes 1000 10000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PyQt5.QtWidgets import QApplication
+
+import kurs_4
+
+USERNAME = 'bench'
+
+
+def make_task_data(index, subtasks, reminders, attachments, today):
+    due = today + timedelta(days=random.randint(-30, 60))
+    notifications = []
+    for _ in range(reminders):
+        # Часть напоминаний уже в прошлом, чтобы check_notifications было что показать
+        at = datetime.now() + timedelta(minutes=random.randint(-600, 60 * 24 * 30))
+        notifications.append(f"{at:%d.%m.%Y %H:%M} - Напоминание {index}")
+    return {
+        'id': f"{index:032x}",
+        'title': f"Задача {index}",
+        'description': f"Описание задачи {index}. " * 3,
+        'due_date': due.isoformat(),
+        'notifications': notifications,
+        'subtasks': [f"Подзадача {index}.{i}" for i in range(subtasks)],
+        'attachments': [f"/home/user/files/{index}/file_{i}.pdf" for i in range(attachments)],
+        'completed': index % 5 == 0,
+        'skipped': index % 7 == 0,
+        'notifications_shown': [],
+    }
+
+
+def generate_store(path, size, subtasks, reminders, attachments):
+    """Пишет синтетический `{username}_tasks.json` из size задач.
+
+    Первая задача - "тяжёлая" (по 1000 подзадач, напоминаний и вложений),
+    на ней замеряется show_task_details.
+    """
+    random.seed(size)
+    today = date.today()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('[\n')
+        heavy = make_task_data(0, 1000, 1000, 1000, today)
+        f.write(json.dumps(heavy, ensure_ascii=False))
+        for index in range(1, size):
+            f.write(',\n')
+            f.write(json.dumps(make_task_data(index, subtasks, reminders, attachments, today),
+                               ensure_ascii=False))
+        f.write('\n]\n')
+
+
+def measure(func, repeat, setup=None):
+    """Запускает func repeat раз и возвращает минимум и медиану в секундах.
+
+    setup, если задан, вызывается перед каждым запуском и в замер не входит.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {'min': min(timings), 'median': statistics.median(timings)}
+
+
+def open_window(app):
+    window = kurs_4.Window(USERNAME)
+    while window.loading:
+        window.load_more_tasks()
+    app.processEvents()
+    return window
+
+
+def load_all(window):
+    window.tasks = []
+    window.tasks_by_id = {}
+    window.search_index = kurs_4.SearchIndex()
+    window.due_index = kurs_4.DueDateIndex()
+    window.task_model.set_tasks([])
+    window.load_tasks()
+    while window.loading:
+        window.load_more_tasks()
+
+
+def bench_size(app, size, args):
+    data_file = f"{USERNAME}_tasks.json"
+    for suffix in ('.json', '.bin', '.journal', '.db', '.db-wal', '.db-shm'):
+        if os.path.exists(USERNAME + '_tasks' + suffix):
+            os.remove(USERNAME + '_tasks' + suffix)
+    generate_store(data_file, size, args.subtasks, args.reminders, args.attachments)
+
+    window = open_window(app)
+    results = {}
+
+    results['load_tasks'] = measure(lambda: load_all(window), args.repeat)
+
+    def save_tasks():
+        window.save_tasks()
+        window.store.flush()
+    results['save_tasks'] = measure(save_tasks, args.repeat)
+
+    def compact():
+        window.store.compact()
+        window.store.flush()
+    results['compact'] = measure(compact, args.repeat)
+
+    task = window.tasks[size // 2]
+
+    def persist_task():
+        task.completed = not task.completed
+        window.persist_task(task)
+        window.store.flush()
+    results['persist_task'] = measure(persist_task, args.repeat)
+
+    results['refresh_task_list'] = measure(window.refresh_task_list, args.repeat)
+
+    # Поиск перестраивает список на каждое нажатие клавиши
+    results['search'] = measure(lambda: window.search_input.setText("Задача 12"), args.repeat,
+                                lambda: window.search_input.setText(""))
+
+    heavy_index = window.task_model.index_of(window.tasks_by_id[f"{0:032x}"])
+    results['show_task_details'] = measure(
+        lambda: window.show_task_details(heavy_index), args.repeat)
+
+    def reset_notifications():
+        for task in window.tasks:
+            for reminder in task.reminders:
+                reminder.shown = False
+        window.notification_manager.tasks_added(window.tasks)
+    results['check_notifications'] = measure(
+        window.notification_manager.check_notifications, args.repeat, reset_notifications)
+
+    task_data = [task.to_dict() for task in window.tasks]
+    results['Task.from_dict'] = measure(
+        lambda: [kurs_4.Task.from_dict(data) for data in task_data], args.repeat)
+    results['Task.to_dict'] = measure(
+        lambda: [task.to_dict() for task in window.tasks], args.repeat)
+
+    window.store.close()
+    window.notification_manager.timer.stop()
+    window.tray_icon.hide()
+    window.deleteLater()
+    app.processEvents()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Печатает сравнение с прошлым прогоном; возвращает число регрессий"""
+    regressions = 0
+    for size, paths in results['results'].items():
+        old_paths = baseline.get('results', {}).get(size, {})
+        for path, timing in paths.items():
+            old = old_paths.get(path)
+            if not old:
+                continue
+            ratio = timing['min'] / old['min'] if old['min'] else float('inf')
+            mark = ''
+            if ratio > 1 + threshold:
+                mark = '  <-- регрессия'
+                regressions += 1
+            print(f"{size:>8} {path:<22} {old['min'] * 1000:10.2f} -> "
+                  f"{timing['min'] * 1000:10.2f} мс  x{ratio:.2f}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры горячих путей планировщика задач")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--subtasks', type=int, default=10)
+    parser.add_argument('--reminders', type=int, default=3)
+    parser.add_argument('--attachments', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--storage', choices=['json', 'binary', 'sqlite'], default='json',
+                        help="формат хранилища; задачи переносятся в него из JSON")
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="JSON прошлого прогона для сравнения")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="допустимое замедление, доля (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    os.environ['TASK_STORAGE'] = args.storage
+    app = QApplication(sys.argv[:1])
+    results = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'storage': args.storage,
+            'subtasks': args.subtasks,
+            'reminders': args.reminders,
+            'attachments': args.attachments,
+        },
+        'results': {},
+    }
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            for size in args.sizes:
+                print(f"{size} задач...", flush=True)
+                results['results'][str(size)] = bench_size(app, size, args)
+                for path, timing in results['results'][str(size)].items():
+                    print(f"    {path:<22} {timing['min'] * 1000:10.2f} мс")
+        finally:
+            os.chdir(cwd)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"Результаты записаны в {output}")
+
+    if baseline is not None and compare(results, baseline, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
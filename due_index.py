@@ -0,0 +1,109 @@
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from operator import itemgetter
+
+from task_model import Occurrence
+
+
+class DueDateIndex:
+    """Задачи, упорядоченные по сроку, для выборок по диапазону дат.
+
+    Сроки хранятся числами дней в отсортированном списке, рядом - задачи в
+    том же порядке, поэтому "просроченные", "на сегодня" и "на неделе" -
+    это срезы между двумя двоичными поисками. Задачи с одинаковым сроком
+    идут в порядке добавления. Задачи, добавленные пачкой при загрузке,
+    досортировываются один раз при следующей выборке.
+
+    Повторяющаяся задача стоит в индексе одним элементом - на сроке
+    ближайшего повторения; остальные повторения в нужном окне дат
+    перебираются лениво (см. occurrences).
+    """
+
+    def __init__(self):
+        self._days = []
+        self._tasks = []
+        self._pending = []
+        self._indexed = {}
+        self._recurring = {}
+
+    def __len__(self):
+        return len(self._indexed)
+
+    def add_tasks(self, tasks):
+        """Добавляет пачку новых задач без сортировки на каждую вставку"""
+        for task in tasks:
+            self._indexed[task] = task.due_day
+            self._pending.append((task.due_day, task))
+            if task.recurrence is not None:
+                self._recurring[task.id] = task
+
+    def update(self, task):
+        """Добавляет задачу или переносит её на новый срок"""
+        if task.recurrence is not None:
+            self._recurring[task.id] = task
+        else:
+            self._recurring.pop(task.id, None)
+        day = self._indexed.get(task)
+        if day == task.due_day:
+            return
+        self._flush()
+        if day is not None:
+            self._remove_at(task, day)
+        position = bisect_right(self._days, task.due_day)
+        self._days.insert(position, task.due_day)
+        self._tasks.insert(position, task)
+        self._indexed[task] = task.due_day
+
+    def remove(self, task):
+        self._recurring.pop(task.id, None)
+        day = self._indexed.pop(task, None)
+        if day is not None:
+            self._flush()
+            self._remove_at(task, day)
+
+    def between(self, start=None, end=None):
+        """Задачи со сроком в [start, end); None - без границы с этой стороны"""
+        self._flush()
+        low = 0 if start is None else bisect_left(self._days, start)
+        high = len(self._days) if end is None else bisect_left(self._days, end, low)
+        return self._tasks[low:high]
+
+    def occurrences(self, start, end):
+        """Следующие повторения повторяющихся задач в [start, end) по порядку сроков.
+
+        Текущее повторение задачи - она сама и выбирается between();
+        здесь только повторения после него. Перебор ленивый: правила
+        раскрываются ровно до end и ничего не хранится.
+        """
+        series = []
+        for task in self._recurring.values():
+            if task.completed or task.skipped:
+                continue
+            days = task.recurrence.occurrences(max(start, task.due_day + 1))
+            series.append(self._occurrences_until(task, days, end))
+        return merge(*series, key=lambda occurrence: occurrence.due_day)
+
+    @staticmethod
+    def _occurrences_until(task, days, end):
+        for day in days:
+            if day >= end:
+                return
+            yield Occurrence(task, day)
+
+    def _remove_at(self, task, day):
+        position = bisect_left(self._days, day)
+        while self._tasks[position] is not task:
+            position += 1
+        del self._days[position]
+        del self._tasks[position]
+
+    def _flush(self):
+        if not self._pending:
+            return
+        entries = list(zip(self._days, self._tasks))
+        entries.extend(self._pending)
+        # Сортировка устойчива: среди равных сроков сохраняется порядок добавления
+        entries.sort(key=itemgetter(0))
+        self._days = [day for day, _ in entries]
+        self._tasks = [task for _, task in entries]
+        self._pending = []
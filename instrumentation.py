@@ -0,0 +1,127 @@
+import inspect
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+
+# Верхние границы корзин гистограммы задержек, миллисекунды
+BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class CallStats:
+    """Число вызовов, гистограмма задержек и записанные байты одной операции"""
+    __slots__ = ('count', 'total', 'max', 'bytes', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, seconds, size):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.bytes += size
+        self.buckets[bisect_left(BUCKETS_MS, seconds * 1000)] += 1
+
+    def percentile(self, fraction):
+        """Верхняя граница корзины, в которую попадает доля fraction вызовов (мс)"""
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {'count': self.count, 'total_ms': round(self.total * 1000, 3),
+                'max_ms': round(self.max * 1000, 3), 'bytes': self.bytes,
+                'buckets_ms': list(BUCKETS_MS), 'histogram': self.buckets}
+
+
+class Instrumentation:
+    """Замеры горячих путей: счётчики, гистограммы и файл трассировки.
+
+    Каждый вызов пишется строкой JSON в trace_path; файл ротируется по
+    размеру, как журналы logging. Вызовы дольше slow_ms и зависания цикла
+    событий запоминаются для отладочной панели окна. Записи приходят и из
+    фоновых потоков, поэтому состояние защищено блокировкой.
+    """
+
+    def __init__(self, trace_path=None, slow_ms=50, max_bytes=5 << 20, backups=3):
+        self.slow_ms = slow_ms
+        self.stats = {}
+        self.slow_calls = deque(maxlen=20)
+        self.stalls = deque(maxlen=20)
+        self._lock = threading.Lock()
+        self._handler = None
+        if trace_path:
+            self._handler = RotatingFileHandler(trace_path, maxBytes=max_bytes,
+                                                backupCount=backups, encoding='utf-8')
+            self._handler.setFormatter(logging.Formatter('%(message)s'))
+
+    def wrap(self, name, func):
+        """Оборачивает функцию замером времени под именем name"""
+        # Qt передаёт слоту все аргументы сигнала, а исходная функция может
+        # принимать меньше: лишние отбрасываются, как это делает сам PyQt
+        parameters = inspect.signature(func).parameters.values()
+        if any(p.kind == p.VAR_POSITIONAL for p in parameters):
+            limit = None
+        else:
+            limit = sum(p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD) for p in parameters)
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args[:limit], **kwargs)
+            finally:
+                self.record(name, time.perf_counter() - started)
+        return timed
+
+    def record(self, name, seconds, size=0):
+        """Учитывает один вызов; size - записанные им байты"""
+        with self._lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = self.stats[name] = CallStats()
+            stats.add(seconds, size)
+            if seconds * 1000 >= self.slow_ms:
+                self.slow_calls.append((time.time(), name, seconds))
+        self._write({'type': 'call', 'name': name, 'at': round(time.time(), 3),
+                     'ms': round(seconds * 1000, 3), 'bytes': size})
+
+    def record_stall(self, seconds):
+        """Учитывает время, на которое цикл событий не успел обработать таймер"""
+        with self._lock:
+            self.stalls.append((time.time(), seconds))
+        self._write({'type': 'stall', 'at': round(time.time(), 3), 'ms': round(seconds * 1000, 3)})
+
+    def snapshot(self):
+        """Копии накопленных данных для отображения: (статистика, медленные вызовы, зависания)"""
+        with self._lock:
+            stats = {name: (s.count, s.total, s.max, s.bytes, s.percentile(0.95))
+                     for name, s in self.stats.items()}
+            return stats, list(self.slow_calls), list(self.stalls)
+
+    def close(self):
+        """Дописывает в трассировку итоговые гистограммы и закрывает файл"""
+        with self._lock:
+            summary = {name: stats.to_dict() for name, stats in self.stats.items()}
+        self._write({'type': 'summary', 'at': round(time.time(), 3), 'stats': summary})
+        if self._handler is not None:
+            self._handler.close()
+            self._handler = None
+
+    def _write(self, entry):
+        handler = self._handler
+        if handler is not None:
+            handler.handle(logging.makeLogRecord(
+                {'msg': json.dumps(entry, ensure_ascii=False), 'levelno': logging.INFO}))
@@ -1,97 +1,178 @@
+import time
+
+# Начало импорта - для режима --profile-startup
+_IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import sys
 import os
-import json
-from PyQt5.QtWidgets import (QMainWindow, QApplication, QLabel, QPushButton,
-                             QVBoxLayout, QWidget, QListWidget, QListWidgetItem,
+from datetime import date
+from heapq import merge
+from PyQt5.QtWidgets import (QMainWindow, QApplication, QLabel, QPushButton, QShortcut,
+                             QVBoxLayout, QWidget,
                              QLineEdit, QTextEdit, QDateEdit, QDateTimeEdit,
                              QHBoxLayout, QMessageBox, QCheckBox, QDialog,
                              QDialogButtonBox, QFormLayout, QFileDialog, QTimeEdit,
-                             QMenuBar, QMenu, QAction, QSystemTrayIcon)
-from PyQt5.QtCore import Qt, QDate, QDateTime, QUrl, QFileInfo, QTimer, QTime
-from PyQt5.QtGui import QColor, QPalette, QFont, QDesktopServices, QIcon, QPixmap
+                             QMenuBar, QMenu, QAction, QSystemTrayIcon, QComboBox, QListView,
+                             QProgressBar, QInputDialog, QTreeView)
+from PyQt5.QtCore import (Qt, QDate, QDateTime, QUrl, QTimer, QTime, QSize, pyqtSignal,
+                          QAbstractListModel, QAbstractItemModel, QModelIndex, QObject, QEvent,
+                          QFileSystemWatcher)
+from PyQt5.QtGui import QColor, QPalette, QFont, QDesktopServices, QIcon, QPixmap, QBrush, QKeySequence
 from PyQt5 import QtWidgets
 
+_QT_IMPORTED = time.perf_counter()
 
-class Task:
-    def __init__(self, title, description, due_date, notifications=None, subtasks=None, attachments=None,
-                 completed=False, skipped=False):
-        self.title = title
-        self.description = description
-        self.due_date = due_date
-        self.notifications = notifications if notifications else []
-        self.subtasks = subtasks if subtasks else []
-        self.attachments = attachments if attachments else []
-        self.completed = completed
-        self.skipped = skipped
-        self.notification_shown = False
-
-    def to_dict(self):
-        return {
-            'title': self.title,
-            'description': self.description,
-            'due_date': self.due_date.toString(Qt.ISODate),
-            'notifications': self.notifications,
-            'subtasks': self.subtasks,
-            'attachments': self.attachments,
-            'completed': self.completed,
-            'skipped': self.skipped,
-            'notification_shown': self.notification_shown
-        }
+from attachments import AttachmentImporter, AttachmentStore
+from due_index import DueDateIndex
+from instrumentation import Instrumentation
+from qt_tasks import QtTask as Task
+from reminders import Reminder, ReminderScheduler
+from search import SearchIndex
+from startup_profile import StartupProfile
+from subtasks import SubtaskTree
+from recurrence import COMPLETED, SKIPPED, parse_rule
+from task_model import EPOCH_ORDINAL, Occurrence, today_epoch_day
+from task_store import BufferedTaskStore, RemoteTaskStore, open_store
+from thumbnails import IMAGE_EXTENSIONS, ThumbnailCache
+from undo import UndoHistory
 
-    @classmethod
-    def from_dict(cls, data):
-        due_date = QDate.fromString(data['due_date'], Qt.ISODate)
-        task = cls(
-            data['title'],
-            data['description'],
-            due_date,
-            data.get('notifications', []),
-            data.get('subtasks', []),
-            data.get('attachments', []),
-            data.get('completed', False),
-            data.get('skipped', False)
-        )
-        task.notification_shown = data.get('notification_shown', False)
-        return task
+_IMPORTED = time.perf_counter()
 
 
 class NotificationManager:
+    """Показывает напоминания задач в срок.
+
+    Какие напоминания ждут показа, решает ReminderScheduler, а одноразовый
+    таймер взведён на ближайшее из них, поэтому между напоминаниями ничего
+    не проверяется. Все напоминания, сработавшие к проверке, - например,
+    сотни пропущенных за время сна компьютера - показываются одной сводкой
+    без модальных окон и записываются в хранилище одной пачкой. Окно
+    сообщает об изменениях задач через task_changed и task_removed.
+    """
+    # Таймер не взводится дальше этого срока, чтобы после сна системы или
+    # перевода часов напоминание не опоздало надолго
+    MAX_WAIT_MS = 5 * 60 * 1000
+    # Сколько напоминаний перечисляется в сводке, остальные - одной строкой
+    DIGEST_LINES = 10
+    # Сколько сводка видна в области уведомлений трея
+    TRAY_MESSAGE_MS = 15000
+
     def __init__(self, window):
         self.window = window
+        # Окно может заменить словарь задач целиком, поэтому он берётся при каждом обращении
+        self.scheduler = ReminderScheduler(lambda task_id: window.tasks_by_id.get(task_id))
+        self.toast = None
+
         self.timer = QTimer()
-        self.timer.timeout.connect(self.check_notifications)
-        self.timer.start(60000)  # Проверка каждую минуту
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(window.instrumented('check_notifications', self.check_notifications))
+
+        self.tasks_added(window.tasks)
+
+    def tasks_added(self, tasks):
+        self.scheduler.tasks_added(tasks)
+        self.arm_timer()
+
+    def task_changed(self, task):
+        """Перепланирует напоминания задачи после изменения её статуса или уведомлений"""
+        self.scheduler.task_changed(task)
+        self.arm_timer()
+
+    def notification_added(self, task, reminder):
+        if self.scheduler.notification_added(task, reminder):
+            self.arm_timer()
+
+    def task_removed(self, task):
+        self.scheduler.task_removed(task)
+        self.arm_timer()
+
+    def arm_timer(self):
+        """Взводит таймер на ближайшее напоминание"""
+        next_time = self.scheduler.next_time()
+        if next_time is None:
+            self.timer.stop()
+            return
+        delay_ms = max(0, int((next_time - time.time()) * 1000))
+        self.timer.start(min(delay_ms, self.MAX_WAIT_MS))
 
     def check_notifications(self):
-        now = QDateTime.currentDateTime()
+        due = self.scheduler.pop_due(time.time())
+        if due:
+            for _, reminder in due:
+                reminder.shown = True
+            # Одна запись на все задачи пачки, даже если напоминаний сотни
+            tasks = list({task.id: task for task, _ in due}.values())
+            self.window.reminders_shown(tasks)
+            try:
+                self.deliver(due)
+            except Exception as e:
+                print(f"Ошибка показа напоминаний: {e}")
+        self.arm_timer()
+
+    def deliver(self, due):
+        """Показывает сводку сработавших напоминаний: пары (задача, Reminder)"""
+        lines = [f"{task.title}: {reminder.raw}" for task, reminder in due[:self.DIGEST_LINES]]
+        if len(due) > self.DIGEST_LINES:
+            lines.append(f"… и ещё {len(due) - self.DIGEST_LINES}")
+        title = "Напоминание о задаче" if len(due) == 1 else f"Напоминания о задачах: {len(due)}"
+
+        window = self.window
+        tray_icon = getattr(window, 'tray_icon', None)
+        if (not window.isVisible() or window.isMinimized()) and tray_icon is not None \
+                and tray_icon.isVisible() and QSystemTrayIcon.supportsMessages():
+            # Окно свёрнуто в трей: сводка - всплывающее сообщение значка
+            tray_icon.showMessage(title, '\n'.join(lines), QSystemTrayIcon.Information, self.TRAY_MESSAGE_MS)
+            return
+        if self.toast is None:
+            self.toast = ReminderToast(window)
+        self.toast.add(title, lines)
 
-        for task in self.window.tasks:
-            if task.completed or task.skipped or task.notification_shown:
-                continue
 
-            for notification in task.notifications:
-                try:
-                    parts = notification.split()
-                    if len(parts) >= 2:
-                        date_str = ' '.join(parts[:2])
-                        notify_time = QDateTime.fromString(date_str, "dd.MM.yyyy HH:mm")
-
-                        if notify_time.isValid() and now >= notify_time:
-                            self.show_notification(task, notification)
-                            task.notification_shown = True
-                            self.window.save_tasks()
-                except Exception as e:
-                    print(f"Ошибка обработки уведомления: {e}")
-
-    def show_notification(self, task, notification_text):
-        msg = QMessageBox(self.window)
-        msg.setIcon(QMessageBox.Information)
-        msg.setWindowTitle("Напоминание о задаче")
-        msg.setText(f"Задача: {task.title}\n"
-                    f"Срок: {task.due_date.toString('dd.MM.yyyy')}\n"
-                    f"Напоминание: {notification_text}")
-        msg.setStandardButtons(QMessageBox.Ok)
-        msg.exec_()
+class ReminderToast(QLabel):
+    """Немодальная сводка напоминаний в углу окна.
+
+    Новая пачка напоминаний, пришедшая, пока сводка видна, дописывается в
+    неё же, а не открывает ещё одно окно. Сводка скрывается по щелчку или
+    через HIDE_MS после последнего обновления.
+    """
+    HIDE_MS = 20000
+    MAX_LINES = 20
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setTextFormat(Qt.PlainText)
+        self.setWordWrap(True)
+        self.setFixedWidth(360)
+        self.setStyleSheet("""
+            background-color: #1e3a8a;
+            color: white;
+            font-size: 13px;
+            padding: 10px;
+            border-radius: 6px;
+        """)
+        self.setCursor(Qt.PointingHandCursor)
+        self.lines = []
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.hide)
+        self.hide()
+
+    def add(self, title, lines):
+        if not self.isVisible():
+            self.lines = []
+        self.lines = ([title, *lines, ""] + self.lines)[:self.MAX_LINES]
+        self.setText('\n'.join(self.lines).rstrip())
+        self.adjustSize()
+        window = self.parentWidget()
+        self.move(max(0, window.width() - self.width() - 10), max(0, window.height() - self.height() - 10))
+        self.show()
+        self.raise_()
+        self.timer.start(self.HIDE_MS)
+
+    def mousePressEvent(self, event):
+        self.timer.stop()
+        self.hide()
 
 
 class LoginDialog(QDialog):
@@ -195,45 +276,561 @@ class LoginDialog(QDialog):
         QApplication.quit()
 
 
-class AttachmentItem(QListWidgetItem):
-    def __init__(self, file_path, parent=None):
+class DetailListModel(QAbstractListModel):
+    """Модель списка в панели деталей: подзадачи, напоминания, вложения.
+
+    Модель не копирует элементы, а показывает сам список задачи, поэтому
+    смена задачи - один сброс модели, а не добавление строк по одной.
+    Строки отдаются представлению порциями по FETCH_BATCH через
+    canFetchMore/fetchMore: у задачи с тысячами элементов сразу создаются
+    только первые, остальные - по мере прокрутки.
+    """
+    FETCH_BATCH = 200
+
+    def __init__(self, display=str, parent=None):
         super().__init__(parent)
-        self.file_path = file_path
-        file_info = QFileInfo(file_path)
-        self.setText(file_info.fileName())
-        self.setToolTip(file_path)
+        self.display = display
+        self._items = []
+        self._loaded = 0
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._loaded
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._items):
+            return None
+        if role == Qt.DisplayRole:
+            return self.display(self._items[index.row()])
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self._loaded < len(self._items)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.FETCH_BATCH, len(self._items) - self._loaded)
+        if parent.isValid() or count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self._loaded, self._loaded + count - 1)
+        self._loaded += count
+        self.endInsertRows()
+
+    def set_items(self, items):
+        """Показывает список items - список самой задачи, а не его копию"""
+        self.beginResetModel()
+        self._items = items
+        self._loaded = min(self.FETCH_BATCH, len(items))
+        self.endResetModel()
+
+    def rows_appended(self, count=1):
+        """Сообщает о count элементах, добавленных в конец показываемого списка"""
+        # Если показаны ещё не все строки, новые придут через fetchMore
+        first = len(self._items) - count
+        if self._loaded == first:
+            self.beginInsertRows(QModelIndex(), first, first + count - 1)
+            self._loaded += count
+            self.endInsertRows()
+
+    def rows_changed(self):
+        """Перерисовывает загруженные строки после изменения самих элементов"""
+        if self._loaded:
+            self.dataChanged.emit(self.index(0), self.index(self._loaded - 1), [Qt.DisplayRole])
+
+    def take(self, row):
+        """Убирает элемент row из показываемого списка и возвращает его"""
+        if row < self._loaded:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            item = self._items.pop(row)
+            self._loaded -= 1
+            self.endRemoveRows()
+            return item
+        return self._items.pop(row)
+
+    def item(self, index):
+        return self._items[index.row()] if index.isValid() and index.row() < len(self._items) else None
+
+
+class SubtaskTreeModel(QAbstractItemModel):
+    """Дерево подзадач текущей задачи для QTreeView.
+
+    Дети узла отдаются представлению порциями по FETCH_BATCH и только
+    когда узел раскрывают (canFetchMore/fetchMore). Отметка подзадачи
+    флажком меняет счётчики её предков в SubtaskTree и перерисовывает
+    только их строки.
+    """
+    FETCH_BATCH = 200
+
+    # Отметка подзадачи флажком: (узел, выполнена); окно записывает изменение
+    done_changed = pyqtSignal(object, bool)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.tree = None
+        # Узел -> сколько его детей уже показано
+        self._loaded = {}
+
+    def set_tree(self, tree):
+        self.beginResetModel()
+        self.tree = tree
+        # Верхний уровень показывается сразу, вложенные - при раскрытии узлов
+        self._loaded = {tree.root: min(self.FETCH_BATCH, len(tree.roots))}
+        self.endResetModel()
+
+    def node(self, index):
+        return index.internalPointer() if index.isValid() else self.tree.root
+
+    def index(self, row, column=0, parent=QModelIndex()):
+        if self.tree is None or column != 0 or not 0 <= row < self.rowCount(parent):
+            return QModelIndex()
+        return self.createIndex(row, 0, self.node(parent).children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        parent = index.internalPointer().parent
+        if parent is None or parent is self.tree.root:
+            return QModelIndex()
+        return self.createIndex(parent.row, 0, parent)
+
+    def index_of(self, node):
+        if node is self.tree.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def rowCount(self, parent=QModelIndex()):
+        if self.tree is None or parent.column() > 0:
+            return 0
+        return self._loaded.get(self.node(parent), 0)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        # Стрелка раскрытия видна и у узла, дети которого ещё не загружены
+        return self.tree is not None and bool(self.node(parent).children)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if self.tree is None:
+            return False
+        node = self.node(parent)
+        return self._loaded.get(node, 0) < len(node.children)
+
+    def fetchMore(self, parent=QModelIndex()):
+        node = self.node(parent)
+        loaded = self._loaded.get(node, 0)
+        count = min(self.FETCH_BATCH, len(node.children) - loaded)
+        if count <= 0:
+            return
+        self.beginInsertRows(parent, loaded, loaded + count - 1)
+        self._loaded[node] = loaded + count
+        self.endInsertRows()
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsUserCheckable
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            if node.total:
+                return f"{node.title} ({node.done_count}/{node.total})"
+            return node.title
+        if role == Qt.CheckStateRole:
+            return Qt.Checked if node.done else Qt.Unchecked
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.CheckStateRole:
+            return False
+        node = index.internalPointer()
+        done = value == Qt.Checked
+        if node.done != done:
+            # Окно запоминает состояние для отмены до изменения дерева
+            self.done_changed.emit(node, done)
+        return True
+
+    def set_done(self, node, done):
+        """Отмечает подзадачу и перерисовывает её строку и строки предков"""
+        self.tree.set_done(node, done)
+        self.node_changed(node)
+
+    def add(self, title, parent=None):
+        """Добавляет подзадачу в конец детей parent (None - на верхний уровень)"""
+        parent = parent or self.tree.root
+        loaded = self._loaded.get(parent, 0)
+        complete = loaded == len(parent.children)
+        node = self.tree.add(title, parent)
+        # Если показаны не все дети, новая строка придёт через fetchMore
+        if complete:
+            self.beginInsertRows(self.index_of(parent), loaded, loaded)
+            self._loaded[parent] = loaded + 1
+            self.endInsertRows()
+        if parent is not self.tree.root:
+            self.node_changed(parent)
+        return node
+
+    def node_changed(self, node):
+        for changed in (node, *self.tree.ancestors(node)):
+            index = self.index_of(changed)
+            self.dataChanged.emit(index, index)
+
+
+class AttachmentListModel(DetailListModel):
+    """Вложения задачи: имя файла, полный путь в подсказке и миниатюра.
+
+    Иконка строки запрашивается у ThumbnailCache, только когда строку
+    рисуют, поэтому миниатюры строятся лишь для видимых вложений; пока
+    миниатюры нет, показывается стандартная иконка файла.
+    """
+    # Стандартные иконки общие для всех вложений, пока нет миниатюры
+    _standard_icons = {}
+
+    def __init__(self, thumbnails, parent=None):
+        super().__init__(os.path.basename, parent)
+        self.thumbnails = thumbnails
+        self._icons = {}
+        thumbnails.ready.connect(self.set_thumbnail)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.ToolTipRole:
+            return self.item(index)
+        if role == Qt.DecorationRole:
+            file_path = self.item(index)
+            if file_path is None:
+                return None
+            icon = self._icons.get(file_path)
+            if icon is None:
+                icon = self.thumbnails.icon(file_path) or self.standard_icon(file_path)
+                self._icons[file_path] = icon
+            return icon
+        return super().data(index, role)
+
+    def set_items(self, items):
+        self._icons = {}
+        super().set_items(items)
+
+    def set_thumbnail(self, file_path, icon):
+        # Задачу могли сменить, пока миниатюра строилась: тогда строк с этим путём нет
+        if file_path not in self._icons:
+            return
+        self._icons[file_path] = icon
+        for row in range(self._loaded):
+            if self._items[row] == file_path:
+                index = self.index(row)
+                self.dataChanged.emit(index, index, [Qt.DecorationRole])
 
-        if file_path.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp')):
-            self.setIcon(QApplication.style().standardIcon(QtWidgets.QStyle.SP_FileIcon))
+    @classmethod
+    def standard_icon(cls, file_path):
+        if file_path.lower().endswith(IMAGE_EXTENSIONS):
+            kind = QtWidgets.QStyle.SP_FileIcon
         else:
-            self.setIcon(QApplication.style().standardIcon(QtWidgets.QStyle.SP_FileLinkIcon))
+            kind = QtWidgets.QStyle.SP_FileLinkIcon
+        if kind not in cls._standard_icons:
+            cls._standard_icons[kind] = QApplication.style().standardIcon(kind)
+        return cls._standard_icons[kind]
+
+
+class TaskListModel(QAbstractListModel):
+    """Модель списка задач для левой панели.
+
+    Изменение одной задачи сообщает представлению только о её строке, а
+    QListView рисует лишь видимые строки, поэтому правка не требует
+    перестроения всего списка.
+    """
+    TaskRole = Qt.UserRole
+
+    COMPLETED_BRUSH = QBrush(QColor(220, 252, 231))
+    SKIPPED_BRUSH = QBrush(QColor(253, 230, 138))
+    OVERDUE_BRUSH = QBrush(QColor(254, 226, 226))
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._tasks = []
+        self._rows = {}
+        self.today = today_epoch_day()
+
+        self.completed_font = QFont()
+        self.completed_font.setStrikeOut(True)
+        self.skipped_font = QFont()
+        self.skipped_font.setItalic(True)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._tasks)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        task = self._tasks[index.row()]
+
+        if role == Qt.DisplayRole:
+            status = ""
+            if task.completed:
+                status = " (Выполнена)"
+            elif task.skipped:
+                status = " (Пропущена)"
+            repeat = " ↻" if task.recurrence is not None else ""
+            return f"{task.title} - {task.due_text}{repeat}{status}"
+        if role == self.TaskRole:
+            return task
+        if role == Qt.BackgroundRole:
+            if task.completed:
+                return self.COMPLETED_BRUSH
+            if task.skipped:
+                return self.SKIPPED_BRUSH
+            if task.due_day < self.today:
+                return self.OVERDUE_BRUSH
+        if role == Qt.FontRole:
+            if task.completed:
+                return self.completed_font
+            if task.skipped:
+                return self.skipped_font
+        return None
+
+    def set_tasks(self, tasks):
+        self.beginResetModel()
+        self._tasks = list(tasks)
+        self._rows = {task.id: row for row, task in enumerate(self._tasks)}
+        self.today = today_epoch_day()
+        self.endResetModel()
+
+    def append_tasks(self, tasks):
+        if not tasks:
+            return
+        first = len(self._tasks)
+        self.beginInsertRows(QModelIndex(), first, first + len(tasks) - 1)
+        for row, task in enumerate(tasks, first):
+            self._tasks.append(task)
+            self._rows[task.id] = row
+        self.endInsertRows()
+
+    def remove_task(self, task):
+        row = self._rows.get(task.id)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._tasks[row]
+        del self._rows[task.id]
+        for shifted_row in range(row, len(self._tasks)):
+            self._rows[self._tasks[shifted_row].id] = shifted_row
+        self.endRemoveRows()
+
+    def set_today(self, today, tasks):
+        """Меняет текущую дату и перерисовывает строки только переданных задач"""
+        self.today = today
+        for task in tasks:
+            self.task_changed(task)
+
+    def task_changed(self, task):
+        row = self._rows.get(task.id)
+        if row is not None:
+            index = self.index(row)
+            self.dataChanged.emit(index, index)
+
+    def contains(self, task):
+        return task.id in self._rows
+
+    def index_of(self, task):
+        row = self._rows.get(task.id)
+        return QModelIndex() if row is None else self.index(row)
+
+
+class PerformanceOverlay(QLabel):
+    """Отладочная панель поверх окна: задержки замеряемых вызовов, последние
+    медленные вызовы и зависания цикла событий"""
+    REFRESH_MS = 500
+    RECENT = 8
+
+    def __init__(self, instrumentation, parent):
+        super().__init__(parent)
+        self.instrumentation = instrumentation
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setTextFormat(Qt.PlainText)
+        self.setStyleSheet("""
+            background-color: rgba(15, 23, 42, 220);
+            color: #e2e8f0;
+            font-family: monospace;
+            font-size: 11px;
+            padding: 8px;
+            border-radius: 5px;
+        """)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.hide()
+
+    def toggle(self):
+        if self.isVisible():
+            self.timer.stop()
+            self.hide()
+        else:
+            self.refresh()
+            self.show()
+            self.raise_()
+            self.timer.start(self.REFRESH_MS)
+
+    def refresh(self):
+        stats, slow_calls, stalls = self.instrumentation.snapshot()
+        lines = [f"{'вызов':<20}{'число':>7}{'сред.мс':>9}{'p95 мс':>8}{'макс.мс':>9}{'байт':>11}"]
+        for name, (count, total, longest, size, p95) in sorted(stats.items()):
+            p95_text = f"≤{p95}" if p95 is not None else ">5000"
+            lines.append(f"{name:<20}{count:>7}{total / count * 1000:>9.1f}{p95_text:>8}"
+                         f"{longest * 1000:>9.1f}{size:>11}")
+        lines.append(f"\nМедленные вызовы (от {self.instrumentation.slow_ms} мс):")
+        for at, name, seconds in reversed(slow_calls[-self.RECENT:]):
+            lines.append(f"  {time.strftime('%H:%M:%S', time.localtime(at))}  {name}  {seconds * 1000:.0f} мс")
+        lines.append("Зависания цикла событий:")
+        for at, seconds in reversed(stalls[-self.RECENT:]):
+            lines.append(f"  {time.strftime('%H:%M:%S', time.localtime(at))}  {seconds * 1000:.0f} мс")
+        self.setText('\n'.join(lines))
+        self.adjustSize()
+        window = self.parentWidget()
+        self.move(max(0, window.width() - self.width() - 10), window.menuBar().height() + 10)
 
 
 class Window(QMainWindow):
-    def __init__(self, username):
+    # Фильтры левой панели: название и условие для TaskStore.query;
+    # 'due' выбирает диапазон сроков из индекса сроков (см. due_range)
+    TASK_FILTERS = [
+        ("Все задачи", None),
+        ("Активные", {'completed': False, 'skipped': False}),
+        ("Просроченные", {'completed': False, 'skipped': False, 'due': 'overdue'}),
+        ("На сегодня", {'completed': False, 'skipped': False, 'due': 'today'}),
+        ("На этой неделе", {'completed': False, 'skipped': False, 'due': 'week'}),
+        ("Выполненные", {'completed': True}),
+        ("Пропущенные", {'skipped': True}),
+    ]
+
+    # Варианты повторения в панели деталей: название и правило RRULE;
+    # пустая строка - правило, которое вводит пользователь
+    RECURRENCE_PRESETS = [
+        ("Не повторяется", None),
+        ("Каждый день", "FREQ=DAILY"),
+        ("Каждую неделю", "FREQ=WEEKLY"),
+        ("Каждые две недели", "FREQ=WEEKLY;INTERVAL=2"),
+        ("Каждый месяц", "FREQ=MONTHLY"),
+        ("Каждый год", "FREQ=YEARLY"),
+        ("Другое правило…", ""),
+    ]
+
+    # Ошибка фоновой записи задач; испускается из потока BufferedTaskStore
+    save_failed = pyqtSignal(str)
+    # Ход и итог копирования вложений; испускаются из потока AttachmentImporter
+    attachment_progress = pyqtSignal(int, int)
+    attachment_done = pyqtSignal(int, str)
+    attachment_failed = pyqtSignal(int, str)
+
+    # Сколько задач загружается за один проход цикла событий
+    LOAD_BATCH_SIZE = 500
+
+    # Наибольший интервал проверки смены даты
+    DAY_CHECK_MAX_MS = 60 * 60 * 1000
+
+    # Методы, время которых замеряется при включённой трассировке (TASK_TRACE);
+    # время add_attachment включает выбор файла в диалоге
+    INSTRUMENTED_METHODS = ('load_tasks', 'load_more_tasks', 'save_tasks', 'persist_task',
+                            'persist_removal', 'compact_if_needed', 'refresh_task_list',
+                            'show_task_details', 'add_attachment', 'sync_store')
+    # Период проверки цикла событий и опоздание таймера, которое считается зависанием
+    STALL_CHECK_MS = 100
+    STALL_MIN_MS = 50
+    # Задержка, за которую события об изменении файлов хранилища сливаются в одну проверку
+    STORE_SYNC_DELAY_MS = 200
+    # Ключи записей истории, которые описывают операцию с одной подзадачей
+    SUBTASK_OPERATIONS = {'subtask_done', 'subtask_remove', 'subtask_insert'}
+    # Память под историю отмены, байты; переопределяется переменной TASK_UNDO_BUDGET
+    UNDO_BUDGET = 4 << 20
+
+    def __init__(self, username, profile=None):
         super().__init__()
+        profile = profile or StartupProfile()
         self.current_user = username
         self.data_file = f"{username}_tasks.json"
+        self.save_failed.connect(self.show_save_error)
+        # TASK_TRACE - путь к файлу трассировки; без него замеры выключены
+        trace_path = os.environ.get('TASK_TRACE')
+        self.instrumentation = Instrumentation(trace_path) if trace_path else None
+        if self.instrumentation is not None:
+            # До подключения сигналов, чтобы они вызывали обёрнутые методы
+            for name in self.INSTRUMENTED_METHODS:
+                setattr(self, name, self.instrumented(name, getattr(self, name)))
+        with profile.phase("открытие хранилища"):
+            # С TASK_SERVICE_URL окно - тонкий клиент сервиса задач (task_service.py)
+            service_url = os.environ.get('TASK_SERVICE_URL')
+            if service_url:
+                store = RemoteTaskStore(service_url, username)
+            else:
+                store = open_store(self.data_file)
+            on_written = None
+            if self.instrumentation is not None:
+                on_written = lambda seconds, size: self.instrumentation.record('store_write', seconds, size)
+            self.store = BufferedTaskStore(store, on_error=lambda e: self.save_failed.emit(str(e)),
+                                           on_written=on_written)
+        with profile.phase("вложения и миниатюры"):
+            # Незавершённые копирования вложений: номер задания -> (задача, исходный путь)
+            self.attachment_jobs = {}
+            self.attachment_progress.connect(self.show_attachment_progress)
+            self.attachment_done.connect(self.attach_imported_file)
+            self.attachment_failed.connect(self.show_attachment_error)
+            self.attachment_importer = AttachmentImporter(
+                AttachmentStore(f"{username}_attachments"),
+                on_progress=self.attachment_progress.emit,
+                on_done=self.attachment_done.emit,
+                on_error=lambda job, e: self.attachment_failed.emit(job, str(e)))
+            self.thumbnails = ThumbnailCache(os.path.join(f"{username}_attachments", 'thumbnails'))
         self.tasks = []
-
-        self.load_tasks()
-
-        if not self.tasks:
-            self.tasks = [
-                Task("Лабораторная работа", "Выполнить эксперименты", QDate.currentDate().addDays(3)),
-                Task("Курсовая работа", "Написать главу 2", QDate.currentDate().addDays(7)),
-                Task("Подготовка к экзамену", "Повторить лекции", QDate.currentDate().addDays(14))
-            ]
-            self.tasks[0].notifications = [
-                f"{QDate.currentDate().addDays(2).toString('dd.MM.yyyy')} 09:00 - Начать за 2 дня"]
-            self.tasks[0].subtasks = ["Подготовить оборудование"]
-            self.save_tasks()
-
-        self.initUI()
-        self.setWindowTitle(f"Планировщик задач - {self.current_user}")
-
-        self.notification_manager = NotificationManager(self)
-        self.init_system_tray()
+        self.tasks_by_id = {}
+        # День выбранного в списке повторения текущей задачи; None - сама задача
+        self.current_occurrence = None
+        self.history = UndoHistory(int(os.environ.get('TASK_UNDO_BUDGET', self.UNDO_BUDGET)))
+        self.search_index = SearchIndex()
+        self.due_index = DueDateIndex()
+
+        with profile.phase("первая порция задач"):
+            self.load_tasks()
+
+            if not self.tasks:
+                self.tasks = [
+                    Task("Лабораторная работа", "Выполнить эксперименты", QDate.currentDate().addDays(3)),
+                    Task("Курсовая работа", "Написать главу 2", QDate.currentDate().addDays(7)),
+                    Task("Подготовка к экзамену", "Повторить лекции", QDate.currentDate().addDays(14))
+                ]
+                self.tasks[0].reminders = [
+                    Reminder(f"{QDate.currentDate().addDays(2).toString('dd.MM.yyyy')} 09:00 - Начать за 2 дня")]
+                self.tasks[0].subtasks = SubtaskTree(["Подготовить оборудование"])
+                self.tasks_by_id = {task.id: task for task in self.tasks}
+                for task in self.tasks:
+                    self.index_task(task)
+                self.save_tasks()
+
+        with profile.phase("интерфейс"):
+            self.initUI()
+            self.setWindowTitle(f"Планировщик задач - {self.current_user}")
+
+        if self.instrumentation is not None:
+            self.init_performance_overlay()
+
+        # Остальные задачи догружаются уже после показа окна
+        if self.loading:
+            QTimer.singleShot(0, self.load_more_tasks)
+
+        with profile.phase("напоминания"):
+            self.notification_manager = NotificationManager(self)
+
+        # Смена даты, пока окно открыто или свёрнуто в трей
+        self.day_timer = QTimer(self)
+        self.day_timer.setSingleShot(True)
+        self.day_timer.timeout.connect(self.check_day_change)
+        self.arm_day_timer()
+        # Значок в трее не нужен для первой отрисовки окна
+        QTimer.singleShot(0, lambda: self.finish_startup(profile))
+
+    def finish_startup(self, profile):
+        """Часть запуска, выполняемая уже после показа окна"""
+        with profile.phase("значок в трее (после показа)"):
+            self.init_system_tray()
+        with profile.phase("наблюдение за хранилищем (после показа)"):
+            self.init_store_watcher()
 
     def init_system_tray(self):
         """Инициализация системного трея"""
@@ -246,22 +843,25 @@ class Window(QMainWindow):
 
         self.tray_icon.setToolTip("Планировщик задач")
 
-        # Создаем меню для трея
-        tray_menu = QMenu()
+        # Меню трея заполняется при первом открытии
+        self.tray_menu = QMenu(self)
+        self.tray_menu.aboutToShow.connect(self.fill_tray_menu)
+        self.tray_icon.setContextMenu(self.tray_menu)
+        self.tray_icon.show()
+
+        # Обработчик клика по иконке в трее
+        self.tray_icon.activated.connect(self.tray_icon_clicked)
 
+    def fill_tray_menu(self):
+        if self.tray_menu.actions():
+            return
         show_action = QAction("Показать", self)
         show_action.triggered.connect(self.show_normal)
-        tray_menu.addAction(show_action)
+        self.tray_menu.addAction(show_action)
 
         exit_action = QAction("Выход", self)
         exit_action.triggered.connect(self.quit_application)
-        tray_menu.addAction(exit_action)
-
-        self.tray_icon.setContextMenu(tray_menu)
-        self.tray_icon.show()
-
-        # Обработчик клика по иконке в трее
-        self.tray_icon.activated.connect(self.tray_icon_clicked)
+        self.tray_menu.addAction(exit_action)
 
     def tray_icon_clicked(self, reason):
         """Обработка кликов по иконке в трее"""
@@ -280,7 +880,7 @@ class Window(QMainWindow):
             QMainWindow {
                 background-color: #f8fafc;
             }
-            QListWidget {
+            QListView {
                 border: 1px solid #e2e8f0;
                 border-radius: 5px;
                 background-color: white;
@@ -313,6 +913,18 @@ class Window(QMainWindow):
         exit_action.triggered.connect(self.quit_application)
         file_menu.addAction(exit_action)
 
+        # В полях ввода эти сочетания отменяют правку текста, а не действие с задачей
+        edit_menu = menubar.addMenu('Правка')
+        self.undo_action = QAction('Отменить', self)
+        self.undo_action.setShortcut('Ctrl+Z')
+        self.undo_action.triggered.connect(self.undo)
+        edit_menu.addAction(self.undo_action)
+        self.redo_action = QAction('Повторить', self)
+        self.redo_action.setShortcut('Ctrl+Shift+Z')
+        self.redo_action.triggered.connect(self.redo)
+        edit_menu.addAction(self.redo_action)
+        self.update_undo_actions()
+
         self.central_widget = QWidget()
         self.setCentralWidget(self.central_widget)
         self.main_layout = QHBoxLayout(self.central_widget)
@@ -321,17 +933,53 @@ class Window(QMainWindow):
         self.left_panel = QWidget()
         self.left_layout = QVBoxLayout(self.left_panel)
 
-        self.task_list = QListWidget()
-        self.task_list.itemClicked.connect(self.show_task_details)
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Поиск")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self.refresh_task_list)
+        self.left_layout.addWidget(self.search_input)
+
+        self.filter_combo = QComboBox()
+        for title, _ in self.TASK_FILTERS:
+            self.filter_combo.addItem(title)
+        self.filter_combo.currentIndexChanged.connect(self.refresh_task_list)
+        self.left_layout.addWidget(self.filter_combo)
+
+        self.task_model = TaskListModel(self)
+        self.task_list = QListView()
+        self.task_list.setModel(self.task_model)
+        # Все строки одной высоты: при догрузке задач порциями список не
+        # пересчитывает размеры всех уже добавленных строк
+        self.task_list.setUniformItemSizes(True)
+        self.task_list.clicked.connect(self.show_task_details)
         self.left_layout.addWidget(self.task_list)
 
         self.btn_refresh = QPushButton("Обновить список")
         self.btn_refresh.clicked.connect(self.refresh_task_list)
         self.left_layout.addWidget(self.btn_refresh)
 
-        # Правая панель - детали задачи
+        # Правая панель - детали задачи; её виджеты создаются при первом выборе
+        # задачи, чтобы не задерживать первую отрисовку окна
         self.right_panel = QWidget()
         self.right_layout = QVBoxLayout(self.right_panel)
+        self.detail_panel_built = False
+        self.detail_placeholder = QLabel("Выберите задачу в списке")
+        self.detail_placeholder.setAlignment(Qt.AlignCenter)
+        self.right_layout.addWidget(self.detail_placeholder)
+
+        self.main_layout.addWidget(self.left_panel, 1)
+        self.main_layout.addWidget(self.right_panel, 2)
+
+        self.refresh_task_list()
+        self.right_panel.setEnabled(False)
+
+    def build_detail_panel(self):
+        """Создаёт виджеты панели деталей задачи при первом обращении"""
+        if self.detail_panel_built:
+            return
+        self.detail_panel_built = True
+        self.right_layout.removeWidget(self.detail_placeholder)
+        self.detail_placeholder.deleteLater()
 
         self.task_title = QLineEdit()
         self.task_title.setPlaceholderText("Название задачи")
@@ -347,6 +995,17 @@ class Window(QMainWindow):
         self.right_layout.addWidget(QLabel("Срок выполнения:"))
         self.right_layout.addWidget(self.due_date_edit)
 
+        # Повторение: пункт выбирается только пользователем (activated), не при заполнении панели
+        recurrence_layout = QHBoxLayout()
+        self.recurrence_combo = QComboBox()
+        for title, _ in self.RECURRENCE_PRESETS:
+            self.recurrence_combo.addItem(title)
+        self.recurrence_combo.activated.connect(self.set_task_recurrence)
+        recurrence_layout.addWidget(self.recurrence_combo)
+        self.recurrence_label = QLabel()
+        recurrence_layout.addWidget(self.recurrence_label, 1)
+        self.right_layout.addLayout(recurrence_layout)
+
         # Статус задачи
         status_layout = QHBoxLayout()
         self.completed_checkbox = QCheckBox("Выполнена")
@@ -361,17 +1020,24 @@ class Window(QMainWindow):
 
         # Вложения
         self.right_layout.addWidget(QLabel("Вложения:"))
-        self.attachments_list = QListWidget()
-        self.attachments_list.itemDoubleClicked.connect(self.open_attachment)
+        self.attachments_model = AttachmentListModel(self.thumbnails, self)
+        self.attachments_list = self.detail_list_view(self.attachments_model)
+        self.attachments_list.doubleClicked.connect(self.open_attachment)
+        self.attachments_list.setIconSize(QSize(48, 48))
         self.right_layout.addWidget(self.attachments_list)
 
+        self.attachment_progress_bar = QProgressBar()
+        self.attachment_progress_bar.setRange(0, 100)
+        self.attachment_progress_bar.hide()
+        self.right_layout.addWidget(self.attachment_progress_bar)
+
         attachment_buttons = QHBoxLayout()
         self.btn_add_attachment = QPushButton("Добавить вложение")
         self.btn_add_attachment.clicked.connect(self.add_attachment)
         attachment_buttons.addWidget(self.btn_add_attachment)
 
         self.btn_open_attachment = QPushButton("Открыть вложение")
-        self.btn_open_attachment.clicked.connect(lambda: self.open_attachment(self.attachments_list.currentItem()))
+        self.btn_open_attachment.clicked.connect(lambda: self.open_attachment(self.attachments_list.currentIndex()))
         attachment_buttons.addWidget(self.btn_open_attachment)
 
         self.btn_remove_attachment = QPushButton("Удалить вложение")
@@ -382,20 +1048,34 @@ class Window(QMainWindow):
 
         # Подзадачи
         self.right_layout.addWidget(QLabel("Подзадачи:"))
-        self.subtasks_list = QListWidget()
-        self.right_layout.addWidget(self.subtasks_list)
+        self.subtasks_model = SubtaskTreeModel(self)
+        self.subtasks_model.done_changed.connect(self.set_subtask_done)
+        self.subtasks_tree = QTreeView()
+        self.subtasks_tree.setHeaderHidden(True)
+        self.subtasks_tree.setUniformRowHeights(True)
+        self.subtasks_tree.setModel(self.subtasks_model)
+        self.right_layout.addWidget(self.subtasks_tree)
 
         self.new_subtask_input = QLineEdit()
         self.new_subtask_input.setPlaceholderText("Новая подзадача")
         self.right_layout.addWidget(self.new_subtask_input)
 
+        subtask_buttons = QHBoxLayout()
         self.btn_add_subtask = QPushButton("Добавить подзадачу")
-        self.btn_add_subtask.clicked.connect(self.add_subtask)
-        self.right_layout.addWidget(self.btn_add_subtask)
+        self.btn_add_subtask.clicked.connect(lambda: self.add_subtask())
+        subtask_buttons.addWidget(self.btn_add_subtask)
+
+        self.btn_add_nested_subtask = QPushButton("Добавить во вложенные")
+        self.btn_add_nested_subtask.setToolTip("Добавить подзадачу внутрь выбранной")
+        self.btn_add_nested_subtask.clicked.connect(lambda: self.add_subtask(nested=True))
+        subtask_buttons.addWidget(self.btn_add_nested_subtask)
+        self.right_layout.addLayout(subtask_buttons)
 
         # Уведомления
         self.right_layout.addWidget(QLabel("Уведомления:"))
-        self.notifications_list = QListWidget()
+        self.notifications_model = DetailListModel(
+            lambda reminder: reminder.raw + (" ✓" if reminder.shown else ""), self)
+        self.notifications_list = self.detail_list_view(self.notifications_model)
         self.right_layout.addWidget(self.notifications_list)
 
         # Поля для ввода даты и времени уведомления
@@ -445,11 +1125,13 @@ class Window(QMainWindow):
 
         self.right_layout.addLayout(button_layout)
 
-        self.main_layout.addWidget(self.left_panel, 1)
-        self.main_layout.addWidget(self.right_panel, 2)
-
-        self.refresh_task_list()
-        self.right_panel.setEnabled(False)
+    @staticmethod
+    def detail_list_view(model):
+        view = QListView()
+        view.setModel(model)
+        # Все строки одной высоты: размеры не пересчитываются для каждой строки
+        view.setUniformItemSizes(True)
+        return view
 
     def quit_application(self):
         """Корректный выход из приложения"""
@@ -460,13 +1142,13 @@ class Window(QMainWindow):
         )
 
         if reply == QMessageBox.Yes:
-            self.save_tasks()
+            self.close_store()
             self.tray_icon.hide()  # Скрываем иконку в трее
             QApplication.quit()
 
     def closeEvent(self, event):
         """Обработчик события закрытия окна"""
-        self.save_tasks()
+        self.store.flush()
         # Можно выбрать - сворачивать в трей или закрывать
         reply = QMessageBox.question(
             self, 'Подтверждение',
@@ -476,132 +1158,619 @@ class Window(QMainWindow):
         )
 
         if reply == QMessageBox.StandardButton.Close:
+            self.close_store()
             self.tray_icon.hide()
             event.accept()
         else:
             self.hide()
             event.ignore()
 
+    def close_store(self):
+        """Дописывает изменения и закрывает хранилище и файл трассировки"""
+        if hasattr(self, 'store_sync_timer'):
+            self.store_sync_timer.stop()
+        self.store.close()
+        if self.instrumentation is not None:
+            self.instrumentation.close()
+
+    def instrumented(self, name, func):
+        """func с замером времени, если трассировка включена"""
+        if self.instrumentation is None:
+            return func
+        return self.instrumentation.wrap(name, func)
+
+    def init_performance_overlay(self):
+        """Скрытая отладочная панель (Ctrl+Shift+D) и слежение за циклом событий"""
+        self.performance_overlay = PerformanceOverlay(self.instrumentation, self)
+        QShortcut(QKeySequence("Ctrl+Shift+D"), self, self.performance_overlay.toggle)
+
+        # Таймер с коротким периодом: насколько он опоздал, настолько цикл
+        # событий был занят и окно не отвечало
+        self.stall_timer = QTimer(self)
+        self.stall_timer.timeout.connect(self.check_event_loop)
+        self.stall_timer.start(self.STALL_CHECK_MS)
+        self._stall_expected = time.perf_counter() + self.STALL_CHECK_MS / 1000
+
+    def check_event_loop(self):
+        now = time.perf_counter()
+        delay = now - self._stall_expected
+        self._stall_expected = now + self.STALL_CHECK_MS / 1000
+        if delay * 1000 >= self.STALL_MIN_MS:
+            self.instrumentation.record_stall(delay)
+
     # ... (остальные методы класса Window остаются без изменений)
 
     def load_tasks(self):
+        """Загружает первую порцию задач; остальные догружает load_more_tasks"""
+        self.loading = True
+        self._load_batches = self.store.iter_batches(self.LOAD_BATCH_SIZE)
+        self._unshown_tasks = []
+        self._take_loaded_batch()
+
+    def load_more_tasks(self):
+        """Догружает следующую порцию задач и возвращает управление циклу событий"""
+        if not self.loading:
+            return
+        tasks = self._take_loaded_batch()
+        self.notification_manager.tasks_added(tasks)
+        self._unshown_tasks.extend(task for task in tasks if self.matches_filter(task))
+
+        # Каждая вставка строк заставляет QListView заново разложить весь
+        # список, поэтому строки добавляются пачками, растущими вдвое
+        if not self.loading or len(self._unshown_tasks) >= self.task_model.rowCount():
+            self.task_model.append_tasks(self._unshown_tasks)
+            self._unshown_tasks = []
+
+        if self.loading:
+            QTimer.singleShot(0, self.load_more_tasks)
+            return
+
+        if self.store.needs_compaction():
+            self.store.compact()
+
+    def _take_loaded_batch(self):
         try:
-            if os.path.exists(self.data_file):
-                with open(self.data_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.tasks = [Task.from_dict(task_data) for task_data in data]
+            batch = next(self._load_batches, None)
         except Exception as e:
             QMessageBox.warning(self, "Ошибка", f"Не удалось загрузить задачи: {str(e)}")
+            batch = None
+
+        if batch is None:
+            self.loading = False
+            self._load_batches = None
+            return []
+
+        tasks = [Task.from_dict(task_data) for task_data in batch]
+        self.tasks.extend(tasks)
+        for task in tasks:
+            self.tasks_by_id[task.id] = task
+            self.search_index.update(task, task.search_texts())
+        self.due_index.add_tasks(tasks)
+        return tasks
 
     def save_tasks(self):
+        """Ставит в очередь запись всех задач в хранилище целиком"""
+        self.store.save_all([task.to_dict() for task in self.tasks])
+
+    def persist_task(self, task):
+        """Ставит в очередь запись изменений одной задачи"""
+        self.store.put(task.to_dict())
+        self.compact_if_needed()
+
+    def reminders_shown(self, tasks):
+        """Записывает задачи, напоминания которых только что показаны, одной пачкой"""
+        self.store.apply([(task.id, task.to_dict()) for task in tasks])
+        self.compact_if_needed()
+        current_task = getattr(self, 'current_task', None)
+        if current_task is not None and any(task is current_task for task in tasks):
+            self.notifications_model.rows_changed()
+
+    def persist_removal(self, task):
+        """Ставит в очередь запись удаления задачи"""
+        self.store.delete(task.id)
+        self.compact_if_needed()
+
+    def compact_if_needed(self):
+        # Пока задачи догружаются, хранилище знает ещё не все из них
+        if not self.loading and self.store.needs_compaction():
+            self.store.compact()
+
+    def init_store_watcher(self):
+        """Следит за файлами хранилища, которые может изменить другой экземпляр программы"""
+        self.store_sync_timer = QTimer(self)
+        self.store_sync_timer.setSingleShot(True)
+        self.store_sync_timer.timeout.connect(self.sync_store)
+        self.store_watcher = QFileSystemWatcher(self)
+        self.store_watcher.fileChanged.connect(self.schedule_store_sync)
+        # Каталог - чтобы заметить файлы, которых ещё не было, например журнал
+        self.store_watcher.directoryChanged.connect(self.schedule_store_sync)
+        self.watch_store_files()
+
+    def schedule_store_sync(self, path):
+        # Одна запись порождает несколько событий подряд: они сливаются в одну проверку
+        self.store_sync_timer.start(self.STORE_SYNC_DELAY_MS)
+
+    def watch_store_files(self):
+        paths = self.store.watched_paths()
+        if not paths:
+            return
+        # Свёртка заменяет снимок новым файлом, и наблюдение за прежним пропадает
+        watched = set(self.store_watcher.files()) | set(self.store_watcher.directories())
+        directory = os.path.dirname(os.path.abspath(paths[0]))
+        missing = [path for path in [directory, *paths] if path not in watched and os.path.exists(path)]
+        if missing:
+            self.store_watcher.addPaths(missing)
+
+    def sync_store(self):
+        """Переносит в окно задачи, изменённые другими экземплярами программы"""
+        self.watch_store_files()
+        if self.loading:
+            # Хранилище ещё не знает всех задач: проверка повторится позже
+            self.store_sync_timer.start(self.STORE_SYNC_DELAY_MS)
+            return
         try:
-            with open(self.data_file, 'w', encoding='utf-8') as f:
-                json.dump([task.to_dict() for task in self.tasks], f, ensure_ascii=False, indent=2)
+            changes = self.store.sync()
         except Exception as e:
-            QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить задачи: {str(e)}")
-
-    def refresh_task_list(self):
-        self.task_list.clear()
-        today = QDate.currentDate()
-
-        for task in self.tasks:
-            status = ""
-            if task.completed:
-                status = " (Выполнена)"
-            elif task.skipped:
-                status = " (Пропущена)"
-
-            item = QListWidgetItem(f"{task.title} - {task.due_date.toString('dd.MM.yyyy')}{status}")
-            item.setData(Qt.UserRole, task)
+            QMessageBox.warning(self, "Ошибка", f"Не удалось перечитать задачи: {str(e)}")
+            return
+        if changes is None:
+            # Идёт фоновая запись: проверка повторится, когда она закончится
+            self.store_sync_timer.start(self.STORE_SYNC_DELAY_MS)
+            return
+        if changes:
+            self.apply_task_changes(changes)
+
+    def apply_task_changes(self, changes):
+        """Заменяет состояния задач: пары (id, словарь задачи или None для удаления).
+
+        Обновляются только эти задачи в памяти, индексах, списке и
+        напоминаниях; в хранилище ничего не пишется.
+        """
+        added = []
+        for task_id, data in changes:
+            task = self.tasks_by_id.get(task_id)
+            if data is None:
+                if task is not None:
+                    self.forget_task(task)
+                continue
+            fresh = Task.from_dict(data)
+            if task is None:
+                self.tasks.append(fresh)
+                self.tasks_by_id[task_id] = fresh
+                self.search_index.update(fresh, fresh.search_texts())
+                added.append(fresh)
+                continue
 
-            if task.completed:
-                item.setBackground(QColor(220, 252, 231))
-                font = item.font()
-                font.setStrikeOut(True)
-                item.setFont(font)
-            elif task.skipped:
-                item.setBackground(QColor(253, 230, 138))
-                font = item.font()
-                font.setItalic(True)
-                item.setFont(font)
-            elif task.due_date < today:
-                item.setBackground(QColor(254, 226, 226))
+            shown = getattr(self, 'current_task', None) is task
+            edited = shown and self.task_details_edited()
+            task.assign(fresh)
+            self.index_task(task)
+            self.update_task_row(task)
+            self.notification_manager.task_changed(task)
+            # Несохранённые правки в панели деталей не затираются
+            if edited:
+                self.fill_task_status()
+            elif shown:
+                self.fill_task_details()
+
+        if added:
+            # Новые задачи добавляются пачкой, как при загрузке
+            self.due_index.add_tasks(added)
+            self.task_model.append_tasks([task for task in added if self.matches_filter(task)])
+            self.notification_manager.tasks_added(added)
+
+    def remember_undo(self, label, task, fields=None):
+        """Запоминает для отмены поля fields задачи (или всю её) до действия label"""
+        self.history.record(label, [(task.id, self.task_state(task.id, fields))])
+        self.update_undo_actions()
+
+    def remember_subtask_undo(self, label, task, operation):
+        """Запоминает для отмены одну операцию с подзадачей (см. subtask_inverse).
+
+        Запись истории - id подзадачи и её прежняя отметка или сама
+        подзадача, а не всё дерево: иначе на больших деревьях несколько
+        щелчков исчерпали бы память истории.
+        """
+        self.history.record(label, [(task.id, operation)])
+        self.update_undo_actions()
+
+    @staticmethod
+    def subtask_inverse(task, operation):
+        """Операция, отменяющая operation над подзадачами задачи task.
+
+        Операции: {'subtask_done': [id, отметка]} - вернуть отметку,
+        {'subtask_remove': id} - убрать подзадачу, {'subtask_insert': [id
+        родителя, номер строки, подзадача из to_data()]} - вставить её обратно.
+        Для подзадачи, которой уже нет (её изменили в другом окне), - пустая
+        операция.
+        """
+        tree = task.subtasks
+        if 'subtask_done' in operation:
+            node = tree.find(operation['subtask_done'][0])
+            return {} if node is None else {'subtask_done': [node.id, node.done]}
+        if 'subtask_remove' in operation:
+            node = tree.find(operation['subtask_remove'])
+            if node is None or node.parent is None:
+                return {}
+            return {'subtask_insert': [node.parent.id, node.row, node.to_data()]}
+        node_id = operation['subtask_insert'][2]['id']
+        return {'subtask_remove': node_id}
+
+    @staticmethod
+    def apply_subtask_operation(task, operation):
+        tree = task.subtasks
+        if 'subtask_done' in operation:
+            node_id, done = operation['subtask_done']
+            node = tree.find(node_id)
+            if node is not None:
+                tree.set_done(node, done)
+        elif 'subtask_remove' in operation:
+            node = tree.find(operation['subtask_remove'])
+            if node is not None and node.parent is not None:
+                tree.remove(node)
+        elif 'subtask_insert' in operation:
+            parent_id, row, data = operation['subtask_insert']
+            parent = tree.find(parent_id)
+            if parent is not None:
+                tree.insert(data, parent, row)
+
+    def task_state(self, task_id, fields):
+        """Нынешние поля fields задачи, вся задача при fields=None или None, если её нет.
+
+        fields может быть и записью истории: для операции с подзадачами
+        возвращается обратная ей операция.
+        """
+        task = self.tasks_by_id.get(task_id)
+        if task is None:
+            return None
+        if isinstance(fields, dict) and fields.keys() & self.SUBTASK_OPERATIONS:
+            return self.subtask_inverse(task, fields)
+        data = task.to_dict()
+        # Необязательных полей, например recurrence, в словаре задачи может не быть
+        return data if fields is None else {name: data.get(name) for name in fields}
+
+    def undo(self):
+        self.replay_history(self.history.undo(self.task_state))
+
+    def redo(self):
+        self.replay_history(self.history.redo(self.task_state))
+
+    def replay_history(self, entry):
+        """Возвращает задачам состояния из истории и сохраняет их как обычные правки"""
+        if entry is None:
+            return
+        label, changes = entry
+        replaced = []
+        for task_id, state in changes:
+            task = self.tasks_by_id.get(task_id)
+            if task is not None and state is not None and state.keys() & self.SUBTASK_OPERATIONS:
+                # Операция выполняется над деревом самой задачи, а сохраняется
+                # и показывается задача целиком, как после обычной правки
+                self.apply_subtask_operation(task, state)
+                state = task.to_dict()
+            elif task is not None and state is not None:
+                data = task.to_dict()
+                data.update(state)
+                state = data
+            elif task is None and state is not None and 'id' not in state:
+                # Задачу с тех пор удалили, например в другом окне
+                continue
+            replaced.append((task_id, state))
 
-            self.task_list.addItem(item)
+        self.apply_task_changes(replaced)
+        for task_id, state in replaced:
+            if state is None:
+                self.store.delete(task_id)
+            else:
+                self.store.put(state)
+        self.compact_if_needed()
+        self.update_undo_actions()
+
+    def update_undo_actions(self):
+        undo_label, redo_label = self.history.undo_label(), self.history.redo_label()
+        self.undo_action.setEnabled(undo_label is not None)
+        self.undo_action.setText(f"Отменить: {undo_label}" if undo_label else "Отменить")
+        self.redo_action.setEnabled(redo_label is not None)
+        self.redo_action.setText(f"Повторить: {redo_label}" if redo_label else "Повторить")
+
+    def show_save_error(self, message):
+        QMessageBox.warning(self, "Ошибка", f"Не удалось сохранить задачи: {message}")
+
+    def visible_tasks(self):
+        """Задачи, попадающие под выбранный в левой панели фильтр и поиск"""
+        conditions = self.TASK_FILTERS[self.filter_combo.currentIndex()][1]
+        query = self.search_input.text()
+        found = self.search_index.search(query) if query.strip() else None
+        if conditions is None:
+            return self.tasks if found is None else found
+
+        if 'due' in conditions:
+            # Диапазон сроков - срез индекса, проверяются только задачи из него
+            start, end = self.due_range(conditions['due'])
+            tasks = self.due_index.between(start, end)
+            if start is not None:
+                # Следующие повторения повторяющихся задач раскрываются только
+                # в пределах окна; у просроченных задач повторений в прошлом нет
+                tasks = list(merge(tasks, self.due_index.occurrences(start, end),
+                                   key=lambda task: task.due_day))
+            if found is not None:
+                found = set(found)
+                tasks = [task for task in tasks if getattr(task, 'task', task) in found]
+            return [task for task in tasks if self.matches_conditions(task, conditions)]
+
+        if found is not None:
+            # Найденные задачи уже в памяти: на каждое нажатие клавиши в поиске
+            # не стоит обращаться к хранилищу, тем более удалённому
+            return [task for task in found if self.matches_conditions(task, conditions)]
+        task_ids = self.store.query(**conditions)
+        if task_ids is None:
+            # Идёт фоновая запись, ждать её в потоке GUI нельзя
+            return [task for task in self.tasks if self.matches_conditions(task, conditions)]
+        # Пока идёт загрузка, хранилище может знать о ещё не прочитанных задачах
+        return [self.tasks_by_id[task_id] for task_id in task_ids
+                if task_id in self.tasks_by_id]
+
+    def matches_filter(self, task):
+        """Проверяет одну задачу по выбранному фильтру без обращения к хранилищу"""
+        query = self.search_input.text()
+        if query and not self.search_index.matches(task, query):
+            return False
+        conditions = self.TASK_FILTERS[self.filter_combo.currentIndex()][1]
+        return conditions is None or self.matches_conditions(task, conditions)
+
+    def matches_conditions(self, task, conditions):
+        if 'completed' in conditions and task.completed != conditions['completed']:
+            return False
+        if 'skipped' in conditions and task.skipped != conditions['skipped']:
+            return False
+        if 'due' in conditions:
+            start, end = self.due_range(conditions['due'])
+            if start is not None and task.due_day < start or not task.due_day < end:
+                return False
+        return True
+
+    @staticmethod
+    def due_range(view):
+        """Диапазон сроков [начало, конец) в днях от 01.01.1970 для фильтра 'due'"""
+        today = today_epoch_day()
+        if view == 'overdue':
+            return None, today
+        if view == 'today':
+            return today, today + 1
+        # До воскресенья текущей недели включительно
+        return today, today + 7 - date.fromordinal(today + EPOCH_ORDINAL).weekday()
+
+    def index_task(self, task):
+        """Обновляет задачу в поисковом индексе и индексе сроков"""
+        self.search_index.update(task, task.search_texts())
+        self.due_index.update(task)
+
+    def arm_day_timer(self):
+        # Таймеры Qt не идут, пока компьютер спит, поэтому дата проверяется
+        # и в полночь, и не реже раза в час
+        now = QDateTime.currentDateTime()
+        midnight = QDateTime(QDate.currentDate().addDays(1), QTime(0, 0))
+        self.day_timer.start(min(now.msecsTo(midnight) + 1000, self.DAY_CHECK_MAX_MS))
+
+    def check_day_change(self):
+        today = today_epoch_day()
+        previous = self.task_model.today
+        if today != previous:
+            # Перекрашиваются только задачи со сроком между прежней и новой датой
+            changed = self.due_index.between(min(previous, today), max(previous, today))
+            self.task_model.set_today(today, changed)
+            conditions = self.TASK_FILTERS[self.filter_combo.currentIndex()][1]
+            if conditions is not None and 'due' in conditions:
+                self.refresh_task_list()
+        self.arm_day_timer()
 
-    def show_task_details(self, item):
-        self.current_task = item.data(Qt.UserRole)
+    def refresh_task_list(self):
+        # Уже загруженные, но не показанные задачи попадут в visible_tasks()
+        self._unshown_tasks = []
+        self.task_model.set_tasks(self.visible_tasks())
+
+    def update_task_row(self, task):
+        """Обновляет строку задачи или убирает её, если она вышла из фильтра"""
+        conditions = self.TASK_FILTERS[self.filter_combo.currentIndex()][1]
+        if task.recurrence is not None and conditions is not None and 'due' in conditions:
+            # Вместе с задачей меняются строки её повторений
+            self.refresh_task_list()
+            return
+        if not self.matches_filter(task):
+            self.task_model.remove_task(task)
+        elif self.task_model.contains(task):
+            self.task_model.task_changed(task)
+        else:
+            self.task_model.append_tasks([task])
+
+    def show_task_details(self, index):
+        self.build_detail_panel()
+        task = index.data(TaskListModel.TaskRole)
+        # У строки повторения панель показывает саму задачу, а статус - этого повторения
+        if isinstance(task, Occurrence):
+            self.current_task, self.current_occurrence = task.task, task.due_day
+        else:
+            self.current_task, self.current_occurrence = task, None
         self.right_panel.setEnabled(True)
+        self.fill_task_details()
 
+    def fill_task_details(self):
+        """Показывает в панели деталей поля текущей задачи"""
         self.task_title.setText(self.current_task.title)
         self.task_description.setText(self.current_task.description)
         self.due_date_edit.setDate(self.current_task.due_date)
+        self.fill_task_status()
+
+    def fill_task_status(self):
+        """Показывает всё в панели деталей, кроме полей, которые правятся
+        вручную и сохраняются кнопкой: статус, повторение и списки задачи"""
+        self.subtasks_model.set_tree(self.current_task.subtasks)
+        self.attachments_model.set_items(self.current_task.attachments)
+
+        recurrence = self.current_task.recurrence
+        if self.current_occurrence is not None and (
+                recurrence is None or self.current_occurrence <= self.current_task.due_day):
+            # Повторение стало текущим сроком задачи или повторения отменены
+            self.current_occurrence = None
+        rules = [rule for _, rule in self.RECURRENCE_PRESETS]
+        rule = None if recurrence is None else recurrence.rule.text
+        self.recurrence_combo.setCurrentIndex(rules.index(rule) if rule in rules else len(rules) - 1)
+        if recurrence is None:
+            self.recurrence_label.clear()
+        elif self.current_occurrence is None:
+            self.recurrence_label.setText(recurrence.rule.describe())
+        else:
+            occurrence = Occurrence(self.current_task, self.current_occurrence)
+            self.recurrence_label.setText(f"{recurrence.rule.describe()}; повторение {occurrence.due_text}")
 
+        status = self.current_task
+        if self.current_occurrence is not None:
+            status = Occurrence(self.current_task, self.current_occurrence)
         self.completed_checkbox.blockSignals(True)
         self.skipped_checkbox.blockSignals(True)
 
-        self.completed_checkbox.setChecked(self.current_task.completed)
-        self.skipped_checkbox.setChecked(self.current_task.skipped)
+        self.completed_checkbox.setChecked(status.completed)
+        self.skipped_checkbox.setChecked(status.skipped)
 
         self.completed_checkbox.blockSignals(False)
         self.skipped_checkbox.blockSignals(False)
 
-        self.subtasks_list.clear()
-        for subtask in self.current_task.subtasks:
-            self.subtasks_list.addItem(subtask)
+        self.notifications_model.set_items(self.current_task.reminders)
 
-        self.notifications_list.clear()
-        for notification in self.current_task.notifications:
-            self.notifications_list.addItem(notification)
-
-        self.attachments_list.clear()
-        for attachment in self.current_task.attachments:
-            item = AttachmentItem(attachment)
-            self.attachments_list.addItem(item)
+    def task_details_edited(self):
+        """Есть ли в панели деталей правки, ещё не сохранённые кнопкой"""
+        return (self.task_title.text() != self.current_task.title
+                or self.task_description.toPlainText() != self.current_task.description
+                or self.due_date_edit.date() != self.current_task.due_date)
 
     def update_task_status(self):
         if not hasattr(self, 'current_task'):
             return
 
+        # Снятие второго флажка не должно снова вызывать этот обработчик
         if self.completed_checkbox.isChecked():
-            self.current_task.completed = True
-            self.current_task.skipped = False
+            state = COMPLETED
+            self.skipped_checkbox.blockSignals(True)
             self.skipped_checkbox.setChecked(False)
+            self.skipped_checkbox.blockSignals(False)
         elif self.skipped_checkbox.isChecked():
-            self.current_task.skipped = True
-            self.current_task.completed = False
+            state = SKIPPED
+            self.completed_checkbox.blockSignals(True)
             self.completed_checkbox.setChecked(False)
+            self.completed_checkbox.blockSignals(False)
         else:
-            self.current_task.completed = False
-            self.current_task.skipped = False
+            state = None
+        self.set_current_status("Смена статуса", state)
+
+    def set_current_status(self, label, state):
+        """Отмечает текущую задачу выполненной, пропущенной или снимает отметку (state=None).
+
+        У повторяющейся задачи отмечается выбранное повторение; отметка
+        текущего переносит срок и напоминания задачи на следующее.
+        """
+        task = self.current_task
+        if task.recurrence is None:
+            self.remember_undo(label, task, ('completed', 'skipped'))
+            task.completed = state == COMPLETED
+            task.skipped = state == SKIPPED
+            self.persist_task(task)
+            self.update_task_row(task)
+            self.notification_manager.task_changed(task)
+            return
 
-        self.save_tasks()
-        self.refresh_task_list()
+        # Срок и напоминания могут сдвинуться, поэтому запоминается вся задача
+        self.remember_undo(label, task)
+        edited = self.task_details_edited()
+        day = task.due_day if self.current_occurrence is None else self.current_occurrence
+        task.set_occurrence_state(day, state)
+        self.index_task(task)
+        self.persist_task(task)
+        self.update_task_row(task)
+        self.notification_manager.task_changed(task)
+        # Несохранённые правки в панели деталей не затираются
+        if edited:
+            self.fill_task_status()
+        else:
+            self.fill_task_details()
 
     def save_task(self):
         if not hasattr(self, 'current_task'):
             return
 
+        if self.task_details_edited():
+            self.remember_undo("Изменение задачи", self.current_task,
+                               ('title', 'description', 'due_date', 'recurrence'))
         self.current_task.title = self.task_title.text()
         self.current_task.description = self.task_description.toPlainText()
+        due_moved = self.due_date_edit.date() != self.current_task.due_date
         self.current_task.due_date = self.due_date_edit.date()
-
-        self.save_tasks()
+        if due_moved and self.current_task.recurrence is not None:
+            # Новый срок - новое начало повторений, отметки прежних забываются;
+            # если после него повторений нет, задача становится обычной
+            try:
+                self.current_task.set_recurrence(self.current_task.recurrence.rule.text)
+            except ValueError:
+                self.current_task.recurrence = None
+            self.fill_task_details()
+
+        self.index_task(self.current_task)
+        self.persist_task(self.current_task)
         QMessageBox.information(self, "Сохранено", "Изменения сохранены")
-        self.refresh_task_list()
+        self.update_task_row(self.current_task)
+
+    def set_task_recurrence(self, index):
+        """Задаёт текущей задаче повторение, выбранное в списке вариантов"""
+        if not hasattr(self, 'current_task'):
+            return
+
+        task = self.current_task
+        edited = self.task_details_edited()
+        rule = self.RECURRENCE_PRESETS[index][1]
+        if rule == "":
+            current = "" if task.recurrence is None else task.recurrence.rule.text
+            rule, ok = QInputDialog.getText(self, "Правило повторения",
+                                            "Правило RRULE, например FREQ=WEEKLY;BYDAY=MO,TH:", text=current)
+            if not ok or not rule.strip():
+                self.fill_task_status()
+                return
+        current = None if task.recurrence is None else task.recurrence.rule
+        if rule is None and current is None:
+            return
+        try:
+            if rule is not None and parse_rule(rule) is current:
+                return
+            before = self.task_state(task.id, ('recurrence', 'due_date'))
+            task.set_recurrence(rule)
+        except ValueError as e:
+            QMessageBox.warning(self, "Ошибка", f"Неверное правило повторения: {str(e)}")
+            self.fill_task_status()
+            return
+
+        self.history.record("Повторение задачи", [(task.id, before)])
+        self.update_undo_actions()
+        self.current_occurrence = None
+        self.index_task(task)
+        self.persist_task(task)
+        self.update_task_row(task)
+        self.notification_manager.task_changed(task)
+        if edited:
+            self.fill_task_status()
+        else:
+            self.fill_task_details()
 
     def new_task(self):
         new_task = Task("Новая задача", "", QDate.currentDate().addDays(1))
+        self.remember_undo("Создание задачи", new_task)
         self.tasks.append(new_task)
-        self.save_tasks()
+        self.tasks_by_id[new_task.id] = new_task
+        self.index_task(new_task)
+        self.persist_task(new_task)
 
-        self.refresh_task_list()
-        for i in range(self.task_list.count()):
-            item = self.task_list.item(i)
-            if item.data(Qt.UserRole) == new_task:
-                self.task_list.setCurrentItem(item)
-                self.show_task_details(item)
-                break
+        self.update_task_row(new_task)
+        index = self.task_model.index_of(new_task)
+        if index.isValid():
+            self.task_list.setCurrentIndex(index)
+            self.show_task_details(index)
 
     def delete_task(self):
         if not hasattr(self, 'current_task'):
@@ -614,32 +1783,67 @@ class Window(QMainWindow):
         )
 
         if reply == QMessageBox.Yes:
-            self.tasks.remove(self.current_task)
-            self.save_tasks()
-            self.refresh_task_list()
+            self.remember_undo("Удаление задачи", self.current_task)
+            self.persist_removal(self.current_task)
+            self.forget_task(self.current_task)
+
+    def forget_task(self, task):
+        """Убирает задачу из памяти, индексов, списка и напоминаний"""
+        self.tasks.remove(task)
+        del self.tasks_by_id[task.id]
+        self.search_index.remove(task)
+        self.due_index.remove(task)
+        self.task_model.remove_task(task)
+        self.notification_manager.task_removed(task)
+        if getattr(self, 'current_task', None) is task:
             self.right_panel.setEnabled(False)
 
     def skip_task(self):
         if not hasattr(self, 'current_task'):
             return
 
-        self.current_task.skipped = True
-        self.current_task.completed = False
+        self.skipped_checkbox.blockSignals(True)
+        self.completed_checkbox.blockSignals(True)
         self.skipped_checkbox.setChecked(True)
         self.completed_checkbox.setChecked(False)
-        self.save_tasks()
-        self.refresh_task_list()
+        self.skipped_checkbox.blockSignals(False)
+        self.completed_checkbox.blockSignals(False)
+        self.set_current_status("Пропуск задачи", SKIPPED)
 
-    def add_subtask(self):
+    def add_subtask(self, nested=False):
+        """Добавляет подзадачу на верхний уровень или (nested) внутрь выбранной"""
         if not hasattr(self, 'current_task'):
             return
 
+        parent = None
+        if nested:
+            selected = self.subtasks_tree.currentIndex()
+            if not selected.isValid():
+                QMessageBox.warning(self, "Ошибка", "Выберите подзадачу, в которую нужно добавить новую")
+                return
+            parent = self.subtasks_model.node(selected)
+
         subtask = self.new_subtask_input.text()
         if subtask:
-            self.current_task.subtasks.append(subtask)
-            self.subtasks_list.addItem(subtask)
+            node = self.subtasks_model.add(subtask, parent)
+            self.remember_subtask_undo("Добавление подзадачи", self.current_task,
+                                       {'subtask_remove': node.id})
+            parent_index = self.subtasks_tree.rootIndex() if parent is None else self.subtasks_model.index_of(parent)
+            self.subtasks_tree.expand(parent_index)
+            # Строка новой подзадачи появится позже, если показаны ещё не все соседние
+            if node.row < self.subtasks_model.rowCount(parent_index):
+                self.subtasks_tree.setCurrentIndex(self.subtasks_model.index_of(node))
             self.new_subtask_input.clear()
-            self.save_tasks()
+            self.index_task(self.current_task)
+            self.persist_task(self.current_task)
+            self.update_task_row(self.current_task)
+
+    def set_subtask_done(self, node, done):
+        """Отмечает подзадачу текущей задачи выполненной или снимает отметку"""
+        self.remember_subtask_undo("Отметка подзадачи", self.current_task,
+                                   {'subtask_done': [node.id, node.done]})
+        self.subtasks_model.set_done(node, done)
+        self.persist_task(self.current_task)
 
     def add_notification(self):
         if not hasattr(self, 'current_task'):
@@ -651,11 +1855,16 @@ class Window(QMainWindow):
 
         if text:
             notification = f"{date} {time} - {text}"
-            self.current_task.notifications.append(notification)
-            self.notifications_list.addItem(notification)
+            reminder = Reminder(notification)
+            self.remember_undo("Добавление напоминания", self.current_task,
+                               ('notifications', 'notifications_shown'))
+            self.current_task.reminders.append(reminder)
+            self.notifications_model.rows_appended()
             self.notification_text.clear()
-            self.current_task.notification_shown = False
-            self.save_tasks()
+            self.notification_manager.notification_added(self.current_task, reminder)
+            self.index_task(self.current_task)
+            self.persist_task(self.current_task)
+            self.update_task_row(self.current_task)
 
     def add_attachment(self):
         if not hasattr(self, 'current_task'):
@@ -667,41 +1876,107 @@ class Window(QMainWindow):
         )
 
         if file_path:
-            self.current_task.attachments.append(file_path)
-            item = AttachmentItem(file_path)
-            self.attachments_list.addItem(item)
-            self.save_tasks()
+            # Файл копируется в хранилище вложений в фоновом потоке
+            job = self.attachment_importer.add(file_path)
+            self.attachment_jobs[job] = (self.current_task, file_path)
+            self.show_attachment_progress(job, 0)
+
+    def show_attachment_progress(self, job, percent):
+        if job not in self.attachment_jobs:
+            return
+        _, file_path = self.attachment_jobs[job]
+        waiting = len(self.attachment_jobs) - 1
+        text = f"{os.path.basename(file_path)}: %p%"
+        if waiting:
+            text += f" (ещё {waiting} в очереди)"
+        self.attachment_progress_bar.setFormat(text)
+        self.attachment_progress_bar.setValue(percent)
+        self.attachment_progress_bar.show()
+
+    def attach_imported_file(self, job, path):
+        task, _ = self.attachment_jobs.pop(job, (None, None))
+        self.attachment_progress_bar.setVisible(bool(self.attachment_jobs))
+        # Задачу могли удалить, пока файл копировался, а отмена удаления
+        # восстанавливает её новым объектом
+        task = task and self.tasks_by_id.get(task.id)
+        if task is None:
+            return
+        self.remember_undo("Добавление вложения", task, ('attachments',))
+        task.attachments.append(path)
+        if getattr(self, 'current_task', None) is task:
+            self.attachments_model.rows_appended()
+        self.persist_task(task)
+
+    def show_attachment_error(self, job, message):
+        _, file_path = self.attachment_jobs.pop(job, (None, None))
+        self.attachment_progress_bar.setVisible(bool(self.attachment_jobs))
+        QMessageBox.warning(self, "Ошибка", f"Не удалось добавить вложение {file_path}: {message}")
 
     def remove_attachment(self):
-        if not hasattr(self, 'current_task') or not self.attachments_list.currentItem():
+        if not hasattr(self, 'current_task') or not self.attachments_list.currentIndex().isValid():
             return
 
-        current_row = self.attachments_list.currentRow()
+        current_row = self.attachments_list.currentIndex().row()
         if 0 <= current_row < len(self.current_task.attachments):
-            self.current_task.attachments.pop(current_row)
-            self.attachments_list.takeItem(current_row)
-            self.save_tasks()
+            self.remember_undo("Удаление вложения", self.current_task, ('attachments',))
+            # Модель показывает сам список вложений задачи и убирает элемент из него
+            self.attachments_model.take(current_row)
+            self.persist_task(self.current_task)
 
-    def open_attachment(self, item):
-        if item and hasattr(item, 'file_path'):
-            file_path = item.file_path
+    def open_attachment(self, index):
+        file_path = self.attachments_model.item(index)
+        if file_path:
             if os.path.exists(file_path):
-                url = QUrl.fromLocalFile(file_path)
+                url = QUrl.fromLocalFile(os.path.abspath(file_path))
                 if not QDesktopServices.openUrl(url):
                     QMessageBox.warning(self, "Ошибка", f"Не удалось открыть файл: {file_path}")
             else:
                 QMessageBox.warning(self, "Ошибка", f"Файл не найден: {file_path}")
 
 
-def application():
-    app = QApplication(sys.argv)
-    app.setStyle('Fusion')
+class FirstPaintWatcher(QObject):
+    """Отмечает в профиле запуска первую отрисовку окна и печатает отчёт"""
 
-    login = LoginDialog()
-    if login.exec_() == QDialog.Accepted:
+    def __init__(self, window, profile):
+        super().__init__(window)
+        self.profile = profile
+        self.shown = time.perf_counter()
+        window.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            self.profile.add("до первой отрисовки", time.perf_counter() - self.shown)
+            # Отчёт - после отложенных этапов запуска
+            QTimer.singleShot(0, self.profile.report)
+        return False
+
+
+def application():
+    parser = argparse.ArgumentParser(description="Планировщик задач")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="вывести время этапов запуска до первой отрисовки окна")
+    # Остальные аргументы достаются Qt
+    args, qt_args = parser.parse_known_args()
+    profile = StartupProfile(args.profile_startup, started=_IMPORT_STARTED)
+    profile.add("импорт PyQt5", _QT_IMPORTED - _IMPORT_STARTED)
+    profile.add("импорт модулей приложения", _IMPORTED - _QT_IMPORTED)
+
+    with profile.phase("QApplication"):
+        app = QApplication(sys.argv[:1] + qt_args)
+        app.setStyle('Fusion')
+
+    with profile.phase("диалог входа"):
+        login = LoginDialog()
+    with profile.waiting():
+        accepted = login.exec_() == QDialog.Accepted
+    if accepted:
         if login.username.text():
-            window = Window(login.username.text())
-            window.show()
+            window = Window(login.username.text(), profile)
+            with profile.phase("показ окна"):
+                window.show()
+            if profile.enabled:
+                FirstPaintWatcher(window, profile)
             sys.exit(app.exec_())
         else:
             QMessageBox.warning(None, 'Ошибка', 'Введите имя пользователя')
@@ -0,0 +1,161 @@
+"""Нагрузочный тест сервиса задач: много пользователей одновременно.
+
+Без --url сервис запускается в этом же процессе на свободном порту с
+данными во временном каталоге.
+
+Пример:
+    python load_test.py --users 300 --requests 50
+    python load_test.py --url http://127.0.0.1:8765/rpc --users 500
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import urllib.parse
+from datetime import date, timedelta
+
+import task_service
+
+
+class Client:
+    """Один пользователь: постоянное соединение и последовательные запросы"""
+
+    def __init__(self, host, port, path, user):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.user = user
+        self.reader = None
+        self.writer = None
+        self.next_id = 0
+
+    async def call(self, method, **params):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.next_id += 1
+        params['user'] = self.user
+        body = json.dumps({'jsonrpc': '2.0', 'id': self.next_id, 'method': method,
+                           'params': params}, ensure_ascii=False).encode('utf-8')
+        self.writer.write(f"POST {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                          f"Content-Type: application/json\r\n"
+                          f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+        await self.writer.drain()
+
+        await self.reader.readline()
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+        payload = json.loads(await self.reader.readexactly(length))
+        if 'error' in payload:
+            raise RuntimeError(f"{method}: {payload['error']['message']}")
+        return payload['result']
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def make_task(user, index):
+    return {
+        'title': f"Задача {index} пользователя {user}",
+        'description': f"Описание задачи {index}",
+        'due_date': (date.today() + timedelta(days=random.randint(-10, 30))).isoformat(),
+        'subtasks': [f"Подзадача {index}.{i}" for i in range(3)],
+    }
+
+
+async def simulate_user(client, args, latencies, errors):
+    """Заполняет задачи пользователя и выполняет смесь запросов"""
+    await client.call('replace_all', tasks=[make_task(client.user, i) for i in range(args.tasks)])
+    ids = await client.call('query')
+    for _ in range(args.requests):
+        roll = random.random()
+        if roll < 0.4:
+            method, params = 'list_tasks', {'offset': 0, 'limit': 50}
+        elif roll < 0.6:
+            method, params = 'search', {'query': f"задача {random.randint(0, args.tasks)}"}
+        elif roll < 0.8:
+            method, params = 'get_task', {'id': random.choice(ids)}
+        elif roll < 0.95:
+            method, params = 'update_task', {'id': random.choice(ids),
+                                             'changes': {'completed': random.random() < 0.5}}
+        else:
+            method, params = 'put_task', {'task': make_task(client.user, len(ids))}
+        started = time.perf_counter()
+        try:
+            result = await client.call(method, **params)
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.setdefault(method, []).append(time.perf_counter() - started)
+        if method == 'put_task':
+            ids.append(result['id'])
+
+
+def report(latencies, elapsed, errors):
+    total = sum(len(timings) for timings in latencies.values())
+    print(f"Запросов: {total} за {elapsed:.2f} с, {total / elapsed:.0f} в секунду, ошибок: {len(errors)}")
+    for method, timings in sorted(latencies.items()):
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1] if len(timings) > 1 else timings[0]
+        print(f"    {method:<12} {len(timings):6} медиана {statistics.median(timings) * 1000:7.2f} мс"
+              f"  p95 {p95 * 1000:7.2f} мс  максимум {timings[-1] * 1000:7.2f} мс")
+    for message in errors[:10]:
+        print(f"    ошибка: {message}")
+
+
+async def run(args):
+    server = service = None
+    if args.url:
+        parts = urllib.parse.urlsplit(args.url)
+        host, port, path = parts.hostname, parts.port or 80, parts.path or '/rpc'
+    else:
+        data_dir = tempfile.mkdtemp(prefix='task_service_')
+        service = task_service.TaskService(data_dir, max_users=args.max_users)
+        server = await task_service.serve(service, '127.0.0.1', 0)
+        host, path = '127.0.0.1', '/rpc'
+        port = server.sockets[0].getsockname()[1]
+
+    clients = [Client(host, port, path, f"user{i}") for i in range(args.users)]
+    latencies, errors = {}, []
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(simulate_user(client, args, latencies, errors)
+                               for client in clients))
+    finally:
+        elapsed = time.perf_counter() - started
+        for client in clients:
+            client.close()
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+            await service.close()
+    report(latencies, elapsed, errors)
+    return not errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервиса задач")
+    parser.add_argument('--url', help="адрес работающего сервиса; без него сервис запускается здесь")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--requests', type=int, default=50, help="запросов на пользователя")
+    parser.add_argument('--tasks', type=int, default=100, help="задач у каждого пользователя")
+    parser.add_argument('--max-users', type=int, default=256,
+                        help="размер LRU пользователей встроенного сервиса")
+    args = parser.parse_args()
+    random.seed(0)
+    if not asyncio.run(run(args)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Связь Qt-независимой модели задач с виджетами: сроки в виде QDate."""
+from PyQt5.QtCore import QDate
+
+from task_model import Task
+
+QT_EPOCH_JULIAN_DAY = QDate(1970, 1, 1).toJulianDay()
+
+
+def qdate_from_epoch_day(day):
+    return QDate.fromJulianDay(day + QT_EPOCH_JULIAN_DAY)
+
+
+def epoch_day_from_qdate(value):
+    return value.toJulianDay() - QT_EPOCH_JULIAN_DAY
+
+
+class QtTask(Task):
+    """Задача, срок которой окна читают и задают как QDate"""
+    __slots__ = ()
+
+    def __init__(self, title, description, due_date, notifications=None, subtasks=None, attachments=None,
+                 completed=False, skipped=False, task_id=None, recurrence=None):
+        super().__init__(title, description, epoch_day_from_qdate(due_date), notifications,
+                         subtasks, attachments, completed, skipped, task_id, recurrence)
+
+    @property
+    def due_date(self):
+        return qdate_from_epoch_day(self.due_day)
+
+    @due_date.setter
+    def due_date(self, value):
+        self.due_day = epoch_day_from_qdate(value)
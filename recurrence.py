@@ -0,0 +1,279 @@
+"""Повторяющиеся задачи: правила RRULE и ленивый перебор повторений.
+
+Дни здесь - числа дней от 01.01.1970, как срок задачи в task_model.
+"""
+import calendar
+from datetime import date
+from functools import lru_cache
+from itertools import takewhile
+
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY', 'YEARLY')
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+WEEKDAY_NAMES = ('пн', 'вт', 'ср', 'чт', 'пт', 'сб', 'вс')
+
+# Отметки отдельных повторений
+COMPLETED = 'completed'
+SKIPPED = 'skipped'
+
+# Сколько периодов подряд без единого повторения считаются признаком
+# правила, которое больше ничего не даст (например, 31-е число раз в год в феврале)
+MAX_EMPTY_PERIODS = 400
+
+
+def _date(day):
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def _day(value):
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+# Последний день, который ещё представим датой: повторения правила с большим
+# INTERVAL после него просто заканчиваются
+MAX_DAY = _day(date.max)
+
+
+class Rule:
+    """Разобранное правило повторения - подмножество RRULE из RFC 5545.
+
+    Поддерживаются FREQ=DAILY|WEEKLY|MONTHLY|YEARLY, INTERVAL, BYDAY для
+    WEEKLY (дни недели без номеров), BYMONTHDAY для MONTHLY (1..31), UNTIL
+    и COUNT. Правило не зависит от дня начала, поэтому задачи с одинаковым
+    правилом делят один объект (см. parse_rule).
+    """
+    __slots__ = ('freq', 'interval', 'byday', 'bymonthday', 'until', 'count', 'text')
+
+    def __init__(self, freq, interval=1, byday=(), bymonthday=(), until=None, count=None):
+        self.freq = freq
+        self.interval = interval
+        self.byday = tuple(sorted(set(byday)))
+        self.bymonthday = tuple(sorted(set(bymonthday)))
+        self.until = until
+        self.count = count
+
+        parts = [f"FREQ={freq}"]
+        if interval != 1:
+            parts.append(f"INTERVAL={interval}")
+        if self.byday:
+            parts.append("BYDAY=" + ','.join(WEEKDAYS[weekday] for weekday in self.byday))
+        if self.bymonthday:
+            parts.append("BYMONTHDAY=" + ','.join(map(str, self.bymonthday)))
+        if until is not None:
+            parts.append(f"UNTIL={_date(until).strftime('%Y%m%d')}")
+        if count is not None:
+            parts.append(f"COUNT={count}")
+        self.text = ';'.join(parts)
+
+    def __str__(self):
+        return self.text
+
+    def describe(self):
+        """Правило словами для списка задач"""
+        single, plural = {
+            'DAILY': ("каждый день", "дн."), 'WEEKLY': ("каждую неделю", "нед."),
+            'MONTHLY': ("каждый месяц", "мес."), 'YEARLY': ("каждый год", "г."),
+        }[self.freq]
+        text = single if self.interval == 1 else f"каждые {self.interval} {plural}"
+        if self.byday:
+            text += " (" + ', '.join(WEEKDAY_NAMES[weekday] for weekday in self.byday) + ")"
+        if self.bymonthday:
+            text += " (" + ', '.join(map(str, self.bymonthday)) + " числа)"
+        if self.until is not None:
+            text += f", до {_date(self.until).strftime('%d.%m.%Y')}"
+        if self.count is not None:
+            text += f", {self.count} раз"
+        return text
+
+    def occurrences(self, start, since=None):
+        """Дни повторений по порядку: первый - не раньше start, все - не раньше since.
+
+        Генератор ленивый и не перебирает повторения до since, если их
+        число не нужно для COUNT, поэтому задача, повторяющаяся годами,
+        не замедляет выборку по узкому диапазону дат.
+        """
+        since = start if since is None or since < start else since
+        if self.until is not None and since > self.until:
+            return
+        generate = {'DAILY': self._daily, 'WEEKLY': self._weekly,
+                    'MONTHLY': self._monthly, 'YEARLY': self._yearly}[self.freq]
+        for index, day in generate(start, since):
+            if self.until is not None and day > self.until:
+                return
+            if self.count is not None and index >= self.count:
+                return
+            yield day
+
+    # Генераторы выдают пары (номер повторения от start, день) для дней не раньше since
+
+    def _daily(self, start, since):
+        index = -(-(since - start) // self.interval)
+        day = start + index * self.interval
+        while day <= MAX_DAY:
+            yield index, day
+            index += 1
+            day += self.interval
+
+    def _weekly(self, start, since):
+        byday = self.byday or (_date(start).weekday(),)
+        monday = start - _date(start).weekday()
+        # Неделя, с которой начинается перебор, и число повторений до неё
+        week = (since - monday) // 7
+        week -= week % self.interval
+        if week:
+            first_week = sum(1 for weekday in byday if monday + weekday >= start)
+            index = first_week + (week // self.interval - 1) * len(byday)
+        else:
+            index = 0
+        while True:
+            base = monday + 7 * week
+            for weekday in byday:
+                day = base + weekday
+                if day > MAX_DAY:
+                    return
+                if day < start:
+                    continue
+                if day >= since:
+                    yield index, day
+                index += 1
+            week += self.interval
+
+    def _monthly(self, start, since):
+        first = _date(start)
+        days = self.bymonthday or (first.day,)
+        month = first.year * 12 + first.month - 1
+        if self.count is None and since > start:
+            # Без COUNT номера повторений не нужны: сразу к месяцу since
+            target = _date(since)
+            skipped = target.year * 12 + target.month - 1 - month
+            month += skipped - skipped % self.interval
+        yield from self._months(start, since, month, days)
+
+    def _yearly(self, start, since):
+        first = _date(start)
+        year = first.year
+        if self.count is None and since > start:
+            skipped = _date(since).year - year
+            year += skipped - skipped % self.interval
+        index, empty = 0, 0
+        while empty < MAX_EMPTY_PERIODS and year <= date.max.year:
+            # 29 февраля бывает не каждый год
+            if first.day <= calendar.monthrange(year, first.month)[1]:
+                empty = 0
+                day = _day(date(year, first.month, first.day))
+                if day >= start:
+                    if day >= since:
+                        yield index, day
+                    index += 1
+            else:
+                empty += 1
+            year += self.interval
+
+    def _months(self, start, since, month, days):
+        index, empty = 0, 0
+        while empty < MAX_EMPTY_PERIODS and month // 12 <= date.max.year:
+            year, month_index = divmod(month, 12)
+            length = calendar.monthrange(year, month_index + 1)[1]
+            base = _day(date(year, month_index + 1, 1)) - 1
+            found = False
+            for month_day in days:
+                if month_day > length:
+                    continue
+                found = True
+                day = base + month_day
+                if day < start:
+                    continue
+                if day >= since:
+                    yield index, day
+                index += 1
+            empty = 0 if found else empty + 1
+            month += self.interval
+
+
+@lru_cache(maxsize=256)
+def parse_rule(text):
+    """Разбирает строку RRULE ("FREQ=WEEKLY;BYDAY=MO,WE"); ValueError, если она не поддерживается"""
+    parts = {}
+    for part in text.strip().upper().removeprefix('RRULE:').split(';'):
+        if not part:
+            continue
+        name, separator, value = part.partition('=')
+        if not separator or not value:
+            raise ValueError(f"Неверная часть правила повторения: {part}")
+        parts[name] = value
+
+    freq = parts.pop('FREQ', None)
+    if freq not in FREQUENCIES:
+        raise ValueError("Правило повторения должно задавать FREQ=DAILY, WEEKLY, MONTHLY или YEARLY")
+    try:
+        interval = int(parts.pop('INTERVAL', 1))
+        count = int(parts['COUNT']) if 'COUNT' in parts else None
+        until = parts.get('UNTIL')
+        until = _day(date(int(until[0:4]), int(until[4:6]), int(until[6:8]))) if until else None
+        bymonthday = [int(value) for value in parts.pop('BYMONTHDAY', '').split(',') if value]
+    except ValueError:
+        raise ValueError("Неверное число или дата в правиле повторения") from None
+    parts.pop('COUNT', None)
+    parts.pop('UNTIL', None)
+    if interval < 1 or (count is not None and count < 1):
+        raise ValueError("INTERVAL и COUNT в правиле повторения должны быть положительными")
+
+    byday = []
+    for value in parts.pop('BYDAY', '').split(','):
+        if not value:
+            continue
+        if value not in WEEKDAYS:
+            raise ValueError(f"Неподдерживаемый день недели в правиле повторения: {value}")
+        byday.append(WEEKDAYS.index(value))
+    if byday and freq != 'WEEKLY':
+        raise ValueError("BYDAY поддерживается только для FREQ=WEEKLY")
+    if bymonthday and (freq != 'MONTHLY' or not all(1 <= value <= 31 for value in bymonthday)):
+        raise ValueError("BYMONTHDAY поддерживается только для FREQ=MONTHLY и чисел 1..31")
+    if parts:
+        raise ValueError(f"Неподдерживаемая часть правила повторения: {', '.join(parts)}")
+    return Rule(freq, interval, byday, bymonthday, until, count)
+
+
+class Recurrence:
+    """Повторение одной задачи: правило, день начала и отметки отдельных повторений.
+
+    overrides - только исключения: день повторения -> COMPLETED или SKIPPED.
+    Срок самой задачи - её ближайшее неотмеченное повторение; отметки
+    повторений раньше него уже не нужны и забываются, поэтому задача,
+    повторяющаяся годами, занимает в хранилище столько же, сколько обычная.
+    """
+    __slots__ = ('rule', 'start', 'overrides')
+
+    def __init__(self, rule, start, overrides=None):
+        self.rule = parse_rule(rule) if isinstance(rule, str) else rule
+        self.start = start
+        self.overrides = overrides if overrides is not None else {}
+
+    def occurrences(self, since=None):
+        return self.rule.occurrences(self.start, since)
+
+    def next_pending(self, since):
+        """Первое неотмеченное повторение не раньше since или None, если их больше нет"""
+        for day in self.occurrences(since):
+            if day not in self.overrides:
+                return day
+        return None
+
+    def forget_before(self, day):
+        """Забывает отметки повторений раньше day"""
+        if any(marked < day for marked in self.overrides):
+            self.overrides = {marked: state for marked, state in self.overrides.items() if marked >= day}
+
+    def rule_from(self, day):
+        """Строка RRULE для оставшихся повторений, если первым из них считать день day.
+
+        Нужна для экспорта: прошедшие повторения уже забыты, поэтому серия
+        выгружается начиная с текущего срока, а COUNT уменьшается на число
+        повторений до него.
+        """
+        rule = self.rule
+        if rule.count is None:
+            return rule.text
+        done = sum(1 for _ in takewhile(lambda occurrence: occurrence < day, self.occurrences()))
+        return Rule(rule.freq, rule.interval, rule.byday, rule.bymonthday, rule.until, rule.count - done).text
@@ -0,0 +1,199 @@
+import heapq
+import itertools
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+# Формат начала строки уведомления: "dd.MM.yyyy HH:mm - текст"
+REMINDER_TIME_FORMAT = "%d.%m.%Y %H:%M"
+
+
+@lru_cache(maxsize=4096)
+def _parse_time_head(head):
+    try:
+        return datetime(int(head[6:10]), int(head[3:5]), int(head[0:2]),
+                        int(head[11:13]), int(head[14:16])).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_reminder_time(notification):
+    """Возвращает время срабатывания уведомления в секундах эпохи или None"""
+    # Строки, созданные окном, всегда начинаются с "dd.MM.yyyy HH:mm";
+    # у многих напоминаний время совпадает, поэтому разбор кэшируется
+    head = notification[:16]
+    if len(head) == 16 and head[2] == head[5] == '.' and head[10] == ' ' and head[13] == ':':
+        at = _parse_time_head(head)
+        if at is not None:
+            return at
+
+    parts = notification.split(maxsplit=2)
+    if len(parts) < 2:
+        return None
+    try:
+        return datetime.strptime(f"{parts[0]} {parts[1]}", REMINDER_TIME_FORMAT).timestamp()
+    except ValueError:
+        return None
+
+
+class Reminder:
+    """Напоминание задачи: исходная строка, заранее разобранное время и
+    отметка о том, что оно уже показано.
+
+    В файле задач напоминания по-прежнему хранятся строками, время из них
+    разбирается один раз при загрузке.
+    """
+    __slots__ = ('at', 'raw', 'shown')
+
+    def __init__(self, raw, at=None, shown=False):
+        self.raw = raw
+        self.at = parse_reminder_time(raw) if at is None else at
+        self.shown = shown
+
+    @property
+    def text(self):
+        """Текст напоминания без даты и времени"""
+        return self.raw.partition(' - ')[2] or self.raw
+
+    def shifted(self, days):
+        """Напоминание на days дней позже - для следующего повторения задачи"""
+        if self.at is None:
+            return self
+        moved = datetime.fromtimestamp(self.at) + timedelta(days=days)
+        # Дата и время - первые два слова строки, остальное остаётся как было
+        rest = self.raw.split(maxsplit=2)[2:]
+        return Reminder(' '.join([moved.strftime(REMINDER_TIME_FORMAT), *rest]), moved.timestamp())
+
+
+class ReminderQueue:
+    """Очередь напоминаний, упорядоченная по времени срабатывания.
+
+    Очередь хранит объекты Reminder с уже разобранным временем. Записи
+    изменённой или удалённой задачи не ищутся в куче, а устаревают: у каждой
+    задачи есть номер версии, и записи со старым номером пропускаются при
+    извлечении. Когда устаревших записей становится больше половины, куча
+    пересобирается.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._versions = {}
+        self._counts = {}
+        self._stale = 0
+        self._order = itertools.count()
+
+    def __len__(self):
+        return len(self._heap) - self._stale
+
+    def schedule(self, task_id, reminders):
+        """Заменяет все напоминания задачи новыми"""
+        version = self._retire(task_id) + 1
+        self._versions[task_id] = version
+        for reminder in reminders:
+            self._push(task_id, version, reminder)
+
+    def add(self, task_id, reminder):
+        """Добавляет одно напоминание к уже запланированным напоминаниям задачи"""
+        version = self._versions.setdefault(task_id, 1)
+        self._push(task_id, version, reminder)
+
+    def remove(self, task_id):
+        """Снимает все напоминания задачи"""
+        # Версия не сбрасывается, иначе старые записи снова стали бы актуальными
+        self._versions[task_id] = self._retire(task_id) + 1
+
+    def next_time(self):
+        """Время ближайшего напоминания или None, если очередь пуста"""
+        while self._heap and self._is_stale(self._heap[0]):
+            heapq.heappop(self._heap)
+            self._stale -= 1
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Извлекает напоминания со временем не позже now: пары (id задачи, Reminder)"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            if self._is_stale(entry):
+                self._stale -= 1
+                continue
+            _, _, task_id, _, reminder = entry
+            self._counts[task_id] -= 1
+            due.append((task_id, reminder))
+        return due
+
+    def _push(self, task_id, version, reminder):
+        if reminder.at is None:
+            return
+        heapq.heappush(self._heap, (reminder.at, next(self._order), task_id, version, reminder))
+        self._counts[task_id] = self._counts.get(task_id, 0) + 1
+
+    def _retire(self, task_id):
+        """Помечает записи задачи устаревшими и возвращает её прежнюю версию"""
+        self._stale += self._counts.pop(task_id, 0)
+        if self._stale > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if not self._is_stale(entry, task_id)]
+            heapq.heapify(self._heap)
+            self._stale = 0
+        return self._versions.get(task_id, 0)
+
+    def _is_stale(self, entry, retired_id=None):
+        task_id, version = entry[2], entry[3]
+        return task_id == retired_id or self._versions.get(task_id) != version
+
+
+class ReminderScheduler:
+    """Планирование напоминаний задач без привязки к таймерам и окнам.
+
+    Решает, какие напоминания ещё ждут показа, и выдаёт сработавшие;
+    показывать их, отмечать показанными и взводить таймер - дело
+    вызывающего кода. Напоминания выполненных и пропущенных задач не
+    показываются, а показанное напоминание не мешает остальным напоминаниям
+    той же задачи. get_task возвращает задачу по id или None, если её уже нет.
+    """
+
+    def __init__(self, get_task):
+        self.get_task = get_task
+        self.queue = ReminderQueue()
+
+    def tasks_added(self, tasks):
+        for task in tasks:
+            if self.is_pending(task):
+                self.queue.schedule(task.id, self.waiting(task))
+
+    def task_changed(self, task):
+        """Перепланирует напоминания задачи после изменения её статуса или уведомлений"""
+        if self.is_pending(task):
+            self.queue.schedule(task.id, self.waiting(task))
+        else:
+            self.queue.remove(task.id)
+
+    def notification_added(self, task, reminder):
+        """Возвращает True, если напоминание поставлено в очередь"""
+        if self.is_pending(task):
+            self.queue.add(task.id, reminder)
+            return True
+        return False
+
+    def task_removed(self, task):
+        self.queue.remove(task.id)
+
+    def next_time(self):
+        return self.queue.next_time()
+
+    def pop_due(self, now):
+        """Сработавшие к моменту now напоминания ещё ждущих задач: пары (задача, Reminder)"""
+        due = []
+        for task_id, reminder in self.queue.pop_due(now):
+            task = self.get_task(task_id)
+            if task is not None and self.is_pending(task) and not reminder.shown:
+                due.append((task, reminder))
+        return due
+
+    @staticmethod
+    def is_pending(task):
+        return not (task.completed or task.skipped)
+
+    @staticmethod
+    def waiting(task):
+        """Ещё не показанные напоминания задачи"""
+        return [reminder for reminder in task.reminders if not reminder.shown]
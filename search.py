@@ -0,0 +1,122 @@
+import re
+from bisect import bisect_left
+
+_TOKEN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """Слова текста без учёта регистра; "ё" не отличается от "е" """
+    return _TOKEN.findall(text.casefold().replace('ё', 'е'))
+
+
+class SearchIndex:
+    """Обратный индекс для поиска задач по словам и их началам.
+
+    Каждой задаче при первом добавлении выдаётся номер; для каждого слова
+    хранится множество номеров задач, где оно встречается, а все слова - в
+    отсортированном списке, так что слова с заданным началом занимают в нём
+    непрерывный отрезок. Изменение задачи пересчитывает только её слова.
+    Результаты поиска идут в порядке добавления задач в индекс.
+
+    Список слов досортировывается при поиске, а не при каждом добавлении:
+    иначе загрузка многих задач тратила бы время на вставки в середину.
+    """
+
+    def __init__(self):
+        self._postings = {}
+        self._words = []
+        self._new_words = []
+        self._removed_words = 0
+        self._docs = []
+        self._doc_numbers = {}
+        self._doc_words = {}
+
+    def __len__(self):
+        return len(self._doc_numbers)
+
+    def update(self, task, texts):
+        """Индексирует задачу заново по её текстам"""
+        doc = self._doc_numbers.get(task)
+        if doc is None:
+            doc = self._doc_numbers[task] = len(self._docs)
+            self._docs.append(task)
+        words = frozenset(tokenize('\n'.join(texts)))
+        old = self._doc_words.get(doc)
+        if old:
+            for word in old - words:
+                self._discard(word, doc)
+            words_added = words - old
+        else:
+            words_added = words
+        for word in words_added:
+            docs = self._postings.get(word)
+            if docs is None:
+                docs = self._postings[word] = set()
+                self._new_words.append(word)
+            docs.add(doc)
+        self._doc_words[doc] = words
+
+    def remove(self, task):
+        doc = self._doc_numbers.pop(task, None)
+        if doc is None:
+            return
+        self._docs[doc] = None
+        for word in self._doc_words.pop(doc):
+            self._discard(word, doc)
+
+    def search(self, query):
+        """Задачи, где каждое слово запроса - начало какого-нибудь их слова"""
+        total = len(self._doc_numbers)
+        result = None
+        for prefix in set(tokenize(query)):
+            docs = self._prefixed(prefix, total)
+            # Совпадение со всеми задачами ничего не отсекает
+            if len(docs) == total:
+                continue
+            result = docs if result is None else result & docs
+            if not result:
+                return []
+        if result is None:
+            if len(self._docs) == total:
+                return list(self._docs)
+            return [task for task in self._docs if task is not None]
+        return [self._docs[doc] for doc in sorted(result)]
+
+    def matches(self, task, query):
+        """Подходит ли одна задача под запрос; без обхода всего индекса"""
+        words = self._doc_words.get(self._doc_numbers.get(task), ())
+        return all(any(word.startswith(prefix) for word in words)
+                   for prefix in tokenize(query))
+
+    def _prefixed(self, prefix, total):
+        """Номера задач со словами, начинающимися с prefix; результат не изменять"""
+        if self._removed_words:
+            self._words = sorted(self._postings)
+            self._new_words = []
+            self._removed_words = 0
+        elif self._new_words:
+            self._words.extend(self._new_words)
+            self._words.sort()
+            self._new_words = []
+        # Слова с общим началом идут в отсортированном списке подряд
+        start = bisect_left(self._words, prefix)
+        end = bisect_left(self._words, prefix + '\U0010ffff', start)
+        postings = [self._postings[word] for word in self._words[start:end]]
+        if not postings:
+            return set()
+        largest = max(postings, key=len)
+        if len(postings) == 1 or len(largest) == total:
+            return largest
+        docs = set(largest)
+        for posting in postings:
+            docs |= posting
+            if len(docs) == total:
+                break
+        return docs
+
+    def _discard(self, word, doc):
+        docs = self._postings[word]
+        docs.discard(doc)
+        if not docs:
+            del self._postings[word]
+            self._removed_words += 1
@@ -0,0 +1,54 @@
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Время этапов запуска приложения (python kurs_4.py --profile-startup).
+
+    Выключенный профиль ничего не замеряет, поэтому окно создаёт его всегда
+    и не проверяет режим в каждом этапе.
+    """
+
+    def __init__(self, enabled=False, started=None):
+        self.enabled = enabled
+        self.started = time.perf_counter() if started is None else started
+        self.phases = []
+        # Время, которое не относится к запуску: ожидание ввода в диалоге входа
+        self.waited = 0.0
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - started))
+
+    @contextmanager
+    def waiting(self):
+        """Время внутри блока не входит в общее время запуска"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.waited += time.perf_counter() - started
+
+    def add(self, name, seconds):
+        if self.enabled:
+            self.phases.append((name, seconds))
+
+    def report(self, file=None):
+        """Печатает этапы и общее время от started до текущего момента без ожидания ввода"""
+        if not self.enabled:
+            return
+        file = file or sys.stderr
+        width = max(len(name) for name, _ in self.phases) if self.phases else 0
+        print("Запуск по этапам:", file=file)
+        for name, seconds in self.phases:
+            print(f"    {name:<{width}} {seconds * 1000:9.1f} мс", file=file)
+        total = time.perf_counter() - self.started - self.waited
+        print(f"    {'всего':<{width}} {total * 1000:9.1f} мс", file=file)
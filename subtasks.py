@@ -0,0 +1,229 @@
+"""Иерархические подзадачи без зависимостей от Qt.
+
+Подзадача - запись с id, названием, отметкой о выполнении и вложенными
+подзадачами. Раньше подзадачи хранились списком строк, а выполненные
+отмечались в названии как "[x] ..."; такие списки читаются как есть и
+при следующей записи сохраняются в новом виде.
+"""
+from task_store import new_task_id
+
+# Отметка выполнения в старых строковых подзадачах и в текстовом виде дерева
+DONE_PREFIX = '[x] '
+OPEN_PREFIX = '[ ] '
+INDENT = '  '
+
+
+def _new_id():
+    # id различает подзадачи только внутри одной задачи
+    return new_task_id()[:12]
+
+
+class Subtask:
+    """Узел дерева подзадач.
+
+    total и done_count - число всех и выполненных подзадач под узлом на
+    любой глубине. Они поддерживаются SubtaskTree при каждом изменении
+    подъёмом по цепочке предков, поэтому "12/40" у родителя не требует
+    обхода его поддерева.
+    """
+    __slots__ = ('id', 'title', 'done', 'children', 'parent', 'row', 'total', 'done_count')
+
+    def __init__(self, title, done=False, subtask_id=None):
+        self.id = subtask_id or _new_id()
+        self.title = title
+        self.done = done
+        self.children = []
+        self.parent = None
+        # Номер среди детей родителя: модель дерева находит строку узла без поиска
+        self.row = 0
+        self.total = 0
+        self.done_count = 0
+
+    def to_data(self):
+        data = {'id': self.id, 'title': self.title, 'done': self.done}
+        if self.children:
+            data['children'] = [child.to_data() for child in self.children]
+        return data
+
+
+def _parse(item):
+    """Словарь подзадачи или строка старого формата -> (id, название, выполнена, дети)"""
+    if isinstance(item, str):
+        if item.startswith(DONE_PREFIX):
+            return None, item[len(DONE_PREFIX):], True, ()
+        if item.startswith(OPEN_PREFIX):
+            return None, item[len(OPEN_PREFIX):], False, ()
+        return None, item, False, ()
+    return item.get('id'), item['title'], bool(item.get('done')), item.get('children') or ()
+
+
+def _data_titles(items):
+    for item in items:
+        _, title, _, children = _parse(item)
+        yield title
+        yield from _data_titles(children)
+
+
+class SubtaskTree:
+    """Подзадачи одной задачи.
+
+    Узлы создаются из сохранённых данных при первом обращении к дереву:
+    большинство задач после загрузки так и не открывают, и для них в
+    памяти остаётся только прочитанный список. Поиск и запись таких задач
+    работают прямо с этим списком.
+    """
+    __slots__ = ('_data', '_root')
+
+    def __init__(self, data=None):
+        self._data = list(data) if data else []
+        self._root = None
+
+    @property
+    def root(self):
+        """Невидимый корень: его дети - подзадачи верхнего уровня, счётчики - по всей задаче"""
+        if self._root is None:
+            self._root = Subtask(None, subtask_id='')
+            self._build(self._root, self._data)
+            self._data = None
+        return self._root
+
+    @property
+    def roots(self):
+        return self.root.children
+
+    def __len__(self):
+        if self._root is None:
+            return sum(1 for _ in _data_titles(self._data))
+        return self._root.total
+
+    def __bool__(self):
+        return bool(self._data) if self._root is None else bool(self._root.children)
+
+    def titles(self):
+        """Названия всех подзадач - для поиска"""
+        if self._root is None:
+            return list(_data_titles(self._data))
+        return [node.title for node in self.walk()]
+
+    def walk(self, node=None):
+        """Узлы поддерева node (по умолчанию - всего дерева) в порядке обхода в глубину"""
+        stack = list(reversed((node or self.root).children))
+        while stack:
+            current = stack.pop()
+            yield current
+            stack.extend(reversed(current.children))
+
+    def add(self, title, parent=None, done=False):
+        """Добавляет подзадачу в конец детей parent (None - на верхний уровень)"""
+        parent = parent or self.root
+        node = Subtask(title, done)
+        self._attach(parent, node)
+        self._propagate(parent, 1, int(done))
+        return node
+
+    def set_done(self, node, done):
+        if node.done == done:
+            return
+        node.done = done
+        self._propagate(node.parent, 0, 1 if done else -1)
+
+    def find(self, subtask_id):
+        """Узел с id subtask_id ('' - невидимый корень) или None"""
+        if subtask_id == '':
+            return self.root
+        return next((node for node in self.walk() if node.id == subtask_id), None)
+
+    def insert(self, data, parent=None, row=None):
+        """Вставляет подзадачу из словаря to_data() вместе с её детьми на место row"""
+        parent = parent or self.root
+        holder = Subtask(None)
+        self._build(holder, [data])
+        node = holder.children[0]
+        row = len(parent.children) if row is None else min(row, len(parent.children))
+        node.parent = parent
+        parent.children.insert(row, node)
+        self._renumber(parent, row)
+        self._propagate(parent, 1 + node.total, int(node.done) + node.done_count)
+        return node
+
+    def remove(self, node):
+        """Убирает подзадачу вместе с её детьми"""
+        parent = node.parent
+        del parent.children[node.row]
+        self._renumber(parent, node.row)
+        self._propagate(parent, -1 - node.total, -int(node.done) - node.done_count)
+        node.parent = None
+
+    def ancestors(self, node):
+        """Предки узла снизу вверх, без невидимого корня"""
+        parent = node.parent
+        while parent is not None and parent is not self._root:
+            yield parent
+            parent = parent.parent
+
+    def to_data(self):
+        """Список для Task.to_dict; новый при каждом вызове, как копия для фоновой записи"""
+        if self._root is None:
+            return list(self._data)
+        return [child.to_data() for child in self._root.children]
+
+    def to_lines(self):
+        """Текстовый вид дерева: строка на подзадачу, отступ - вложенность, "[x] " - выполнена"""
+        lines = []
+
+        def visit(nodes, depth):
+            for node in nodes:
+                lines.append(f"{INDENT * depth}{DONE_PREFIX if node.done else OPEN_PREFIX}{node.title}")
+                visit(node.children, depth + 1)
+        visit(self.roots, 0)
+        return lines
+
+    @classmethod
+    def from_lines(cls, lines):
+        """Дерево из текстового вида to_lines(); строки без отметки - невыполненные подзадачи"""
+        tree = cls()
+        # Последний узел на каждой глубине - родитель для следующей, более глубокой строки
+        path = []
+        for line in lines:
+            text = line.lstrip(' ')
+            if not text:
+                continue
+            depth = min((len(line) - len(text)) // len(INDENT), len(path))
+            _, title, done, _ = _parse(text)
+            del path[depth:]
+            path.append(tree.add(title, path[-1] if path else None, done))
+        return tree
+
+    def _build(self, parent, items):
+        total = done_count = 0
+        seen = set()
+        for item in items:
+            subtask_id, title, done, children = _parse(item)
+            if subtask_id in seen:
+                subtask_id = None
+            node = Subtask(title, done, subtask_id)
+            seen.add(node.id)
+            self._attach(parent, node)
+            self._build(node, children)
+            total += 1 + node.total
+            done_count += int(done) + node.done_count
+        parent.total = total
+        parent.done_count = done_count
+
+    @staticmethod
+    def _attach(parent, node):
+        node.parent = parent
+        node.row = len(parent.children)
+        parent.children.append(node)
+
+    @staticmethod
+    def _renumber(parent, start):
+        for row in range(start, len(parent.children)):
+            parent.children[row].row = row
+
+    @staticmethod
+    def _propagate(node, total, done_count):
+        while node is not None:
+            node.total += total
+            node.done_count += done_count
+            node = node.parent
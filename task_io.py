@@ -0,0 +1,556 @@
+"""Импорт и экспорт задач пользователя: CSV, JSONL и iCalendar.
+
+Примеры:
+    python task_io.py export ivan tasks.csv
+    python task_io.py import ivan tasks.jsonl --batch-size 5000
+    python task_io.py import ivan calendar.ics --data-dir /var/lib/tasks
+
+Формат определяется по расширению файла или задаётся --format. Файлы
+читаются и пишутся потоково, по одной записи. Импорт добавляет задачи к уже
+существующим (задача с тем же id заменяется) и пишет их в хранилище пачками
+по --batch-size: одна пачка - одна транзакция SQLite или одна запись журнала.
+
+Память не зависит от числа задач только с хранилищем SQLite (TASK_STORAGE=
+sqlite). Хранилища со снимком (JSON и двоичное) держат в памяти JSON-текст
+каждой прочитанной или записанной задачи: из него свёртка пишет новый
+снимок, поэтому при импорте они сначала читают все уже сохранённые задачи.
+
+В iCalendar задача - это VTODO, её напоминания - вложенные VALARM, а
+подзадачи - отдельные VTODO со ссылкой RELATED-TO на задачу или
+родительскую подзадачу.
+
+Повторяющаяся задача выгружается с RRULE начиная с текущего срока: в
+iCalendar это DTSTART и DUE, а отмеченные будущие повторения - EXDATE и при
+импорте становятся пропущенными; в CSV правило пишется в столбец recurrence.
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timezone
+
+from recurrence import SKIPPED
+from reminders import REMINDER_TIME_FORMAT, parse_reminder_time
+from subtasks import SubtaskTree
+from task_model import Task
+from task_store import JsonTaskStore, RemoteTaskStore, new_task_id, open_store
+
+FORMATS = {'.csv': 'csv', '.jsonl': 'jsonl', '.ndjson': 'jsonl', '.ics': 'ics'}
+
+# Столбцы CSV; списки записываются в ячейку по одному элементу на строку,
+# подзадачи - в текстовом виде SubtaskTree.to_lines() с отступами и "[x] "
+CSV_FIELDS = ('id', 'title', 'description', 'due_date', 'completed', 'skipped',
+              'subtasks', 'notifications', 'attachments', 'recurrence')
+CSV_LIST_FIELDS = ('notifications', 'attachments')
+TRUE_VALUES = {'1', 'true', 'yes', 'да', '+'}
+
+# Сколько задач iCalendar ждут своих подзадач, прежде чем уйти в хранилище
+ICS_WINDOW = 1000
+
+# Как часто печатается ход импорта или экспорта, секунды
+PROGRESS_INTERVAL = 2.0
+
+
+class Progress:
+    """Считает записи и печатает скорость в stderr"""
+
+    def __init__(self, action):
+        self.action = action
+        self.count = 0
+        self.skipped = 0
+        self.started = time.perf_counter()
+        self._reported = self.started
+
+    def add(self, count):
+        self.count += count
+        now = time.perf_counter()
+        if now - self._reported >= PROGRESS_INTERVAL:
+            self._reported = now
+            print(f"    {self.count} задач, {self.count / (now - self.started):.0f} в секунду",
+                  file=sys.stderr)
+
+    def report(self, file=None):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        line = (f"{self.action}: {self.count} задач за {elapsed:.2f} с, "
+                f"{self.count / elapsed:.0f} задач в секунду")
+        if self.skipped:
+            line += f", пропущено записей: {self.skipped}"
+        print(line, file=file or sys.stdout)
+
+
+def open_user_store(username, data_dir):
+    """Хранилище пользователя: как у окна, включая сервис из TASK_SERVICE_URL"""
+    service_url = os.environ.get('TASK_SERVICE_URL')
+    if service_url:
+        return RemoteTaskStore(service_url, username)
+    return open_store(os.path.join(data_dir, f"{username}_tasks.json"))
+
+
+def detect_format(path, name=None):
+    if name:
+        return name
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in FORMATS:
+        raise ValueError(f"Не удалось определить формат файла {path}, укажите --format")
+    return FORMATS[extension]
+
+
+def normalize(record):
+    """Приводит прочитанную запись к словарю Task.to_dict()"""
+    data = dict(record)
+    if not data.get('id'):
+        data['id'] = new_task_id()
+    if not data.get('description'):
+        data['description'] = ''
+    if not data.get('due_date'):
+        data['due_date'] = date.today().isoformat()
+    if not isinstance(data['title'], str) or not data['title']:
+        raise ValueError("у задачи нет названия")
+    task = Task.from_dict(data)
+    if task.recurrence is not None:
+        # Срок повторяющейся задачи - её первое неотмеченное повторение
+        first = task.recurrence.next_pending(task.due_day)
+        if first is None:
+            raise ValueError("правило повторения не даёт повторений начиная со срока")
+        task.recurrence.forget_before(first)
+        task.due_day = first
+    return task.to_dict()
+
+
+def remaining_rule(data):
+    """RRULE оставшихся повторений задачи из словаря или None для обычной задачи"""
+    if not data.get('recurrence'):
+        return None
+    task = Task.from_dict(data)
+    return task.recurrence.rule_from(task.due_day)
+
+
+def parse_date(text):
+    """Дата в формате ISO или dd.MM.yyyy -> ISO"""
+    text = text.strip()
+    if len(text) == 10 and text[2] == text[5] == '.':
+        return datetime.strptime(text, '%d.%m.%Y').date().isoformat()
+    return date.fromisoformat(text).isoformat()
+
+
+# --- JSONL ---
+
+def read_jsonl(f):
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            record = ValueError(f"неверный JSON: {e}")
+        yield number, record
+
+
+def write_jsonl(f, tasks):
+    for data in tasks:
+        f.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+        f.write('\n')
+
+
+# --- CSV ---
+
+def read_csv(f):
+    reader = csv.DictReader(f)
+    missing = {'title', 'due_date'} - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"В CSV нет столбцов: {', '.join(sorted(missing))}")
+    for row in reader:
+        try:
+            record = {'id': row.get('id') or None,
+                      'title': row['title'],
+                      'description': row.get('description') or '',
+                      'due_date': parse_date(row['due_date']) if row['due_date'] else None,
+                      'completed': (row.get('completed') or '').strip().lower() in TRUE_VALUES,
+                      'skipped': (row.get('skipped') or '').strip().lower() in TRUE_VALUES}
+            for field in CSV_LIST_FIELDS:
+                record[field] = [item for item in (row.get(field) or '').splitlines() if item]
+            record['subtasks'] = SubtaskTree.from_lines((row.get('subtasks') or '').splitlines()).to_data()
+            rule = (row.get('recurrence') or '').strip()
+            if rule:
+                # Повторения начинаются со срока задачи
+                record['recurrence'] = {'rule': rule, 'start': record['due_date'] or date.today().isoformat()}
+        except ValueError as e:
+            record = e
+        yield reader.line_num, record
+
+
+def write_csv(f, tasks):
+    writer = csv.writer(f)
+    writer.writerow(CSV_FIELDS)
+    for data in tasks:
+        writer.writerow([data['id'], data['title'], data['description'], data['due_date'],
+                         'true' if data['completed'] else 'false',
+                         'true' if data['skipped'] else 'false',
+                         '\n'.join(SubtaskTree(data['subtasks']).to_lines()), '\n'.join(data['notifications']),
+                         '\n'.join(data['attachments']), remaining_rule(data) or ''])
+
+
+# --- iCalendar ---
+
+_ICS_UNESCAPE = re.compile(r'\\(.)')
+_ICS_ESCAPE = re.compile(r'([\\;,\n])')
+_ICS_ESCAPES = {'n': '\n', 'N': '\n'}
+
+
+def _ics_unescape(value):
+    return _ICS_UNESCAPE.sub(lambda m: _ICS_ESCAPES.get(m.group(1), m.group(1)), value)
+
+
+def _ics_escape(value):
+    return _ICS_ESCAPE.sub(lambda m: '\\n' if m.group(1) == '\n' else '\\' + m.group(1), value)
+
+
+def _ics_fold(line):
+    """Разбивает строку длиннее 75 байт продолжениями, не разрезая символы"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Не режем многобайтный символ UTF-8 посередине
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ics_lines(f):
+    """Логические строки iCalendar с номерами: продолжения склеиваются"""
+    current, number = None, 0
+    for line_number, line in enumerate(f, 1):
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t') and current is not None:
+            current += line[1:]
+            continue
+        if current is not None:
+            yield number, current
+        current, number = line, line_number
+    if current is not None:
+        yield number, current
+
+
+def _ics_property(line):
+    """Разбирает строку "ИМЯ;ПАРАМ=ЗНАЧ:значение" в (имя, параметры, значение)"""
+    colon = line.find(':')
+    if colon < 0:
+        return None, {}, ''
+    if line.find('"', 0, colon) >= 0:
+        # Двоеточие может стоять внутри значения параметра в кавычках
+        quoted = False
+        for index, char in enumerate(line):
+            if char == '"':
+                quoted = not quoted
+            elif char == ':' and not quoted:
+                colon = index
+                break
+    head, value = line[:colon], line[colon + 1:]
+    if ';' not in head:
+        return head.upper(), {}, value
+    name, *params = head.split(';')
+    parameters = {}
+    for param in params:
+        key, _, param_value = param.partition('=')
+        parameters[key.upper()] = param_value.strip('"')
+    return name.upper(), parameters, value
+
+
+def _ics_date(value):
+    """Дата из DATE или DATE-TIME iCalendar в формате ISO"""
+    return date(int(value[0:4]), int(value[4:6]), int(value[6:8])).isoformat()
+
+
+def _ics_trigger_time(value, parameters):
+    """Абсолютное время TRIGGER в секундах эпохи или None для относительного"""
+    if parameters.get('VALUE', '').upper() != 'DATE-TIME':
+        return None
+    moment = datetime(int(value[0:4]), int(value[4:6]), int(value[6:8]),
+                      int(value[9:11]), int(value[11:13]), int(value[13:15]))
+    if value.endswith('Z'):
+        return moment.replace(tzinfo=timezone.utc).timestamp()
+    return moment.timestamp()
+
+
+def _iter_vtodos(f):
+    """Выдаёт VTODO файла парами (номер строки, запись задачи)"""
+    todo = alarm = None
+    depth = 0
+    no_parameters = {}
+    for number, line in _ics_lines(f):
+        name, _, value = line.partition(':')
+        if ';' in name:
+            name, parameters, value = _ics_property(line)
+        else:
+            # Большинство строк без параметров: полный разбор не нужен
+            name, parameters = name.upper(), no_parameters
+        if name == 'BEGIN':
+            depth += 1
+            if value.upper() == 'VTODO' and todo is None:
+                todo, todo_number, todo_depth = {
+                    'id': None, 'parent': None, 'title': '', 'description': '', 'due_date': None,
+                    'completed': False, 'skipped': False, 'notifications': [], 'subtasks': [],
+                    'attachments': [], 'rrule': None, 'exdates': []}, number, depth
+            elif value.upper() == 'VALARM' and todo is not None:
+                alarm = {'description': None, 'at': None}
+            continue
+        if name == 'END':
+            if value.upper() == 'VALARM' and alarm is not None:
+                if alarm['description'] is not None:
+                    todo['notifications'].append(alarm['description'])
+                elif alarm['at'] is not None:
+                    todo['notifications'].append(
+                        datetime.fromtimestamp(alarm['at']).strftime(REMINDER_TIME_FORMAT))
+                alarm = None
+            elif value.upper() == 'VTODO' and todo is not None and depth == todo_depth:
+                rule, exdates = todo.pop('rrule'), todo.pop('exdates')
+                if rule and todo['due_date']:
+                    todo['recurrence'] = {'rule': rule, 'start': todo['due_date'],
+                                          'overrides': dict.fromkeys(exdates, SKIPPED)}
+                yield todo_number, todo
+                todo = None
+            depth -= 1
+            continue
+        if todo is None:
+            continue
+        try:
+            if alarm is not None:
+                if name == 'DESCRIPTION':
+                    alarm['description'] = _ics_unescape(value)
+                elif name == 'TRIGGER':
+                    alarm['at'] = _ics_trigger_time(value, parameters)
+            elif name == 'UID':
+                todo['id'] = value
+            elif name == 'SUMMARY':
+                todo['title'] = _ics_unescape(value)
+            elif name == 'DESCRIPTION':
+                todo['description'] = _ics_unescape(value)
+            elif name == 'DUE' or (name == 'DTSTART' and todo['due_date'] is None):
+                todo['due_date'] = _ics_date(value)
+            elif name == 'STATUS':
+                todo['completed'] = value.upper() == 'COMPLETED'
+                todo['skipped'] = value.upper() == 'CANCELLED'
+            elif name == 'RELATED-TO' and parameters.get('RELTYPE', 'PARENT').upper() == 'PARENT':
+                todo['parent'] = value
+            elif name == 'RRULE':
+                todo['rrule'] = value
+            elif name == 'EXDATE':
+                todo['exdates'].extend(_ics_date(day) for day in value.split(','))
+            elif name == 'ATTACH':
+                todo['attachments'].append(value[len('file://'):] if value.startswith('file://') else value)
+        except ValueError:
+            # Непонятное значение свойства не мешает прочитать остальную задачу
+            continue
+
+
+def _ics_subtask(uid, todo):
+    """Словарь подзадачи из VTODO; id - часть UID после последнего дефиса, как в write_ics"""
+    return {'id': uid.rpartition('-')[2] or uid, 'title': todo['title'],
+            'done': todo['completed'], 'children': []}
+
+
+def _orphan_tasks(entries):
+    """Подзадачи, задача которых так и не встретилась, становятся отдельными задачами"""
+    for number, todo, subtask in entries:
+        todo['subtasks'] = subtask['children']
+        yield number, todo
+
+
+def read_ics(f, window=ICS_WINDOW):
+    """Задачи из VTODO с деревьями подзадач из связанных VTODO.
+
+    Подзадача может стоять в файле до или после своей задачи или
+    родительской подзадачи, поэтому последние window задач, подзадач и
+    подзадач без родителя придерживаются в памяти. Подзадача, родитель
+    которой так и не встретился поблизости, становится отдельной задачей.
+    """
+    held = OrderedDict()
+    # UID подзадачи -> её словарь, к которому ещё могут прийти дети
+    subtasks = OrderedDict()
+    # UID родителя -> ждущие его подзадачи: (номер строки, VTODO, словарь подзадачи)
+    orphans = OrderedDict()
+
+    for number, todo in _iter_vtodos(f):
+        parent = todo.pop('parent')
+        uid = todo['id'] or new_task_id()
+        todo['id'] = uid
+        if parent is not None and parent != uid:
+            subtask = _ics_subtask(uid, todo)
+            subtask['children'].extend(child for _, _, child in orphans.pop(uid, ()))
+            if parent in held:
+                held[parent][1]['subtasks'].append(subtask)
+            elif parent in subtasks:
+                subtasks[parent]['children'].append(subtask)
+            else:
+                orphans.setdefault(parent, []).append((number, todo, subtask))
+                if len(orphans) > window:
+                    entries = orphans.popitem(last=False)[1]
+                    for _, orphan, _ in entries:
+                        subtasks.pop(orphan['id'], None)
+                    yield from _orphan_tasks(entries)
+            subtasks[uid] = subtask
+            if len(subtasks) > window:
+                subtasks.popitem(last=False)
+            continue
+
+        todo['subtasks'].extend(child for _, _, child in orphans.pop(uid, ()))
+        if uid in held:
+            yield held.pop(uid)
+        held[uid] = (number, todo)
+        if len(held) > window:
+            yield held.popitem(last=False)[1]
+
+    yield from held.values()
+    for entries in orphans.values():
+        yield from _orphan_tasks(entries)
+
+
+def write_ics(f, tasks):
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    write = f.write
+    write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//kurs_4//Планировщик задач//RU\r\n')
+    for data in tasks:
+        status = 'COMPLETED' if data['completed'] else 'CANCELLED' if data['skipped'] else 'NEEDS-ACTION'
+        due = data['due_date'].replace('-', '')
+        lines = ['BEGIN:VTODO', f"UID:{data['id']}", f"DTSTAMP:{stamp}",
+                 f"SUMMARY:{_ics_escape(data['title'])}",
+                 f"DUE;VALUE=DATE:{due}",
+                 f"STATUS:{status}"]
+        rule = remaining_rule(data)
+        if rule is not None:
+            # Повторения в iCalendar отсчитываются от DTSTART
+            lines += [f"DTSTART;VALUE=DATE:{due}", f"RRULE:{rule}"]
+            exdates = [day.replace('-', '') for day in data['recurrence'].get('overrides', ())]
+            if exdates:
+                lines.append(f"EXDATE;VALUE=DATE:{','.join(sorted(exdates))}")
+        if data['description']:
+            lines.append(f"DESCRIPTION:{_ics_escape(data['description'])}")
+        for attachment in data['attachments']:
+            lines.append(f"ATTACH:{attachment}")
+        for notification in data['notifications']:
+            at = parse_reminder_time(notification)
+            if at is None:
+                # Без времени напоминание срабатывает в срок задачи
+                trigger = 'TRIGGER;RELATED=END:PT0S'
+            else:
+                moment = datetime.fromtimestamp(at, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+                trigger = f"TRIGGER;VALUE=DATE-TIME:{moment}"
+            lines += ['BEGIN:VALARM', 'ACTION:DISPLAY', trigger,
+                      f"DESCRIPTION:{_ics_escape(notification)}", 'END:VALARM']
+        lines.append('END:VTODO')
+        tree = SubtaskTree(data['subtasks'])
+        for subtask in tree.walk():
+            parent = data['id'] if subtask.parent is tree.root else f"{data['id']}-{subtask.parent.id}"
+            lines += ['BEGIN:VTODO', f"UID:{data['id']}-{subtask.id}", f"DTSTAMP:{stamp}",
+                      f"RELATED-TO:{parent}", f"SUMMARY:{_ics_escape(subtask.title)}",
+                      f"STATUS:{'COMPLETED' if subtask.done else 'NEEDS-ACTION'}", 'END:VTODO']
+        write(''.join(_ics_fold(line) for line in lines))
+    write('END:VCALENDAR\r\n')
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'ics': read_ics}
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'ics': write_ics}
+
+
+def _open_text(path, mode):
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    # csv и iCalendar сами управляют переводами строк
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def export_tasks(store, path, fmt):
+    progress = Progress("Экспорт")
+
+    def tasks():
+        for batch in store.iter_batches(1000):
+            yield from batch
+            progress.add(len(batch))
+
+    f = _open_text(path, 'w')
+    try:
+        WRITERS[fmt](f, tasks())
+    finally:
+        if f is not sys.stdout:
+            f.close()
+    return progress
+
+
+def import_tasks(store, path, fmt, batch_size=5000, max_errors=20):
+    progress = Progress("Импорт")
+    if isinstance(store, JsonTaskStore):
+        # Свёртка журнала пишет снимок из задач, известных хранилищу, поэтому
+        # оно должно сначала прочитать уже сохранённые задачи; их тексты
+        # остаются в памяти до конца импорта (см. описание модуля)
+        for _ in store.iter_load():
+            pass
+
+    f = _open_text(path, 'r')
+    try:
+        batch = []
+        for number, record in READERS[fmt](f):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                data = normalize(record)
+            except (KeyError, TypeError, ValueError) as e:
+                progress.skipped += 1
+                if progress.skipped <= max_errors:
+                    print(f"Запись в строке {number} пропущена: {e}", file=sys.stderr)
+                continue
+            batch.append((data['id'], data))
+            if len(batch) >= batch_size:
+                store.apply(batch)
+                progress.add(len(batch))
+                batch = []
+        if batch:
+            store.apply(batch)
+            progress.add(len(batch))
+    finally:
+        if f is not sys.stdin:
+            f.close()
+    if store.needs_compaction():
+        store.compact()
+    return progress
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Импорт и экспорт задач: CSV, JSONL, iCalendar")
+    parser.add_argument('command', choices=('import', 'export'))
+    parser.add_argument('username')
+    parser.add_argument('path', help="файл задач; '-' - стандартный ввод или вывод")
+    parser.add_argument('--format', choices=sorted(WRITERS), help="по умолчанию - по расширению файла")
+    parser.add_argument('--data-dir', default='.', help="каталог с файлами задач пользователей")
+    parser.add_argument('--batch-size', type=int, default=5000, help="задач в одной записи хранилища")
+    args = parser.parse_args()
+
+    try:
+        fmt = detect_format(args.path, args.format)
+    except ValueError as e:
+        parser.error(str(e))
+    store = open_user_store(args.username, args.data_dir)
+    try:
+        if args.command == 'export':
+            progress = export_tasks(store, args.path, fmt)
+        else:
+            progress = import_tasks(store, args.path, fmt, max(1, args.batch_size))
+    except (OSError, ValueError, csv.Error) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        sys.exit(1)
+    finally:
+        store.close()
+    # При выводе в stdout отчёт не должен смешиваться с данными
+    progress.report(sys.stderr if args.path == '-' else sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
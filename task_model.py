@@ -0,0 +1,216 @@
+"""Модель задачи без зависимостей от Qt.
+
+Модуль можно импортировать в консольных утилитах и сервисе, где PyQt5 нет
+или он не нужен; окна работают с задачами через qt_tasks.QtTask.
+"""
+import time
+from datetime import date
+from functools import lru_cache
+
+from recurrence import COMPLETED, EPOCH_ORDINAL, SKIPPED, Recurrence
+from reminders import Reminder
+from subtasks import SubtaskTree
+from task_store import new_task_id
+
+# Срок задачи хранится числом дней от 01.01.1970 (EPOCH_ORDINAL)
+
+
+def today_epoch_day():
+    return date.today().toordinal() - EPOCH_ORDINAL
+
+
+# Сроки у множества задач совпадают, поэтому преобразования кэшируются
+@lru_cache(maxsize=4096)
+def epoch_day_from_iso(text):
+    return date.fromisoformat(text).toordinal() - EPOCH_ORDINAL
+
+
+@lru_cache(maxsize=4096)
+def iso_from_epoch_day(day):
+    return date.fromordinal(day + EPOCH_ORDINAL).isoformat()
+
+
+class Task:
+    # Без __dict__ у каждой задачи: при сотнях тысяч задач это заметная экономия памяти
+    __slots__ = ('id', 'title', 'description', 'due_day', 'reminders', 'subtasks',
+                 'attachments', 'completed', 'skipped', 'recurrence')
+
+    def __init__(self, title, description, due_day, notifications=None, subtasks=None, attachments=None,
+                 completed=False, skipped=False, task_id=None, recurrence=None):
+        self.id = task_id or new_task_id()
+        self.title = title
+        self.description = description
+        self.due_day = due_day
+        self.reminders = [Reminder(notification) for notification in notifications or ()]
+        # SubtaskTree; subtasks - список строк или словарей подзадач
+        self.subtasks = SubtaskTree(subtasks)
+        self.attachments = attachments if attachments else []
+        self.completed = completed
+        self.skipped = skipped
+        # Recurrence повторяющейся задачи; её срок - ближайшее неотмеченное повторение
+        self.recurrence = recurrence
+
+    @property
+    def due_text(self):
+        """Срок в формате dd.MM.yyyy"""
+        return date.fromordinal(self.due_day + EPOCH_ORDINAL).strftime('%d.%m.%Y')
+
+    @property
+    def notifications(self):
+        """Строки напоминаний в том виде, в каком они хранятся в файле"""
+        return [reminder.raw for reminder in self.reminders]
+
+    def search_texts(self):
+        """Тексты задачи, по которым работает поиск"""
+        return [self.title, self.description, *self.subtasks.titles(),
+                *(reminder.text for reminder in self.reminders)]
+
+    def set_recurrence(self, rule, start=None):
+        """Делает задачу повторяющейся по правилу rule (строка RRULE) начиная с
+        дня start, по умолчанию - с её срока; rule=None убирает повторение.
+
+        Срок переносится на первое повторение; ValueError, если правило
+        неверно или не даёт ни одного повторения.
+        """
+        if rule is None:
+            self.recurrence = None
+            return
+        start = self.due_day if start is None else start
+        recurrence = Recurrence(rule, start)
+        first = recurrence.next_pending(start)
+        if first is None:
+            raise ValueError("Правило не даёт ни одного повторения начиная с этого срока")
+        self.recurrence = recurrence
+        self.due_day = first
+
+    def set_occurrence_state(self, day, state):
+        """Отмечает повторение day выполненным (COMPLETED), пропущенным (SKIPPED)
+        или снимает отметку (None).
+
+        Отметка текущего повторения переносит срок задачи на следующее
+        неотмеченное, а напоминания - на столько же дней вперёд. Когда
+        повторений больше нет, отмечается сама задача.
+        """
+        recurrence = self.recurrence
+        if day > self.due_day:
+            if state is None:
+                recurrence.overrides.pop(day, None)
+            else:
+                recurrence.overrides[day] = state
+            return
+        if day < self.due_day:
+            return
+        if state is None or self.completed or self.skipped:
+            self.completed = state == COMPLETED
+            self.skipped = state == SKIPPED
+            return
+
+        following = recurrence.next_pending(day + 1)
+        if following is None:
+            self.completed = state == COMPLETED
+            self.skipped = state == SKIPPED
+            return
+        recurrence.forget_before(following)
+        # Сдвинутые напоминания снова ждут показа
+        self.reminders = [reminder.shifted(following - day) for reminder in self.reminders]
+        self.due_day = following
+
+    def assign(self, other):
+        """Переносит в задачу состояние other, сохраняя сам объект: на него ссылаются индексы"""
+        for name in Task.__slots__:
+            setattr(self, name, getattr(other, name))
+
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'due_date': iso_from_epoch_day(self.due_day),
+            # Копии списков: словарь записывается на диск в фоновом потоке
+            'notifications': [reminder.raw for reminder in self.reminders],
+            'subtasks': self.subtasks.to_data(),
+            'attachments': list(self.attachments),
+            'completed': self.completed,
+            'skipped': self.skipped,
+            # Номера уже показанных напоминаний в списке notifications
+            'notifications_shown': [number for number, reminder in enumerate(self.reminders) if reminder.shown]
+        }
+        if self.recurrence is not None:
+            # Только у повторяющихся задач: обычные не становятся длиннее
+            recurrence = self.recurrence
+            data['recurrence'] = {
+                'rule': recurrence.rule.text,
+                'start': iso_from_epoch_day(recurrence.start),
+                'overrides': {iso_from_epoch_day(day): state for day, state in recurrence.overrides.items()},
+            }
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        # Заполняем поля напрямую, минуя __init__: загрузка - самое частое
+        # создание задач, и лишние преобразования здесь заметны
+        task = cls.__new__(cls)
+        task.id = data.get('id') or new_task_id()
+        task.title = data['title']
+        task.description = data['description']
+        task.due_day = epoch_day_from_iso(data['due_date'])
+        task.reminders = [Reminder(notification) for notification in data.get('notifications', ())]
+        task.subtasks = SubtaskTree(data.get('subtasks'))
+        task.attachments = data.get('attachments') or []
+        task.completed = data.get('completed', False)
+        task.skipped = data.get('skipped', False)
+        shown = data.get('notifications_shown')
+        if shown is None:
+            if data.get('notification_shown'):
+                # Прежде показ одного напоминания гасил все остальные; теперь
+                # показанными считаются только те, чьё время уже прошло
+                now = time.time()
+                shown = [number for number, reminder in enumerate(task.reminders)
+                         if reminder.at is not None and reminder.at <= now]
+            else:
+                shown = ()
+        for number in shown:
+            if number < len(task.reminders):
+                task.reminders[number].shown = True
+        recurrence = data.get('recurrence')
+        if recurrence:
+            overrides = {epoch_day_from_iso(day): state
+                         for day, state in recurrence.get('overrides', {}).items()}
+            recurrence = Recurrence(recurrence['rule'], epoch_day_from_iso(recurrence['start']), overrides)
+        task.recurrence = recurrence or None
+        return task
+
+
+class Occurrence:
+    """Будущее повторение задачи в видимом диапазоне дат.
+
+    Создаётся только для показа в списке: хранит ссылку на задачу и день,
+    а отметку о выполнении берёт из исключений её правила.
+    """
+    __slots__ = ('task', 'due_day')
+
+    def __init__(self, task, due_day):
+        self.task = task
+        self.due_day = due_day
+
+    @property
+    def id(self):
+        return f"{self.task.id}@{self.due_day}"
+
+    @property
+    def title(self):
+        return self.task.title
+
+    @property
+    def recurrence(self):
+        return self.task.recurrence
+
+    @property
+    def completed(self):
+        return self.task.recurrence.overrides.get(self.due_day) == COMPLETED
+
+    @property
+    def skipped(self):
+        return self.task.recurrence.overrides.get(self.due_day) == SKIPPED
+
+    due_text = Task.due_text
@@ -0,0 +1,404 @@
+"""Сервис задач без GUI: JSON-RPC поверх HTTP для многих пользователей.
+
+Пример:
+    python task_service.py --data-dir /var/lib/tasks --port 8765
+
+Запрос - POST /rpc с телом {"jsonrpc": "2.0", "id": 1, "method": "list_tasks",
+"params": {"user": "ivan"}}. Окно kurs_4.py работает с сервисом как тонкий
+клиент, если задана переменная окружения TASK_SERVICE_URL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict
+from itertools import islice
+
+from search import SearchIndex
+from task_model import Task, epoch_day_from_iso
+from task_store import BufferedTaskStore, new_task_id, open_store
+
+USERNAME = re.compile(r'^[\w-]{1,64}$')
+MAX_BODY_SIZE = 16 << 20
+
+# Коды ошибок JSON-RPC
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+TASK_NOT_FOUND = -32004
+
+
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class UserSession:
+    """Загруженные задачи одного пользователя и его хранилище.
+
+    Чтение идёт из памяти без блокировок: цикл событий однопоточный, и между
+    await состояние всегда согласовано. Изменения выполняются под lock, чтобы
+    запись в хранилище шла в том же порядке, что и изменения в памяти.
+    """
+
+    def __init__(self, username, store, tasks):
+        self.username = username
+        self.store = store
+        self.tasks = OrderedDict((task.id, task) for task in tasks)
+        self.search_index = SearchIndex()
+        for task in self.tasks.values():
+            self.search_index.update(task, task.search_texts())
+        self.lock = asyncio.Lock()
+        self.closed = False
+
+    def put(self, task):
+        old = self.tasks.get(task.id)
+        if old is not None:
+            self.search_index.remove(old)
+        self.tasks[task.id] = task
+        self.search_index.update(task, task.search_texts())
+        # BufferedTaskStore только ставит запись в очередь фонового потока
+        self.store.put(task.to_dict())
+        self.compact_if_needed()
+
+    def delete(self, task_id):
+        task = self.tasks.pop(task_id)
+        self.search_index.remove(task)
+        self.store.delete(task_id)
+        self.compact_if_needed()
+
+    def replace_all(self, tasks):
+        self.tasks = OrderedDict((task.id, task) for task in tasks)
+        self.search_index = SearchIndex()
+        for task in self.tasks.values():
+            self.search_index.update(task, task.search_texts())
+        self.store.save_all([task.to_dict() for task in self.tasks.values()])
+
+    def compact_if_needed(self):
+        if self.store.needs_compaction():
+            self.store.compact()
+
+
+class TaskService:
+    """Методы JSON-RPC и LRU загруженных хранилищ пользователей.
+
+    В памяти держится не больше max_users пользователей; давно не
+    использованный выгружается, его хранилище дописывает очередь и
+    закрывается; новый запрос этого пользователя открывает хранилище заново
+    только после этого. Чтение файлов и закрытие хранилищ идут в пуле потоков,
+    чтобы не останавливать цикл событий.
+    """
+
+    def __init__(self, data_dir, max_users=256):
+        self.data_dir = data_dir
+        self.max_users = max_users
+        self._sessions = OrderedDict()
+        self._loading = {}
+        # Выгруженные сессии, хранилища которых ещё дописывают очередь
+        self._closing = {}
+        self.methods = {
+            'list_tasks': self.list_tasks,
+            'get_task': self.get_task,
+            'put_task': self.put_task,
+            'update_task': self.update_task,
+            'delete_task': self.delete_task,
+            'apply': self.apply,
+            'replace_all': self.replace_all,
+            'query': self.query,
+            'search': self.search,
+        }
+
+    async def session(self, user):
+        if not isinstance(user, str) or not USERNAME.match(user):
+            raise RpcError(INVALID_PARAMS, f"Недопустимое имя пользователя: {user!r}")
+        session = self._sessions.get(user)
+        if session is not None:
+            self._sessions.move_to_end(user)
+            return session
+
+        # Одновременные запросы одного пользователя ждут одну загрузку
+        loading = self._loading.get(user)
+        if loading is None:
+            loading = self._loading[user] = asyncio.ensure_future(self._load(user))
+            loading.add_done_callback(lambda _: self._loading.pop(user, None))
+        return await asyncio.shield(loading)
+
+    async def _load(self, user):
+        data_file = os.path.join(self.data_dir, f"{user}_tasks.json")
+        closing = self._closing.get(user)
+        if closing is not None:
+            # Выгруженное хранилище ещё не записало свои изменения: открытое
+            # заново прочитало бы файлы без них
+            await asyncio.shield(closing)
+
+        def load():
+            store = BufferedTaskStore(open_store(data_file))
+            return store, [Task.from_dict(data) for data in store.load()]
+
+        store, tasks = await asyncio.to_thread(load)
+        session = self._sessions[user] = UserSession(user, store, tasks)
+        while len(self._sessions) > self.max_users:
+            evicted_user, evicted = self._sessions.popitem(last=False)
+            closing = self._closing[evicted_user] = asyncio.ensure_future(self._close(evicted))
+            closing.add_done_callback(
+                lambda done, evicted_user=evicted_user: self._closing.pop(evicted_user, None)
+                if self._closing.get(evicted_user) is done else None)
+        return session
+
+    async def _close(self, session):
+        async with session.lock:
+            session.closed = True
+            await asyncio.to_thread(session.store.close)
+
+    async def _locked_session(self, user):
+        """Сессия пользователя с захваченной блокировкой записи"""
+        while True:
+            session = await self.session(user)
+            await session.lock.acquire()
+            if not session.closed:
+                return session
+            # Сессию выгрузили, пока ждали блокировку: загружаем заново
+            session.lock.release()
+
+    async def close(self):
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(self._close(session) for session in sessions),
+                             *self._closing.values())
+
+    # Методы JSON-RPC
+
+    async def list_tasks(self, user, offset=0, limit=None, completed=None, skipped=None,
+                         due_before=None):
+        session = await self.session(user)
+        tasks = session.tasks.values()
+        if completed is not None or skipped is not None or due_before is not None:
+            tasks = [task for task in tasks if _matches(task, completed, skipped, due_before)]
+        end = None if limit is None else offset + limit
+        return {'total': len(tasks),
+                'tasks': [task.to_dict() for task in islice(tasks, offset, end)]}
+
+    async def get_task(self, user, id):
+        session = await self.session(user)
+        return _task_or_error(session, id).to_dict()
+
+    async def put_task(self, user, task):
+        """Создаёт задачу или заменяет её целиком; возвращает записанную задачу"""
+        new_task = _task_from_params(task)
+        session = await self._locked_session(user)
+        try:
+            session.put(new_task)
+        finally:
+            session.lock.release()
+        return new_task.to_dict()
+
+    async def update_task(self, user, id, changes):
+        """Меняет отдельные поля задачи"""
+        if not isinstance(changes, dict) or 'id' in changes:
+            raise RpcError(INVALID_PARAMS, "changes - словарь полей задачи без 'id'")
+        session = await self._locked_session(user)
+        try:
+            data = _task_or_error(session, id).to_dict()
+            data.update(changes)
+            task = _task_from_params(data)
+            session.put(task)
+        finally:
+            session.lock.release()
+        return task.to_dict()
+
+    async def delete_task(self, user, id):
+        session = await self._locked_session(user)
+        try:
+            _task_or_error(session, id)
+            session.delete(id)
+        finally:
+            session.lock.release()
+        return True
+
+    async def apply(self, user, changes):
+        """Пачка изменений в формате TaskStore.apply: пары [id, задача или null]"""
+        tasks = [(task_id, None if data is None else _task_from_params(data))
+                 for task_id, data in changes]
+        session = await self._locked_session(user)
+        try:
+            for task_id, task in tasks:
+                if task is None:
+                    if task_id in session.tasks:
+                        session.delete(task_id)
+                else:
+                    session.put(task)
+        finally:
+            session.lock.release()
+        return len(tasks)
+
+    async def replace_all(self, user, tasks):
+        tasks = [_task_from_params(data) for data in tasks]
+        session = await self._locked_session(user)
+        try:
+            session.replace_all(tasks)
+        finally:
+            session.lock.release()
+        return len(tasks)
+
+    async def query(self, user, completed=None, skipped=None, due_before=None):
+        """id задач под фильтр, как TaskStore.query"""
+        session = await self.session(user)
+        return [task.id for task in session.tasks.values()
+                if _matches(task, completed, skipped, due_before)]
+
+    async def search(self, user, query, limit=None):
+        session = await self.session(user)
+        tasks = session.search_index.search(query)
+        return [task.to_dict() for task in tasks[:limit]]
+
+    async def call(self, request):
+        """Выполняет один запрос JSON-RPC и возвращает ответ или None для уведомления"""
+        request_id = request.get('id') if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict) or not isinstance(request.get('method'), str):
+                raise RpcError(INVALID_REQUEST, "Некорректный запрос JSON-RPC")
+            method = self.methods.get(request['method'])
+            if method is None:
+                raise RpcError(METHOD_NOT_FOUND, f"Неизвестный метод: {request['method']}")
+            params = request.get('params') or {}
+            if not isinstance(params, dict):
+                raise RpcError(INVALID_PARAMS, "Параметры передаются по имени")
+            try:
+                result = await method(**params)
+            except TypeError as e:
+                raise RpcError(INVALID_PARAMS, str(e))
+        except RpcError as e:
+            response = {'jsonrpc': '2.0', 'id': request_id,
+                        'error': {'code': e.code, 'message': e.message}}
+        except Exception as e:
+            response = {'jsonrpc': '2.0', 'id': request_id,
+                        'error': {'code': INTERNAL_ERROR, 'message': str(e)}}
+        else:
+            response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+        if isinstance(request, dict) and 'id' not in request:
+            # Уведомление JSON-RPC: ответ не нужен
+            return None
+        return response
+
+
+def _matches(task, completed, skipped, due_before):
+    if completed is not None and bool(task.completed) != completed:
+        return False
+    if skipped is not None and bool(task.skipped) != skipped:
+        return False
+    if due_before is not None and not task.due_day < epoch_day_from_iso(due_before):
+        return False
+    return True
+
+
+def _task_or_error(session, task_id):
+    task = session.tasks.get(task_id)
+    if task is None:
+        raise RpcError(TASK_NOT_FOUND, f"Задача не найдена: {task_id}")
+    return task
+
+
+def _task_from_params(data):
+    if not isinstance(data, dict):
+        raise RpcError(INVALID_PARAMS, "Задача передаётся словарём")
+    data = dict(data)
+    data.setdefault('description', '')
+    data['id'] = data.get('id') or new_task_id()
+    try:
+        return Task.from_dict(data)
+    except (KeyError, TypeError, ValueError) as e:
+        raise RpcError(INVALID_PARAMS, f"Некорректная задача: {e}")
+
+
+async def handle_connection(service, reader, writer):
+    """Простой HTTP/1.1 с keep-alive: только POST /rpc"""
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY_SIZE:
+                await _respond(writer, 413, {'error': "Слишком большой запрос"}, close=True)
+                break
+            body = await reader.readexactly(length) if length else b''
+            keep_alive = headers.get('connection', '').lower() != 'close'
+
+            if method != 'POST' or path != '/rpc':
+                await _respond(writer, 404, {'error': "Используйте POST /rpc"}, not keep_alive)
+            else:
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    response = {'jsonrpc': '2.0', 'id': None,
+                                'error': {'code': PARSE_ERROR, 'message': "Некорректный JSON"}}
+                else:
+                    response = await service.call(request)
+                await _respond(writer, 200 if response is not None else 204, response,
+                               not keep_alive)
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _respond(writer, status, payload, close=False):
+    reasons = {200: 'OK', 204: 'No Content', 404: 'Not Found', 413: 'Payload Too Large'}
+    body = b'' if payload is None else json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (f"HTTP/1.1 {status} {reasons[status]}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n")
+    writer.write(head.encode('latin-1') + body)
+    await writer.drain()
+
+
+async def serve(service, host, port):
+    """Запускает сервер; возвращает asyncio.Server"""
+    return await asyncio.start_server(
+        lambda reader, writer: handle_connection(service, reader, writer), host, port)
+
+
+async def main_async(args):
+    service = TaskService(args.data_dir, args.max_users)
+    server = await serve(service, args.host, args.port)
+    print(f"Сервис задач слушает http://{args.host}:{args.port}/rpc", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервис задач для многих пользователей")
+    parser.add_argument('--data-dir', default='.', help="каталог с файлами задач пользователей")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-users', type=int, default=256,
+                        help="сколько пользователей держать загруженными")
+    args = parser.parse_args()
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1234 @@
+import itertools
+import json
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: рекомендательных блокировок flock нет, экземпляры программы
+    # не согласуют запись и лишь подхватывают чужие изменения
+    fcntl = None
+
+
+def new_task_id():
+    """Возвращает новый постоянный идентификатор задачи"""
+    return uuid.uuid4().hex
+
+
+def legacy_task_id(snapshot_path, position, text):
+    """Идентификатор задачи без id из старого снимка.
+
+    Строится из имени файла снимка (в нём имя пользователя), места задачи в
+    снимке и её текста, поэтому он один и тот же при каждом чтении, пока
+    снимок не переписан с выданными id: правки, сделанные до этого,
+    записываются в журнал под ним же. Задачи разных пользователей и разные
+    задачи одного пользователя получают разные id.
+    """
+    name = os.path.splitext(os.path.basename(snapshot_path))[0]
+    return uuid.uuid5(uuid.NAMESPACE_OID, f"{name}\n{position}\n{text}").hex
+
+
+def _task_meta(data):
+    """Поля задачи, по которым хранилище умеет фильтровать"""
+    return data['due_date'], bool(data.get('completed')), bool(data.get('skipped'))
+
+
+def _fsync_dir(path):
+    """Сбрасывает на диск запись каталога после переименования файла"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        # Каталоги нельзя открыть так на Windows
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+_WHITESPACE = re.compile(r'\s*')
+
+
+def iter_json_array(f, chunk_size=1 << 16, with_text=False):
+    """Разбирает JSON-массив из файла по одному элементу.
+
+    Файл читается кусками по chunk_size символов, в памяти одновременно
+    находится только текущий кусок и разбираемый элемент. С with_text=True
+    выдаются пары (элемент, его исходный JSON-текст).
+    """
+    decoder = json.JSONDecoder()
+    buf, pos = '', 0
+
+    def read_more():
+        nonlocal buf, pos
+        chunk = f.read(chunk_size)
+        if not chunk:
+            return False
+        buf, pos = buf[pos:] + chunk, 0
+        return True
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or not read_more():
+                return buf[pos:pos + 1]
+
+    if skip_whitespace() != '[':
+        raise ValueError("Ожидался JSON-массив задач")
+    pos += 1
+    if skip_whitespace() == ']':
+        return
+
+    while True:
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                # Элемент не поместился в прочитанную часть файла
+                if not read_more():
+                    raise
+                continue
+            # Число на границе куска могло быть прочитано не полностью:
+            # за элементом должен идти разделитель
+            after = _WHITESPACE.match(buf, end).end()
+            if buf[after:after + 1] not in (',', ']') and read_more():
+                continue
+            break
+        if with_text:
+            yield value, buf[pos:end]
+        else:
+            yield value
+        pos = end
+
+        separator = skip_whitespace()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError("Повреждён JSON-массив задач")
+        pos += 1
+        skip_whitespace()
+
+
+def _encode(data):
+    """Компактный JSON-текст задачи"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _matches(meta, completed, skipped, due_before):
+    due_date, is_completed, is_skipped = meta
+    if completed is not None and is_completed != completed:
+        return False
+    if skipped is not None and is_skipped != skipped:
+        return False
+    if due_before is not None and not due_date < due_before:
+        return False
+    return True
+
+
+class TaskStore:
+    """Общий интерфейс хранилища задач.
+
+    Хранилище работает со словарями из Task.to_dict() и различает задачи по
+    полю 'id'. Порядок задач при загрузке совпадает с порядком их создания.
+    bytes_written считает байты, записанные хранилищем за время работы.
+    """
+    bytes_written = 0
+
+    def load(self):
+        """Возвращает словари всех задач"""
+        return list(self.iter_load())
+
+    def iter_load(self):
+        """Выдаёт словари задач по одному, не держа их все в памяти"""
+        raise NotImplementedError
+
+    def iter_batches(self, batch_size):
+        """Выдаёт словари задач списками не длиннее batch_size"""
+        batch = []
+        for data in self.iter_load():
+            batch.append(data)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def put(self, data):
+        """Добавляет задачу или обновляет её состояние"""
+        raise NotImplementedError
+
+    def delete(self, task_id):
+        """Удаляет задачу"""
+        raise NotImplementedError
+
+    def save_all(self, tasks_data):
+        """Полностью заменяет содержимое хранилища"""
+        raise NotImplementedError
+
+    def apply(self, changes):
+        """Записывает пачку изменений: пары (id, словарь задачи или None для удаления)"""
+        for task_id, data in changes:
+            if data is None:
+                self.delete(task_id)
+            else:
+                self.put(data)
+
+    def query(self, completed=None, skipped=None, due_before=None):
+        """Возвращает id задач, подходящих под фильтр.
+
+        due_before - дата в формате ISO; подходят задачи со сроком раньше неё.
+        """
+        raise NotImplementedError
+
+    def needs_compaction(self):
+        """Накопилось ли достаточно изменений, чтобы вызвать compact()"""
+        return False
+
+    def compact(self):
+        """Переписывает хранилище из уже известного ему состояния задач"""
+
+    def sync(self):
+        """Изменения, внесённые в хранилище другими процессами с прошлого вызова.
+
+        Возвращает пары (id, словарь задачи или None для удаления) только для
+        задач, которые отличаются от уже известных этому экземпляру.
+        """
+        return []
+
+    def watched_paths(self):
+        """Файлы, изменение которых другим процессом означает, что пора вызвать sync()"""
+        return []
+
+    def close(self):
+        pass
+
+
+class JsonTaskStore(TaskStore):
+    """Хранилище задач: JSON-снимок плюс журнал изменений.
+
+    Снимок - это прежний файл `{username}_tasks.json`. Каждое изменение одной
+    задачи дописывается в конец файла журнала одной строкой, поэтому правка
+    не требует перезаписи всех задач. Когда журнал разрастается, он
+    сворачивается в новый снимок.
+
+    Хранилище помнит JSON-текст каждой задачи: для задач из снимка это их
+    исходный текст, для изменённых - строка, уже закодированная для журнала.
+    Свёртка склеивает готовые куски и ничего не кодирует заново.
+
+    Файлы могут открыть сразу несколько экземпляров программы. Запись идёт
+    под рекомендательной блокировкой файла `{username}_tasks.lock`, а перед
+    ней хранилище дочитывает чужие записи журнала, поэтому свёртка не теряет
+    изменения другого процесса. Хранилище помнит, до какого места прочитан
+    журнал и какой файл снимка прочитан: sync() дочитывает только новые
+    строки журнала, а снимок перечитывает, лишь когда его заменила чужая
+    свёртка.
+    """
+
+    def __init__(self, snapshot_path, compact_threshold=500):
+        self.snapshot_path = snapshot_path
+        base = os.path.splitext(snapshot_path)[0]
+        self.journal_path = base + '.journal'
+        self.lock_path = base + '.lock'
+        self.compact_threshold = compact_threshold
+        self.entries = 0
+        self._meta = {}
+        self._records = {}
+        self._rewrite_needed = False
+        self._loading = False
+        # Запись из фонового потока и sync() из потока GUI не должны пересекаться
+        self._mutex = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+        # Байт журнала, до которого он прочитан, и прочитанный файл снимка
+        self._journal_offset = 0
+        self._snapshot_id = None
+        # Чужие изменения, ещё не отданные sync(): id -> словарь задачи или None
+        self._external = {}
+
+    def load(self):
+        result = super().load()
+        if self._rewrite_needed:
+            self.compact()
+        return result
+
+    def iter_load(self):
+        """Читает снимок по одной задаче и накладывает на него журнал.
+
+        Журнал ограничен порогом свёртки, поэтому он читается целиком заранее,
+        а снимок разбирается потоково.
+        """
+        with self._locked(shared=True):
+            self._snapshot_id = self._file_id(self.snapshot_path)
+            changes, self._journal_offset = self._read_journal()
+        self.entries = len(changes)
+
+        self._meta = {}
+        self._records = {}
+        self._external = {}
+        self._rewrite_needed = False
+        self._loading = True
+        try:
+            for data, text in self._iter_records(dict(changes)):
+                self._remember(data, text)
+                yield data
+        finally:
+            self._loading = False
+
+    def _iter_records(self, overrides):
+        """Выдаёт пары (словарь задачи, JSON-текст) из снимка с наложенными overrides"""
+        if os.path.exists(self.snapshot_path):
+            for position, (data, text) in enumerate(self._read_snapshot()):
+                if not data.get('id'):
+                    # Старый файл без идентификаторов: id зависит только от
+                    # места в снимке, поэтому правки, записанные в журнал до
+                    # свёртки, совпадут с задачами и при следующем запуске;
+                    # свёртка закрепит id в снимке
+                    data['id'] = legacy_task_id(self.snapshot_path, position, text)
+                    text = _encode(data)
+                    self._rewrite_needed = True
+                if data['id'] in overrides:
+                    data = overrides.pop(data['id'])
+                    if data is None:
+                        continue
+                    text = _encode(data)
+                yield data, text
+
+        # Задачи, созданные после последней свёртки
+        for data in overrides.values():
+            if data is not None:
+                yield data, _encode(data)
+
+    def put(self, data):
+        """Записывает новое состояние одной задачи"""
+        self.apply([(data['id'], data)])
+
+    def delete(self, task_id):
+        """Записывает удаление задачи"""
+        self.apply([(task_id, None)])
+
+    def apply(self, changes):
+        # Каждая изменённая задача кодируется один раз: этот же текст
+        # попадает и в журнал, и в следующий снимок
+        lines, records = [], []
+        for task_id, data in changes:
+            if data is None:
+                lines.append(_encode({'op': 'delete', 'id': task_id}))
+                records.append((task_id, None, None))
+            else:
+                text = _encode(data)
+                lines.append('{"op":"put","task":' + text + '}')
+                records.append((task_id, data, text))
+
+        with self._locked():
+            self._catch_up()
+            self._append(lines)
+            for task_id, data, text in records:
+                # Своё изменение новее чужого, которое ещё не забрал sync()
+                self._external.pop(task_id, None)
+                if data is None:
+                    self._meta.pop(task_id, None)
+                    self._records.pop(task_id, None)
+                else:
+                    self._remember(data, text)
+
+    def query(self, completed=None, skipped=None, due_before=None):
+        return [task_id for task_id, meta in self._meta.items()
+                if _matches(meta, completed, skipped, due_before)]
+
+    def needs_compaction(self):
+        if self._loading:
+            return False
+        return self._rewrite_needed or self.entries >= self.compact_threshold
+
+    def compact(self):
+        """Сворачивает журнал: пишет снимок из уже закодированных задач"""
+        if self._loading:
+            # Ещё не прочитанных задач нет в памяти, снимок вышел бы неполным
+            return
+        with self._locked():
+            # Строки журнала, дописанные другим процессом, исчезнут при его
+            # очистке, поэтому сначала они переносятся в память
+            self._catch_up()
+            self._replace_snapshot(self._records.values())
+
+            # Если сбой произойдёт до очистки журнала, его повторное проигрывание
+            # поверх нового снимка даст тот же результат
+            with open(self.journal_path, 'w', encoding='utf-8'):
+                pass
+            self.entries = 0
+            self._rewrite_needed = False
+            self._snapshot_id = self._file_id(self.snapshot_path)
+            self._journal_offset = 0
+
+    def save_all(self, tasks_data):
+        """Полностью заменяет задачи и сразу сворачивает журнал.
+
+        Чужие изменения, не дошедшие до sync(), тоже заменяются.
+        """
+        with self._locked():
+            self._catch_up()
+            self._external = {}
+            self._meta = {}
+            self._records = {}
+            for data in tasks_data:
+                self._remember(data, _encode(data))
+            self.compact()
+
+    def sync(self):
+        if self._loading:
+            # Чужие изменения подхватятся при первом вызове после загрузки
+            return []
+        with self._locked(shared=True):
+            self._catch_up()
+            changes, self._external = list(self._external.items()), {}
+        return changes
+
+    def watched_paths(self):
+        return [self.snapshot_path, self.journal_path]
+
+    def close(self):
+        with self._mutex:
+            if self._lock_file is not None:
+                self._lock_file.close()
+                self._lock_file = None
+
+    @contextmanager
+    def _locked(self, shared=False):
+        """Блокировка файлов хранилища от других потоков и процессов.
+
+        Вложенные вызовы не трогают уже взятую блокировку файла: flock на том
+        же дескрипторе не считает захваты, и внутреннее снятие отпустило бы
+        внешнюю.
+        """
+        with self._mutex:
+            if fcntl is None or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, 'a')
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    @staticmethod
+    def _file_id(path):
+        """Признаки, по которым видно, что файл заменён другим"""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read_journal(self, offset=0):
+        """Читает журнал с байта offset: (пары (id, задача или None), конец прочитанного)"""
+        try:
+            with open(self.journal_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+        # Недописанная после сбоя строка остаётся непрочитанной: следующая
+        # запись отделит её переводом строки, и она будет пропущена
+        end = data.rfind(b'\n') + 1
+        changes = []
+        for line in data[:end].decode('utf-8', errors='replace').splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if entry['op'] == 'put':
+                changes.append((entry['task']['id'], entry['task']))
+            elif entry['op'] == 'delete':
+                changes.append((entry['id'], None))
+        return changes, offset + end
+
+    def _catch_up(self):
+        """Переносит в память изменения других процессов; вызывается под блокировкой"""
+        if self._loading:
+            return
+        try:
+            journal_size = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            journal_size = 0
+        if (self._file_id(self.snapshot_path) != self._snapshot_id
+                or journal_size < self._journal_offset):
+            self._reload()
+            return
+        if journal_size == self._journal_offset:
+            return
+        changes, self._journal_offset = self._read_journal(self._journal_offset)
+        self.entries += len(changes)
+        for task_id, data in changes:
+            self._merge(task_id, data, None if data is None else _encode(data))
+
+    def _reload(self):
+        """Перечитывает снимок после чужой свёртки и сравнивает его с известными задачами"""
+        self._snapshot_id = self._file_id(self.snapshot_path)
+        changes, self._journal_offset = self._read_journal()
+        self.entries = len(changes)
+        seen = set()
+        for data, text in self._iter_records(dict(changes)):
+            seen.add(data['id'])
+            self._merge(data['id'], data, text)
+        for task_id in [task_id for task_id in self._records if task_id not in seen]:
+            self._merge(task_id, None, None)
+
+    def _merge(self, task_id, data, text):
+        """Накладывает чужое изменение, если оно расходится с известным состоянием задачи"""
+        if data is None:
+            if task_id not in self._records:
+                return
+            del self._records[task_id]
+            self._meta.pop(task_id, None)
+        else:
+            # Свои записи, прочитанные из журнала повторно, совпадут с памятью
+            if self._records.get(task_id) == text:
+                return
+            self._remember(data, text)
+        self._external.pop(task_id, None)
+        self._external[task_id] = data
+
+    def _read_snapshot(self):
+        """Выдаёт пары (словарь задачи, её JSON-текст) из файла снимка"""
+        with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+            yield from iter_json_array(f, with_text=True)
+
+    def _write_snapshot(self, f, records):
+        """Пишет JSON-тексты задач в открытый двоичный файл снимка"""
+        # Кусками: склеенный целиком снимок удвоил бы память на время записи
+        records = iter(records)
+        separator = b'[\n'
+        while True:
+            block = list(itertools.islice(records, 4096))
+            if not block:
+                break
+            f.write(separator)
+            f.write(',\n'.join(block).encode('utf-8'))
+            separator = b',\n'
+        f.write(b'\n]\n' if separator == b',\n' else b'[\n]\n')
+
+    def _replace_snapshot(self, records):
+        """Атомарно заменяет файл снимка снимком из JSON-текстов records"""
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            self._write_snapshot(f, records)
+            f.flush()
+            os.fsync(f.fileno())
+            self.bytes_written += f.tell()
+        os.replace(tmp_path, self.snapshot_path)
+        _fsync_dir(self.snapshot_path)
+
+    def _remember(self, data, text):
+        self._meta[data['id']] = _task_meta(data)
+        self._records[data['id']] = text
+
+    def _append(self, lines):
+        text = ''.join(line + '\n' for line in lines)
+        with open(self.journal_path, 'ab+') as f:
+            # Не склеиваем новую запись с недописанной строкой после сбоя
+            start = f.seek(0, os.SEEK_END)
+            if start > 0:
+                f.seek(start - 1)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            data = text.encode('utf-8')
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+            # Если перед записью журнал прочитан не до конца, непрочитанное
+            # дочитает следующая проверка, а свои строки в нём совпадут с памятью
+            if self._journal_offset == start:
+                self._journal_offset = f.tell()
+        self.bytes_written += len(data)
+        self.entries += len(lines)
+
+
+class BinaryTaskStore(JsonTaskStore):
+    """Хранилище с компактным двоичным снимком `{username}_tasks.bin`.
+
+    Журнал изменений тот же, что у JsonTaskStore; отличается только снимок.
+    Файл начинается с маркера формата, за ним идут блоки: длина сжатых
+    данных, число задач и сжатые zlib компактные JSON-тексты задач по одному
+    на строку (в компактном JSON переводы строк всегда экранированы). Блок
+    разбирается одним вызовом json.loads, а блоки читаются по одному,
+    поэтому загрузка остаётся потоковой.
+    """
+
+    MAGIC = b'TASKBIN1'
+    BLOCK_SIZE = 1 << 18
+    _BLOCK_HEADER = struct.Struct('<II')
+
+    @classmethod
+    def is_binary(cls, path):
+        """Проверяет по маркеру формата, что файл - двоичный снимок задач"""
+        with open(path, 'rb') as f:
+            return f.read(len(cls.MAGIC)) == cls.MAGIC
+
+    def _read_snapshot(self):
+        with open(self.snapshot_path, 'rb') as f:
+            if f.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError("Неизвестный формат файла задач")
+            while True:
+                header = f.read(self._BLOCK_HEADER.size)
+                if not header:
+                    return
+                if len(header) < self._BLOCK_HEADER.size:
+                    raise ValueError("Повреждён файл задач")
+                size, count = self._BLOCK_HEADER.unpack(header)
+                texts = zlib.decompress(f.read(size)).decode('utf-8').split('\n')
+                if len(texts) != count:
+                    raise ValueError("Повреждён файл задач")
+                yield from zip(json.loads('[' + ','.join(texts) + ']'), texts)
+
+    def _write_snapshot(self, f, records):
+        f.write(self.MAGIC)
+        block, size = [], 0
+        for text in records:
+            block.append(text)
+            size += len(text)
+            if size >= self.BLOCK_SIZE:
+                self._write_block(f, block)
+                block, size = [], 0
+        if block:
+            self._write_block(f, block)
+
+    def _write_block(self, f, block):
+        # Быстрое сжатие: снимок пишется при каждой свёртке журнала
+        compressed = zlib.compress('\n'.join(block).encode('utf-8'), 1)
+        f.write(self._BLOCK_HEADER.pack(len(compressed), len(block)))
+        f.write(compressed)
+
+
+class SqliteTaskStore(TaskStore):
+    """Хранилище задач в SQLite.
+
+    Каждая задача - отдельная строка, поэтому правка одной задачи - это одна
+    короткая транзакция. Срок и статус вынесены в индексированные столбцы,
+    и фильтры выполняются запросом без чтения самих задач.
+
+    Блокировки между процессами обеспечивает сам SQLite. Триггеры пишут id
+    каждой изменённой задачи в task_changes; sync() читает записи новее уже
+    просмотренных и пропускает номера, созданные своими транзакциями.
+
+    Одно соединение используют и поток GUI, и фоновый поток записи
+    BufferedTaskStore, поэтому каждое обращение к нему идёт под _mutex.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            due_date TEXT NOT NULL,
+            completed INTEGER NOT NULL DEFAULT 0,
+            skipped INTEGER NOT NULL DEFAULT 0,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_position ON tasks (position);
+        CREATE INDEX IF NOT EXISTS tasks_due_date ON tasks (due_date);
+        CREATE INDEX IF NOT EXISTS tasks_status ON tasks (completed, skipped, due_date);
+        CREATE TABLE IF NOT EXISTS task_changes (
+            seq INTEGER PRIMARY KEY,
+            id TEXT NOT NULL,
+            at REAL NOT NULL DEFAULT (julianday('now'))
+        );
+        CREATE TRIGGER IF NOT EXISTS tasks_inserted AFTER INSERT ON tasks
+        BEGIN INSERT INTO task_changes (id) VALUES (new.id); END;
+        CREATE TRIGGER IF NOT EXISTS tasks_updated AFTER UPDATE ON tasks
+        BEGIN INSERT INTO task_changes (id) VALUES (new.id); END;
+        CREATE TRIGGER IF NOT EXISTS tasks_deleted AFTER DELETE ON tasks
+        BEGIN INSERT INTO task_changes (id) VALUES (old.id); END;
+    """
+
+    # Сколько дней хранятся записи task_changes; открытые экземпляры
+    # забирают их сразу после изменения файла
+    CHANGES_KEEP_DAYS = 7
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        # Записи идут из фонового потока BufferedTaskStore, чтения - из потока GUI
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._mutex = threading.RLock()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(self.SCHEMA)
+        with self.conn:
+            # Последняя запись остаётся, чтобы номера изменений не начались заново
+            self.conn.execute("DELETE FROM task_changes WHERE at < julianday('now') - ? "
+                              "AND seq < (SELECT MAX(seq) FROM task_changes)",
+                              (self.CHANGES_KEEP_DAYS,))
+        # Последний просмотренный номер изменения и диапазоны номеров своих транзакций
+        self._seen = self._last_change()
+        self._own = []
+
+    def iter_load(self):
+        with self._mutex:
+            cursor = self.conn.execute('SELECT data FROM tasks ORDER BY position')
+        while True:
+            # Между порциями соединением может воспользоваться другой поток
+            with self._mutex:
+                rows = cursor.fetchmany(500)
+            if not rows:
+                return
+            for data, in rows:
+                yield json.loads(data)
+
+    def put(self, data):
+        with self._transaction():
+            self._upsert(data)
+
+    def delete(self, task_id):
+        with self._transaction():
+            self.conn.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+
+    def apply(self, changes):
+        with self._transaction():
+            for task_id, data in changes:
+                if data is None:
+                    self.conn.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+                else:
+                    self._upsert(data)
+
+    def _upsert(self, data):
+        due_date, completed, skipped = _task_meta(data)
+        text = _encode(data)
+        # Объём записанного считается по длине JSON-текстов задач
+        self.bytes_written += len(text)
+        self.conn.execute(
+            """
+            INSERT INTO tasks (id, position, due_date, completed, skipped, data)
+            VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM tasks), ?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                due_date = excluded.due_date,
+                completed = excluded.completed,
+                skipped = excluded.skipped,
+                data = excluded.data
+            """,
+            (data['id'], due_date, completed, skipped, text)
+        )
+
+    def save_all(self, tasks_data):
+        def rows():
+            for position, data in enumerate(tasks_data):
+                text = _encode(data)
+                self.bytes_written += len(text)
+                yield (data['id'], position) + _task_meta(data) + (text,)
+
+        with self._transaction():
+            self.conn.execute('DELETE FROM tasks')
+            self.conn.executemany(
+                'INSERT INTO tasks (id, position, due_date, completed, skipped, data) '
+                'VALUES (?, ?, ?, ?, ?, ?)', rows())
+
+    def query(self, completed=None, skipped=None, due_before=None):
+        conditions, params = [], []
+        if completed is not None:
+            conditions.append('completed = ?')
+            params.append(completed)
+        if skipped is not None:
+            conditions.append('skipped = ?')
+            params.append(skipped)
+        if due_before is not None:
+            conditions.append('due_date < ?')
+            params.append(due_before)
+
+        sql = 'SELECT id FROM tasks'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY position'
+        with self._mutex:
+            return [task_id for task_id, in self.conn.execute(sql, params)]
+
+    def sync(self):
+        with self._mutex:
+            return self._sync()
+
+    def _sync(self):
+        rows = self.conn.execute('SELECT seq, id FROM task_changes WHERE seq > ? ORDER BY seq',
+                                 (self._seen,)).fetchall()
+        if not rows:
+            return []
+        task_ids = dict.fromkeys(task_id for seq, task_id in rows
+                                 if not any(first < seq <= last for first, last in self._own))
+        self._seen = rows[-1][0]
+        self._own = [(first, last) for first, last in self._own if last > self._seen]
+
+        task_ids = list(task_ids)
+        changes = []
+        for start in range(0, len(task_ids), 500):
+            chunk = task_ids[start:start + 500]
+            found = dict(self.conn.execute(
+                f'SELECT id, data FROM tasks WHERE id IN ({",".join("?" * len(chunk))})', chunk))
+            changes.extend((task_id, json.loads(found[task_id]) if task_id in found else None)
+                           for task_id in chunk)
+        return changes
+
+    def watched_paths(self):
+        # В режиме WAL чужая транзакция сначала попадает в файл -wal
+        return [self.db_path, self.db_path + '-wal']
+
+    def close(self):
+        with self._mutex:
+            self.conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Транзакция записи, номера изменений которой sync() не вернёт"""
+        with self._mutex:
+            with self.conn:
+                # Блокировка записи берётся сразу, поэтому между двумя замерами
+                # номеров в task_changes пишет только эта транзакция
+                self.conn.execute('BEGIN IMMEDIATE')
+                first = self._last_change()
+                yield
+                last = self._last_change()
+            if last > first:
+                if self._own and self._own[-1][1] == first:
+                    self._own[-1] = (self._own[-1][0], last)
+                else:
+                    self._own.append((first, last))
+
+    def _last_change(self):
+        return self.conn.execute('SELECT COALESCE(MAX(seq), 0) FROM task_changes').fetchone()[0]
+
+
+class RemoteStoreError(Exception):
+    """Ошибка, которую вернул сервис задач"""
+
+
+class RemoteTaskStore(TaskStore):
+    """Задачи пользователя в сервисе task_service.py.
+
+    Каждый метод - один вызов JSON-RPC по постоянному HTTP-соединению;
+    загрузка идёт страницами по batch_size задач. Фильтрация и свёртка
+    журнала выполняются на стороне сервиса.
+    """
+
+    def __init__(self, url, username, timeout=30):
+        parts = urllib.parse.urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or '/rpc'
+        self.username = username
+        self.timeout = timeout
+        self._connection = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def call(self, method, **params):
+        # http.client тянет за собой ssl и email: импортируется только при
+        # работе с сервисом, чтобы локальные утилиты запускались быстро
+        import http.client
+
+        params['user'] = self.username
+        body = json.dumps({'jsonrpc': '2.0', 'id': next(self._ids), 'method': method,
+                           'params': params}, ensure_ascii=False).encode('utf-8')
+        self.bytes_written += len(body)
+        with self._lock:
+            # Сервер мог закрыть простаивающее соединение: одна повторная попытка
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = http.client.HTTPConnection(
+                        self.host, self.port, timeout=self.timeout)
+                try:
+                    self._connection.request('POST', self.path, body,
+                                             {'Content-Type': 'application/json'})
+                    payload = json.loads(self._connection.getresponse().read())
+                    break
+                except (http.client.HTTPException, OSError):
+                    self._connection.close()
+                    self._connection = None
+                    if attempt:
+                        raise
+        if 'error' in payload:
+            raise RemoteStoreError(payload['error']['message'])
+        return payload['result']
+
+    def iter_load(self):
+        for batch in self.iter_batches(500):
+            yield from batch
+
+    def iter_batches(self, batch_size):
+        offset = 0
+        while True:
+            batch = self.call('list_tasks', offset=offset, limit=batch_size)['tasks']
+            if batch:
+                yield batch
+            if len(batch) < batch_size:
+                return
+            offset += len(batch)
+
+    def put(self, data):
+        self.call('put_task', task=data)
+
+    def delete(self, task_id):
+        self.apply([(task_id, None)])
+
+    def apply(self, changes):
+        self.call('apply', changes=[[task_id, data] for task_id, data in changes])
+
+    def save_all(self, tasks_data):
+        self.call('replace_all', tasks=list(tasks_data))
+
+    def query(self, completed=None, skipped=None, due_before=None):
+        return self.call('query', completed=completed, skipped=skipped, due_before=due_before)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+class BufferedTaskStore(TaskStore):
+    """Обёртка над хранилищем, которая пишет на диск в фоновом потоке.
+
+    Изменения копятся в памяти и сбрасываются одной пачкой, когда в течение
+    delay секунд не приходит новых: несколько сохранений одной задачи подряд
+    превращаются в одну запись. Поток GUI не ждёт диска, кроме flush() и
+    close(): query() накладывает ещё не записанные изменения на ответ
+    хранилища сам.
+    on_error вызывается из фонового потока с исключением записи, on_written -
+    после каждой успешной записи с её длительностью и числом байтов.
+    """
+
+    def __init__(self, store, delay=0.3, on_error=None, on_written=None):
+        self.store = store
+        self.delay = delay
+        self.on_error = on_error
+        self.on_written = on_written
+
+        self._pending = {}
+        self._full = None
+        self._compact = False
+        self._last_change = 0.0
+        self._dirty = False
+        self._writing_full = False
+        self._closing = False
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+
+        self._thread = threading.Thread(target=self._run, name='TaskSaver', daemon=True)
+        self._thread.start()
+
+    def load(self):
+        with self._write_lock:
+            return self.store.load()
+
+    def iter_load(self):
+        for batch in self.iter_batches(500):
+            yield from batch
+
+    def iter_batches(self, batch_size):
+        # Фоновая запись не должна вклиниваться в чтение одной порции
+        batches = self.store.iter_batches(batch_size)
+        while True:
+            with self._write_lock:
+                batch = next(batches, None)
+            if batch is None:
+                return
+            yield batch
+
+    def put(self, data):
+        self._enqueue(data['id'], data)
+
+    def delete(self, task_id):
+        self._enqueue(task_id, None)
+
+    def apply(self, changes):
+        with self._cond:
+            self._pending.update(changes)
+            self._touch()
+
+    def save_all(self, tasks_data):
+        with self._cond:
+            # Полный снимок уже содержит все накопленные изменения
+            self._full = tasks_data
+            self._pending.clear()
+            self._touch()
+
+    def query(self, completed=None, skipped=None, due_before=None):
+        """Как TaskStore.query(), но возвращает None, если сейчас идёт фоновая запись"""
+        if not self._write_lock.acquire(False):
+            return None
+        try:
+            # Пока держим блокировку, фоновый поток не заберёт очередь
+            with self._cond:
+                full, pending = self._full, dict(self._pending)
+            if full is not None:
+                # Поставленный в очередь полный снимок заменит всё, что в хранилище
+                task_ids = [data['id'] for data in full
+                            if _matches(_task_meta(data), completed, skipped, due_before)]
+            else:
+                task_ids = self.store.query(completed=completed, skipped=skipped, due_before=due_before)
+        finally:
+            self._write_lock.release()
+        if not pending:
+            return task_ids
+        matched = [task_id for task_id, data in pending.items() if data is not None
+                   and _matches(_task_meta(data), completed, skipped, due_before)]
+        known = set(task_ids)
+        matched_set = set(matched)
+        return ([task_id for task_id in task_ids if task_id not in pending or task_id in matched_set]
+                + [task_id for task_id in matched if task_id not in known])
+
+    def needs_compaction(self):
+        # Полный снимок уже поставлен в очередь или пишется прямо сейчас
+        if self._full is not None or self._compact or self._writing_full:
+            return False
+        return self.store.needs_compaction()
+
+    def compact(self):
+        with self._cond:
+            # Свёртка выполняется в фоновом потоке после накопленных изменений
+            self._compact = True
+            self._touch()
+
+    def sync(self):
+        """Как TaskStore.sync(), но возвращает None, если сейчас идёт фоновая запись.
+
+        Запись большого снимка может длиться секунды, а sync() вызывается из
+        потока GUI в ответ на изменение файлов, в том числе этой же записью:
+        ждать её нельзя, проверку нужно повторить позже.
+        """
+        if not self._write_lock.acquire(False):
+            return None
+        try:
+            changes = self.store.sync()
+        finally:
+            self._write_lock.release()
+        with self._cond:
+            if self._full is not None:
+                # Поставленный в очередь полный снимок всё равно заменит всё
+                return []
+            # Ещё не записанные свои изменения новее чужих и перезапишут их
+            return [(task_id, data) for task_id, data in changes if task_id not in self._pending]
+
+    def watched_paths(self):
+        return self.store.watched_paths()
+
+    def flush(self):
+        """Немедленно записывает все накопленные изменения"""
+        self._write()
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._thread.join()
+        self._write()
+        with self._write_lock:
+            self.store.close()
+
+    def _enqueue(self, task_id, data):
+        with self._cond:
+            # Повторное изменение той же задачи заменяет ещё не записанное
+            self._pending.pop(task_id, None)
+            self._pending[task_id] = data
+            self._touch()
+
+    def _touch(self):
+        self._last_change = time.monotonic()
+        self._dirty = True
+        self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not (self._dirty or self._closing):
+                    self._cond.wait()
+                if self._closing:
+                    return
+                # Ждём, пока поток изменений не затихнет на delay секунд
+                while not self._closing:
+                    remaining = self._last_change + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self._write()
+
+    def _write(self):
+        with self._write_lock:
+            with self._cond:
+                full, self._full = self._full, None
+                changes, self._pending = list(self._pending.items()), {}
+                compact, self._compact = self._compact, False
+                self._dirty = False
+                self._writing_full = full is not None or compact
+            if full is None and not changes and not compact:
+                return
+            started, written = time.perf_counter(), self.store.bytes_written
+            try:
+                if full is not None:
+                    self.store.save_all(full)
+                    full = None
+                if changes:
+                    self.store.apply(changes)
+                    changes = []
+                if compact:
+                    self.store.compact()
+                    compact = False
+                self._writing_full = False
+            except Exception as e:
+                # Возвращаем незаписанное в очередь, не затирая более новые
+                # изменения; повторная попытка будет при следующей записи
+                with self._cond:
+                    self._writing_full = False
+                    # Новый полный снимок, если он уже поставлен, перекрывает всё
+                    if self._full is None:
+                        self._full = full
+                        self._compact = self._compact or compact
+                        for task_id, data in changes:
+                            self._pending.setdefault(task_id, data)
+                if self.on_error is None:
+                    raise
+                self.on_error(e)
+            else:
+                if self.on_written is not None:
+                    self.on_written(time.perf_counter() - started, self.store.bytes_written - written)
+
+
+def open_store(data_file, engine=None):
+    """Открывает хранилище задач пользователя.
+
+    data_file - путь к JSON-снимку (`{username}_tasks.json`). Движок берётся
+    из аргумента, затем из переменной окружения TASK_STORAGE ('json',
+    'binary' или 'sqlite'); если ни то ни другое не задано, используется
+    тот формат, файл которого уже есть рядом. При переходе с JSON на другой
+    формат задачи переносятся автоматически, а между JSON и двоичным
+    снимком - в обе стороны.
+
+    Снимок другого формата удаляется, только если файл переноса
+    (`{username}_tasks.migration`) подтверждает, что перенос из него
+    завершён. Если рядом лежат оба снимка, а файла переноса нет (например,
+    после копирования или восстановления из резервной копии), оба остаются
+    на месте и открывается снимок выбранного формата.
+    """
+    base = os.path.splitext(data_file)[0]
+    db_path = base + '.db'
+    bin_path = base + '.bin'
+    engine = engine or os.environ.get('TASK_STORAGE')
+    if not engine:
+        if os.path.exists(db_path):
+            engine = 'sqlite'
+        elif os.path.exists(bin_path):
+            engine = 'binary'
+        else:
+            engine = 'json'
+
+    if engine in ('json', 'binary'):
+        if engine == 'json':
+            store, other = JsonTaskStore(data_file), bin_path
+        else:
+            store, other = BinaryTaskStore(bin_path), data_file
+        marker_path = base + '.migration'
+        if os.path.exists(marker_path):
+            _resume_migration(marker_path, store, other)
+        if os.path.exists(other) and not os.path.exists(store.snapshot_path):
+            migrate_snapshot(other, store)
+        return store
+    if engine != 'sqlite':
+        raise ValueError(f"Неизвестное хранилище задач: {engine}")
+
+    is_new = not os.path.exists(db_path)
+    store = SqliteTaskStore(db_path)
+    if is_new:
+        if os.path.exists(bin_path):
+            store.save_all(BinaryTaskStore(bin_path).load())
+        elif os.path.exists(data_file):
+            store.save_all(JsonTaskStore(data_file).load())
+    return store
+
+
+def migrate_snapshot(source_path, target):
+    """Переносит задачи из снимка source_path в хранилище target.
+
+    Формат исходного файла определяется по маркеру, поэтому подходят и
+    JSON-файлы app.py и kurs_4.py, и двоичные снимки. Общий журнал
+    изменений читается вместе с исходным снимком и не очищается: его
+    повторное проигрывание поверх нового снимка даёт тот же результат.
+    Ход переноса записывается в файл переноса до и после записи нового
+    снимка, и исходный файл удаляется, только когда там отмечено, что
+    новый снимок записан на диск целиком.
+    """
+    if BinaryTaskStore.is_binary(source_path):
+        source = BinaryTaskStore(source_path)
+    else:
+        source = JsonTaskStore(source_path)
+    marker_path = os.path.splitext(target.snapshot_path)[0] + '.migration'
+    _write_marker(marker_path, source_path, target.snapshot_path, done=False)
+    try:
+        target._replace_snapshot(_encode(data) for data in source.load())
+    finally:
+        source.close()
+    _write_marker(marker_path, source_path, target.snapshot_path, done=True)
+    _finish_migration(marker_path, source_path)
+
+
+def _write_marker(marker_path, source_path, target_path, done):
+    """Атомарно записывает ход переноса снимка в файл переноса"""
+    tmp_path = marker_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'source': os.path.basename(source_path),
+                   'target': os.path.basename(target_path), 'done': done}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, marker_path)
+    _fsync_dir(marker_path)
+
+
+def _finish_migration(marker_path, source_path):
+    """Удаляет исходный снимок завершённого переноса, затем файл переноса"""
+    if os.path.exists(source_path):
+        os.remove(source_path)
+    _fsync_dir(source_path)
+    os.remove(marker_path)
+
+
+def _resume_migration(marker_path, store, other):
+    """Доводит до конца перенос снимка, прерванный сбоем.
+
+    Завершённый перенос только удаляет исходный снимок. Незавершённый
+    начинается заново, если исходный снимок - снимок другого формата, а
+    если исходный - снимок этого хранилища (перенос в другой формат так и
+    не закончился), недописанный снимок другого формата удаляется.
+    """
+    try:
+        with open(marker_path, 'r', encoding='utf-8') as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        # Файл переноса пишется атомарно; нечитаемый - чужой, его не трогаем
+        return
+    directory = os.path.dirname(store.snapshot_path)
+    source = os.path.join(directory, marker.get('source', ''))
+    target = os.path.join(directory, marker.get('target', ''))
+    if {source, target} != {store.snapshot_path, other}:
+        return
+    if marker.get('done'):
+        # Если новый снимок - другого формата, он единственный актуальный
+        # и после удаления исходного будет перенесён в формат этого хранилища
+        _finish_migration(marker_path, source)
+    elif source == other:
+        if os.path.exists(other):
+            migrate_snapshot(other, store)
+        else:
+            os.remove(marker_path)
+    else:
+        _finish_migration(marker_path, target)
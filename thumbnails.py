@@ -0,0 +1,179 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, Qt, pyqtSignal
+from PyQt5.QtGui import QIcon, QImage, QImageReader, QPixmap
+
+try:
+    import fitz
+except ImportError:
+    # Без PyMuPDF у PDF-файлов остаётся стандартная иконка
+    fitz = None
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+PDF_EXTENSIONS = ('.pdf',)
+THUMBNAIL_SIZE = 64
+
+
+def thumbnail_kind(path):
+    """'image', 'pdf' или None, если миниатюру для файла не построить"""
+    lower = path.lower()
+    if lower.endswith(IMAGE_EXTENSIONS):
+        return 'image'
+    if fitz is not None and lower.endswith(PDF_EXTENSIONS):
+        return 'pdf'
+    return None
+
+
+def _render_image(path):
+    reader = QImageReader(path)
+    size = reader.size()
+    if size.isValid():
+        # Декодер сразу уменьшает картинку, полноразмерная копия не строится
+        reader.setScaledSize(size.scaled(THUMBNAIL_SIZE, THUMBNAIL_SIZE, Qt.KeepAspectRatio))
+    return reader.read()
+
+
+def _render_pdf(path):
+    with fitz.open(path) as document:
+        page = document[0]
+        zoom = THUMBNAIL_SIZE / max(page.rect.width, page.rect.height)
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom))
+        return QImage.fromData(pixmap.tobytes('png'), 'PNG')
+
+
+class _ThumbnailSignals(QObject):
+    ready = pyqtSignal(str, str, QImage)
+
+
+class _ThumbnailJob(QRunnable):
+    """Строит миниатюру в пуле потоков или берёт её из дискового кэша"""
+
+    def __init__(self, cache, path, key):
+        super().__init__()
+        self.cache = cache
+        self.path = path
+        self.key = key
+
+    def run(self):
+        image = QImage()
+        try:
+            image = self.cache.load_from_disk(self.key)
+            if image.isNull():
+                if thumbnail_kind(self.path) == 'pdf':
+                    image = _render_pdf(self.path)
+                else:
+                    image = _render_image(self.path)
+                if not image.isNull():
+                    self.cache.save_to_disk(self.key, image)
+        except Exception:
+            # Повреждённый или недоступный файл: остаётся стандартная иконка
+            image = QImage()
+        self.cache.signals.ready.emit(self.path, self.key, image)
+
+
+class ThumbnailCache(QObject):
+    """Миниатюры вложений с кэшем в памяти и на диске.
+
+    Ключ миниатюры - путь, время изменения и размер файла, поэтому
+    изменённый файл получает новую миниатюру. В памяти хранится не больше
+    memory_limit иконок, на диске - не больше disk_limit байт; в обоих
+    случаях первыми вытесняются давно не использованные. Миниатюры строятся
+    в QThreadPool, готовые приходят сигналом ready(путь, QIcon).
+    """
+    ready = pyqtSignal(str, QIcon)
+
+    def __init__(self, cache_dir, memory_limit=512, disk_limit=64 << 20):
+        super().__init__()
+        self.cache_dir = cache_dir
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self._icons = OrderedDict()
+        self._in_flight = set()
+        self._disk_lock = threading.Lock()
+        self._disk_files = OrderedDict()
+        self._disk_size = 0
+        # Порядок вытеснения с диска восстанавливается по времени доступа
+        entries = []
+        for name in os.listdir(cache_dir):
+            if not name.endswith('.png'):
+                continue
+            try:
+                stat = os.stat(os.path.join(cache_dir, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._disk_files[name] = size
+            self._disk_size += size
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.signals = _ThumbnailSignals()
+        self.signals.ready.connect(self._on_ready)
+
+    def icon(self, path):
+        """Возвращает готовую иконку или None; в последнем случае ставит её в очередь"""
+        if thumbnail_kind(path) is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        key = hashlib.sha1(f"{os.path.abspath(path)}\0{stat.st_mtime_ns}\0{stat.st_size}"
+                           .encode('utf-8')).hexdigest()
+        icon = self._icons.get(key)
+        if icon is not None:
+            self._icons.move_to_end(key)
+            return icon
+        if key not in self._in_flight:
+            self._in_flight.add(key)
+            self.pool.start(_ThumbnailJob(self, path, key))
+        return None
+
+    def load_from_disk(self, key):
+        name = key + '.png'
+        with self._disk_lock:
+            if name not in self._disk_files:
+                return QImage()
+            self._disk_files.move_to_end(name)
+        path = os.path.join(self.cache_dir, name)
+        try:
+            os.utime(path)
+        except OSError:
+            return QImage()
+        return QImage(path)
+
+    def save_to_disk(self, key, image):
+        name = key + '.png'
+        path = os.path.join(self.cache_dir, name)
+        tmp_path = path + '.tmp'
+        if not image.save(tmp_path, 'PNG'):
+            return
+        os.replace(tmp_path, path)
+        size = os.path.getsize(path)
+        with self._disk_lock:
+            self._disk_size += size - self._disk_files.pop(name, 0)
+            self._disk_files[name] = size
+            while self._disk_size > self.disk_limit and len(self._disk_files) > 1:
+                old_name, old_size = self._disk_files.popitem(last=False)
+                self._disk_size -= old_size
+                try:
+                    os.remove(os.path.join(self.cache_dir, old_name))
+                except OSError:
+                    pass
+
+    def _on_ready(self, path, key, image):
+        self._in_flight.discard(key)
+        if image.isNull():
+            return
+        # QPixmap можно создавать только в потоке GUI
+        icon = QIcon(QPixmap.fromImage(image))
+        self._icons[key] = icon
+        while len(self._icons) > self.memory_limit:
+            self._icons.popitem(last=False)
+        self.ready.emit(path, icon)
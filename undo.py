@@ -0,0 +1,74 @@
+"""История отмены действий с задачами без зависимостей от Qt."""
+import json
+import sys
+from collections import deque
+
+
+def _encode(changes):
+    return json.dumps(changes, ensure_ascii=False, separators=(',', ':'))
+
+
+class UndoHistory:
+    """Стеки отмены и повтора действий с задачами.
+
+    Запись истории - не копия списка задач, а обратная операция: для каждой
+    затронутой задачи только поля, которые нужно вернуть, вся задача, если
+    её нужно восстановить, или None, если её не должно быть. Запись хранится
+    одной строкой компактного JSON, а суммарный размер строк ограничен
+    budget байтами: самые старые записи вытесняются, последняя остаётся
+    всегда. При отмене записи её обратная операция строится из текущего
+    состояния задач и уходит в стек повтора, и наоборот.
+    """
+
+    def __init__(self, budget=4 << 20):
+        self.budget = budget
+        self._undo = deque()
+        self._redo = deque()
+        self._size = 0
+
+    def record(self, label, changes):
+        """Запоминает действие: changes - пары (id задачи, её состояние до действия)"""
+        for _, text in self._redo:
+            self._size -= sys.getsizeof(text)
+        self._redo.clear()
+        self._push(self._undo, label, changes)
+
+    def undo_label(self):
+        return self._undo[-1][0] if self._undo else None
+
+    def redo_label(self):
+        return self._redo[-1][0] if self._redo else None
+
+    def undo(self, current_state):
+        """Снимает последнее действие: (название, пары (id, состояние)) или None.
+
+        current_state(task_id, state) возвращает обратное к state нынешнее
+        состояние задачи: её поля с теми же именами, что в state, всю задачу
+        при state=None или None, если задачи нет; из него строится запись
+        для повтора.
+        """
+        return self._move(self._undo, self._redo, current_state)
+
+    def redo(self, current_state):
+        """Повторяет отменённое действие; аргумент и результат - как у undo()"""
+        return self._move(self._redo, self._undo, current_state)
+
+    def _move(self, source, target, current_state):
+        if not source:
+            return None
+        label, text = source.pop()
+        self._size -= sys.getsizeof(text)
+        changes = json.loads(text)
+        # Для задачи, которую нужно убрать, запоминается она вся, иначе - те же поля
+        inverse = [(task_id, current_state(task_id, state)) for task_id, state in changes]
+        self._push(target, label, inverse)
+        return label, changes
+
+    def _push(self, stack, label, changes):
+        text = _encode(changes)
+        stack.append((label, text))
+        self._size += sys.getsizeof(text)
+        while self._size > self.budget and len(self._undo) + len(self._redo) > 1:
+            # Сначала вытесняется самое давнее действие, затем самый дальний повтор
+            _, evicted = (self._undo if self._undo else self._redo).popleft()
+            self._size -= sys.getsizeof(evicted)